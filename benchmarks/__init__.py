@@ -0,0 +1 @@
+"""Benchmarks of the GHAS Reviewer App, see `benchmarks/README.md`"""
@@ -0,0 +1,456 @@
+"""Stand-in for the GitHub REST (and GraphQL) API used by the GHAS Reviewer App.
+
+Serves the endpoints `ghasreview.client.Client` calls, under `/api/v3` like GitHub Enterprise
+Server, with configurable latency, error rate and rate limit. Point the app at it with
+`GITHUB_APP_URL=http://127.0.0.1:9001`.
+
+    python -m benchmarks.fake_github --port 9001 --latency 50 --error-rate 0.01
+
+`GET /_bench/stats` returns the calls served so far and `POST /_bench/reset` clears them
+together with all comments and review requests.
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger("FakeGitHub")
+
+# Endpoint templates reported in the stats, in the order they are matched
+ROUTES = [
+    (
+        "POST",
+        r"^/app/installations/[^/]+/access_tokens$",
+        "/app/installations/{installation_id}/access_tokens",
+    ),
+    ("GET", r"^/app$", "/app"),
+    (
+        "GET",
+        r"^/orgs/[^/]+/teams/[^/]+/memberships/[^/]+$",
+        "/orgs/{org}/teams/{team_slug}/memberships/{username}",
+    ),
+    (
+        "GET",
+        r"^/orgs/[^/]+/teams/[^/]+/members$",
+        "/orgs/{org}/teams/{team_slug}/members",
+    ),
+    ("GET", r"^/orgs/[^/]+/teams/[^/]+$", "/orgs/{org}/teams/{team_slug}"),
+    ("POST", r"^/orgs/[^/]+/teams$", "/orgs/{org}/teams"),
+    (
+        "PATCH",
+        r"^/repos/[^/]+/[^/]+/(code-scanning|dependabot|secret-scanning)/alerts/[^/]+$",
+        "/repos/{owner}/{repo}/{type}/alerts/{alert_number}",
+    ),
+    (
+        "GET",
+        r"^/repos/[^/]+/[^/]+/issues/[^/]+/comments$",
+        "/repos/{owner}/{repo}/issues/{issue_number}/comments",
+    ),
+    (
+        "POST",
+        r"^/repos/[^/]+/[^/]+/issues/[^/]+/comments$",
+        "/repos/{owner}/{repo}/issues/{issue_number}/comments",
+    ),
+    (
+        "GET",
+        r"^/repos/[^/]+/[^/]+/pulls/[^/]+/requested_reviewers$",
+        "/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
+    ),
+    (
+        "POST",
+        r"^/repos/[^/]+/[^/]+/pulls/[^/]+/requested_reviewers$",
+        "/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
+    ),
+    ("POST", r"^/graphql$", "/graphql"),
+]
+ROUTES = [
+    (method, re.compile(pattern), template) for method, pattern, template in ROUTES
+]
+
+
+class FakeGitHub:
+    """State and behaviour of the stand-in API, shared by all request threads.
+
+    Keyword Arguments:
+        latency {float} -- Seconds every API response is delayed by (default: {0.05})
+        jitter {float} -- Up to this many seconds are randomly added to the latency (default: {0.02})
+        error_rate {float} -- Share of API calls answered with `502 Bad Gateway` (default: {0})
+        rate_limit {int} -- API calls per installation token and `window`, 0 is unlimited (default: {5000})
+        window {float} -- Seconds after which the rate limit resets (default: {3600})
+        team {str} -- Slug of the security team, created in every organization (default: {"sec"})
+        members {Set[str]} -- Logins of the security team members (default: {{"security-reviewer"}})
+        slug {str} -- Slug of the App, its bot is `{slug}[bot]` (default: {"ghas-reviewer"})
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        error_rate: float = 0.0,
+        rate_limit: int = 5000,
+        window: float = 3600,
+        team: str = "sec",
+        members: Optional[Set[str]] = None,
+        slug: str = "ghas-reviewer",
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.window = window
+        self.team = team
+        self.members = set(members or {"security-reviewer"})
+        self.slug = slug
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.comments: Dict[str, List[Dict]] = defaultdict(list)
+            self.reviewers: Dict[str, Set[str]] = defaultdict(set)
+            self.budgets: Dict[str, Dict] = {}
+            self.calls = Counter()
+            self.statuses = Counter()
+            self.first_call_at: Optional[float] = None
+            self.last_call_at: Optional[float] = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": sum(self.calls.values()),
+                "endpoints": dict(self.calls.most_common()),
+                "statuses": {
+                    str(status): count
+                    for status, count in sorted(self.statuses.items())
+                },
+                "first_call_at": self.first_call_at,
+                "last_call_at": self.last_call_at,
+            }
+
+    def record(self, method: str, endpoint: str, status: int):
+        now = time.time()
+        with self._lock:
+            self.calls[f"{method} {endpoint}"] += 1
+            self.statuses[status] += 1
+            if self.first_call_at is None:
+                self.first_call_at = now
+            self.last_call_at = now
+
+    def spend(self, token: str) -> Tuple[Dict[str, str], bool]:
+        """Count a call against the budget of a token, returns its rate limit headers and whether it is exceeded"""
+        if not self.rate_limit:
+            return {}, False
+        now = time.time()
+        with self._lock:
+            budget = self.budgets.get(token)
+            if budget is None or budget["reset"] <= now:
+                budget = self.budgets[token] = {"used": 0, "reset": now + self.window}
+            budget["used"] += 1
+            used = budget["used"]
+            reset = budget["reset"]
+        headers = {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(self.rate_limit - used, 0)),
+            "X-RateLimit-Used": str(min(used, self.rate_limit)),
+            "X-RateLimit-Reset": str(int(reset)),
+            "X-RateLimit-Resource": "core",
+        }
+        return headers, used > self.rate_limit
+
+    def delay(self):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    api: FakeGitHub = None
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        self.handle_call("GET")
+
+    def do_POST(self):
+        self.handle_call("POST")
+
+    def do_PATCH(self):
+        self.handle_call("PATCH")
+
+    def send_json(self, status: int, body, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_call(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        url = urlparse(self.path)
+
+        if url.path.startswith("/_bench/"):
+            return self.handle_control(method, url.path)
+
+        path = re.sub(r"^/api/v3", "", url.path).rstrip("/")
+        path = re.sub(r"^/api/graphql$", "/graphql", path)
+        route = next(
+            (
+                template
+                for route_method, pattern, template in ROUTES
+                if route_method == method and pattern.match(path)
+            ),
+            None,
+        )
+        if route is None:
+            self.api.record(method, "other", 404)
+            return self.send_json(404, {"message": "Not Found"})
+
+        self.api.delay()
+        headers, exceeded = self.api.spend(
+            self.headers.get("Authorization", "anonymous")
+        )
+        if exceeded:
+            self.api.record(method, route, 403)
+            return self.send_json(403, {"message": "API rate limit exceeded"}, headers)
+        if random.random() < self.api.error_rate:
+            self.api.record(method, route, 502)
+            return self.send_json(502, {"message": "Server Error"}, headers)
+
+        body = json.loads(raw) if raw else {}
+        status, response, extra = self.respond(method, path, url.query, body)
+        self.api.record(method, route, status)
+        headers.update(extra)
+        self.send_json(status, response, headers)
+
+    def handle_control(self, method: str, path: str):
+        if method == "GET" and path == "/_bench/stats":
+            return self.send_json(200, self.api.stats())
+        if method == "POST" and path == "/_bench/reset":
+            self.api.reset()
+            return self.send_json(200, {"status": "reset"})
+        return self.send_json(404, {"message": "Not Found"})
+
+    def respond(self, method: str, path: str, query: str, body: Dict):
+        """Status, body and extra headers of an API call"""
+        api = self.api
+        parts = path.strip("/").split("/")
+
+        if parts[0] == "app" and len(parts) == 1:
+            return 200, {"slug": api.slug, "name": api.slug}, {}
+        if parts[0] == "app":
+            expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+            token = "ghs_" + "".join(
+                random.choices("abcdefghijklmnopqrstuvwxyz0123456789", k=36)
+            )
+            return (
+                201,
+                {
+                    "token": token,
+                    "expires_at": expires_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                },
+                {},
+            )
+
+        if parts[0] == "graphql":
+            return 200, {"data": self.pullRequestState(body.get("variables", {}))}, {}
+
+        if parts[0] == "orgs":
+            if len(parts) == 3:
+                return 201, {"name": body.get("name"), "slug": body.get("name")}, {}
+            team = parts[3]
+            if team != api.team:
+                return 404, {"message": "Not Found"}, {}
+            if len(parts) == 4:
+                return 200, {"name": team, "slug": team}, {}
+            if parts[4] == "members":
+                return 200, [{"login": login} for login in sorted(api.members)], {}
+            if parts[5] in api.members:
+                return 200, {"state": "active", "role": "member"}, {}
+            return 404, {"message": "Not Found"}, {}
+
+        owner, repo, kind, number = parts[1], parts[2], parts[3], parts[-2]
+        if kind in ("code-scanning", "dependabot", "secret-scanning"):
+            return (
+                200,
+                {"number": int(parts[-1]), "state": body.get("state", "open")},
+                {},
+            )
+
+        key = f"{owner}/{repo}#{number}"
+        if kind == "issues" and method == "POST":
+            comment = {
+                "id": random.getrandbits(31),
+                "user": {"login": f"{api.slug}[bot]"},
+                "body": body.get("body", ""),
+                "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            }
+            with api._lock:
+                api.comments[key].append(comment)
+            return 201, comment, {}
+        if kind == "issues":
+            return self.commentsPage(path, key, parse_qs(query))
+
+        if method == "POST":
+            with api._lock:
+                api.reviewers[key].update(body.get("team_reviewers", []))
+            return 201, {"number": int(number)}, {}
+        with api._lock:
+            teams = sorted(api.reviewers[key])
+        return (
+            200,
+            {"users": [], "teams": [{"name": team, "slug": team} for team in teams]},
+            {},
+        )
+
+    def commentsPage(self, path: str, key: str, query: Dict[str, List[str]]):
+        with self.api._lock:
+            comments = list(self.api.comments[key])
+        if "since" in query:
+            comments = [
+                comment
+                for comment in comments
+                if comment["created_at"] >= query["since"][0]
+            ]
+
+        per_page = int(query.get("per_page", ["30"])[0])
+        page = int(query.get("page", ["1"])[0])
+        last = max((len(comments) + per_page - 1) // per_page, 1)
+
+        base = f"http://{self.headers.get('Host')}/api/v3{path}?per_page={per_page}"
+        if "since" in query:
+            base += f"&since={query['since'][0]}"
+        links = []
+        if page < last:
+            links += [
+                f'<{base}&page={page + 1}>; rel="next"',
+                f'<{base}&page={last}>; rel="last"',
+            ]
+        if page > 1:
+            links += [
+                f'<{base}&page={page - 1}>; rel="prev"',
+                f'<{base}&page=1>; rel="first"',
+            ]
+        headers = {"Link": ", ".join(links)} if links else {}
+        return 200, comments[(page - 1) * per_page : page * per_page], headers
+
+    def pullRequestState(self, variables: Dict) -> Dict:
+        key = f"{variables.get('owner')}/{variables.get('repo')}#{variables.get('number')}"
+        with self.api._lock:
+            comments = list(self.api.comments[key])
+            teams = sorted(self.api.reviewers[key])
+        return {
+            "repository": {
+                "pullRequest": {
+                    "comments": {
+                        "nodes": [
+                            {
+                                "author": {
+                                    "login": comment["user"]["login"].removesuffix(
+                                        "[bot]"
+                                    )
+                                }
+                            }
+                            for comment in comments[-100:]
+                        ],
+                        "pageInfo": {"hasPreviousPage": False, "startCursor": None},
+                    },
+                    "reviewRequests": {
+                        "nodes": [
+                            {"requestedReviewer": {"name": team, "slug": team}}
+                            for team in teams
+                        ]
+                    },
+                }
+            }
+        }
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = 0, api: Optional[FakeGitHub] = None
+) -> ThreadingHTTPServer:
+    """Start the stand-in API on a background thread, `server.server_port` is the bound port"""
+    handler = type("Handler", (FakeGitHubHandler,), {"api": api or FakeGitHub()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="fake-github", daemon=True
+    ).start()
+    return server
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser("Fake GitHub API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    addApiArguments(parser)
+    return parser.parse_args(argv)
+
+
+def addApiArguments(parser):
+    parser.add_argument(
+        "--latency", type=float, default=50, help="Milliseconds added to every API call"
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=20,
+        help="Up to this many random milliseconds are added",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Share of API calls failing with 502",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=5000,
+        help="API calls per token and hour, 0 is unlimited",
+    )
+    parser.add_argument("--team", default="sec", help="Slug of the security team")
+    parser.add_argument(
+        "--members",
+        default="security-reviewer",
+        help="Comma separated security team members",
+    )
+
+
+def apiFromArguments(arguments) -> FakeGitHub:
+    return FakeGitHub(
+        latency=arguments.latency / 1000,
+        jitter=arguments.jitter / 1000,
+        error_rate=arguments.error_rate,
+        rate_limit=arguments.rate_limit,
+        team=arguments.team,
+        members=set(arguments.members.split(",")),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    arguments = parseArguments()
+    server = serve(arguments.host, arguments.port, apiFromArguments(arguments))
+    logger.info(
+        f"Serving fake GitHub API on http://{arguments.host}:{server.server_port}"
+    )
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
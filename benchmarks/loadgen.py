@@ -0,0 +1,483 @@
+"""Webhook load generator for the GHAS Reviewer App.
+
+Sends HMAC signed `code_scanning_alert`, `dependabot_alert` and `secret_scanning_alert`
+deliveries from concurrent connections and reports throughput, latency percentiles and,
+with `--api`, the GitHub API calls made per delivery.
+
+    python -m benchmarks.loadgen --url http://127.0.0.1:9000/ --secret s3cret \\
+        --api http://127.0.0.1:9001 --deliveries 1000 --concurrency 16
+
+Latency is the time until the app answered the webhook. With `GITHUB_APP_ASYNC` the app
+answers before processing, the end-to-end throughput then comes from the last API call
+seen by the fake API (see `--settle`).
+"""
+
+import argparse
+import hashlib
+import hmac
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# Share of each kind of delivery in the generated load
+DEFAULT_MIX = "code_scanning_alert.created=6,code_scanning_alert.closed_by_user=2,dependabot_alert.dismissed=1,secret_scanning_alert.resolved=1"
+
+
+class PayloadFactory:
+    """Webhook payloads spread over installations, repositories and Pull Requests.
+
+    Keyword Arguments:
+        installations {int} -- Number of installations (one organization each) (default: {4})
+        repositories {int} -- Repositories per installation (default: {10})
+        pull_requests {int} -- Open Pull Requests per repository (default: {20})
+        members {List[str]} -- Logins of security team members (default: {["security-reviewer"]})
+        member_share {float} -- Share of dismissals made by security team members (default: {0.5})
+    """
+
+    def __init__(
+        self,
+        installations: int = 4,
+        repositories: int = 10,
+        pull_requests: int = 20,
+        members: Optional[List[str]] = None,
+        member_share: float = 0.5,
+    ):
+        self.installations = installations
+        self.repositories = repositories
+        self.pull_requests = pull_requests
+        self.members = members or ["security-reviewer"]
+        self.member_share = member_share
+        self._alert_numbers = iter(range(1, 10**9))
+        self._lock = threading.Lock()
+
+    def alertNumber(self) -> int:
+        with self._lock:
+            return next(self._alert_numbers)
+
+    def dismisser(self) -> Dict:
+        if random.random() < self.member_share:
+            return {"login": random.choice(self.members)}
+        return {"login": f"developer-{random.randint(1, 500)}"}
+
+    def base(self, action: str) -> Dict:
+        installation = random.randint(1, self.installations)
+        repository = f"repository-{random.randint(1, self.repositories)}"
+        owner = f"organization-{installation}"
+        return {
+            "action": action,
+            "installation": {"id": installation},
+            "repository": {
+                "name": repository,
+                "full_name": f"{owner}/{repository}",
+                "owner": {"login": owner},
+            },
+            "organization": {"login": owner},
+        }
+
+    def build(self, event: str, action: str) -> Dict:
+        payload = self.base(action)
+        number = self.alertNumber()
+        if event == "code_scanning_alert":
+            pull_request = random.randint(1, self.pull_requests)
+            payload["ref"] = (
+                f"refs/pull/{pull_request}/merge"
+                if action == "created"
+                else "refs/heads/main"
+            )
+            payload["alert"] = {
+                "number": number,
+                "state": "open" if action == "created" else "dismissed",
+                "tool": {"name": "CodeQL"},
+                "rule": {
+                    "id": "py/sql-injection",
+                    "severity": "error",
+                    "security_severity_level": "critical",
+                },
+                "most_recent_instance": {"ref": payload["ref"]},
+            }
+            if action == "closed_by_user":
+                payload["alert"]["dismissed_by"] = self.dismisser()
+                payload["alert"]["dismissed_reason"] = "false positive"
+                payload["dismissed_comment"] = "Input is validated upstream"
+        elif event == "dependabot_alert":
+            payload["alert"] = {
+                "number": number,
+                "state": "dismissed",
+                "dismissed_by": self.dismisser(),
+                "dismissed_reason": "tolerable_risk",
+                "dependency": {
+                    "package": {"ecosystem": "pip", "name": "requests"},
+                    "manifest_path": "requirements.txt",
+                },
+                "security_advisory": {
+                    "ghsa_id": "GHSA-xxxx-xxxx-xxxx",
+                    "severity": "high",
+                    "summary": "Benchmark advisory",
+                },
+            }
+        elif event == "secret_scanning_alert":
+            payload["alert"] = {
+                "number": number,
+                "state": "resolved",
+                "resolution": "false_positive",
+                "resolved_by": self.dismisser(),
+                "secret_type": "github_personal_access_token",
+            }
+        return payload
+
+
+def parseMix(mix: str) -> List[Tuple[str, str, int]]:
+    """`event.action=weight,...` -> [(event, action, weight), ...]"""
+    kinds = []
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        event, _, action = name.partition(".")
+        kinds.append((event, action, int(weight or 1)))
+    return kinds
+
+
+def signature(secret: bytes, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    index = max(int(round(share * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class LoadGenerator:
+    """Sends deliveries from `concurrency` keep-alive connections
+
+    Arguments:
+        url {str} -- Webhook URL of the app
+        secret {str} -- Webhook secret of the app
+        factory {PayloadFactory} -- Payloads to send
+        mix {List[Tuple[str, str, int]]} -- Events, actions and their weights
+
+    Keyword Arguments:
+        concurrency {int} -- Deliveries in flight at once (default: {8})
+        timeout {float} -- Seconds to wait for a response (default: {60})
+    """
+
+    def __init__(
+        self,
+        url: str,
+        secret: str,
+        factory: PayloadFactory,
+        mix,
+        concurrency: int = 8,
+        timeout: float = 60,
+    ):
+        self.url = urlparse(url)
+        self.secret = secret.encode("utf-8")
+        self.factory = factory
+        self.mix = mix
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connection(self, fresh: bool = False) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None or fresh:
+            if connection is not None:
+                connection.close()
+            connection_class = (
+                http.client.HTTPSConnection
+                if self.url.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            connection = connection_class(
+                self.url.hostname, self.url.port, timeout=self.timeout
+            )
+            self._local.connection = connection
+        return connection
+
+    def send(self, event: str, action: str) -> Dict:
+        body = json.dumps(self.factory.build(event, action)).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "GitHub-Hookshot/benchmark",
+            "X-GitHub-Event": event,
+            "X-GitHub-Delivery": str(uuid.uuid4()),
+            "X-Hub-Signature-256": signature(self.secret, body),
+        }
+        started = time.perf_counter()
+        status = "error"
+        for attempt in range(2):
+            try:
+                connection = self.connection(fresh=attempt > 0)
+                connection.request(
+                    "POST", self.url.path or "/", body=body, headers=headers
+                )
+                response = connection.getresponse()
+                response.read()
+                status = str(response.status)
+                break
+            except (OSError, http.client.HTTPException):
+                # The server may have closed an idle keep-alive connection, retry once on a new one
+                status = "error"
+        return {
+            "kind": f"{event}.{action}",
+            "status": status,
+            "latency": time.perf_counter() - started,
+        }
+
+    def run(self, deliveries: int = 0, duration: float = 0) -> Tuple[List[Dict], float]:
+        """Send `deliveries` deliveries, or as many as possible for `duration` seconds"""
+        kinds = [(event, action) for event, action, _ in self.mix]
+        weights = [weight for _, _, weight in self.mix]
+        results: List[Dict] = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration if duration else None
+        remaining = [deliveries]
+
+        def worker():
+            while True:
+                with lock:
+                    if deadline is None:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    elif time.perf_counter() >= deadline:
+                        return
+                event, action = random.choices(kinds, weights)[0]
+                result = self.send(event, action)
+                with lock:
+                    results.append(result)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="loadgen"
+        ) as executor:
+            for future in [executor.submit(worker) for _ in range(self.concurrency)]:
+                future.result()
+        return results, time.perf_counter() - started
+
+
+class FakeGitHubStats:
+    """Client of the control endpoints of `benchmarks.fake_github`"""
+
+    def __init__(self, url: str):
+        self.url = urlparse(url)
+
+    def call(self, method: str, path: str) -> Dict:
+        connection = http.client.HTTPConnection(
+            self.url.hostname, self.url.port, timeout=10
+        )
+        try:
+            connection.request(method, path)
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+
+    def reset(self):
+        self.call("POST", "/_bench/reset")
+
+    def stats(self) -> Dict:
+        return self.call("GET", "/_bench/stats")
+
+    def settle(self, quiet: float, timeout: float = 300) -> Dict:
+        """Wait until no API call was made for `quiet` seconds, e.g. until queued deliveries are processed"""
+        deadline = time.time() + timeout
+        stats = self.stats()
+        while time.time() < deadline:
+            time.sleep(quiet / 4)
+            current = self.stats()
+            if (
+                current["calls"] == stats["calls"]
+                and time.time() - (current["last_call_at"] or 0) >= quiet
+            ):
+                return current
+            stats = current
+        return stats
+
+
+def buildReport(
+    results: List[Dict], elapsed: float, started_at: float, api: Optional[Dict] = None
+) -> Dict:
+    latencies = sorted(result["latency"] for result in results)
+    by_kind = defaultdict(list)
+    for result in results:
+        by_kind[result["kind"]].append(result["latency"])
+
+    def summary(values: List[float]) -> Dict:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p90_ms": round(percentile(values, 0.90) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            "max_ms": round((values[-1] if values else 0) * 1000, 1),
+        }
+
+    report = {
+        "deliveries": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "statuses": dict(Counter(result["status"] for result in results).most_common()),
+        "latency": summary(latencies),
+        "latency_by_kind": {
+            kind: summary(values) for kind, values in sorted(by_kind.items())
+        },
+    }
+    if api is not None:
+        deliveries = len(results) or 1
+        report["api"] = {
+            "calls": api["calls"],
+            "calls_per_delivery": round(api["calls"] / deliveries, 2),
+            "statuses": api["statuses"],
+            "endpoints": {
+                endpoint: {"calls": calls, "per_delivery": round(calls / deliveries, 3)}
+                for endpoint, calls in api["endpoints"].items()
+            },
+        }
+        if api.get("last_call_at"):
+            # Until the last API call, i.e. until queued deliveries were processed too
+            processed_in = max(api["last_call_at"] - started_at, elapsed)
+            report["api"]["end_to_end_s"] = round(processed_in, 3)
+            report["api"]["end_to_end_throughput_per_s"] = round(
+                len(results) / processed_in, 1
+            )
+    return report
+
+
+def printReport(report: Dict):
+    print(
+        f"Deliveries       {report['deliveries']} in {report['elapsed_s']}s ({report['throughput_per_s']}/s)"
+    )
+    print(
+        f"Responses        {', '.join(f'{status}: {count}' for status, count in report['statuses'].items())}"
+    )
+    print()
+    print(
+        f"{'':40} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    )
+    rows = list(report["latency_by_kind"].items()) + [("all", report["latency"])]
+    for kind, summary in rows:
+        print(
+            f"{kind:40} {summary['count']:>7} {summary['p50_ms']:>9} {summary['p90_ms']:>9} "
+            f"{summary['p99_ms']:>9} {summary['max_ms']:>9}"
+        )
+
+    api = report.get("api")
+    if api:
+        print()
+        print(
+            f"API calls        {api['calls']} ({api['calls_per_delivery']} per delivery)"
+        )
+        print(
+            f"API responses    {', '.join(f'{status}: {count}' for status, count in api['statuses'].items())}"
+        )
+        if "end_to_end_s" in api:
+            print(
+                f"Processed in     {api['end_to_end_s']}s ({api['end_to_end_throughput_per_s']}/s)"
+            )
+        print()
+        for endpoint, calls in api["endpoints"].items():
+            print(f"  {endpoint:90} {calls['calls']:>7} {calls['per_delivery']:>8}")
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser("GHAS Reviewer load generator")
+    parser.add_argument(
+        "--url", default="http://127.0.0.1:9000/", help="Webhook URL of the app"
+    )
+    parser.add_argument("--secret", required=True, help="Webhook secret of the app")
+    parser.add_argument(
+        "--members",
+        default="security-reviewer",
+        help="Comma separated security team members",
+    )
+    addLoadArguments(parser)
+    parser.add_argument(
+        "--api",
+        help="URL of `benchmarks.fake_github` to report the API calls per delivery",
+    )
+    return parser.parse_args(argv)
+
+
+def addLoadArguments(parser):
+    parser.add_argument(
+        "--deliveries", type=int, default=500, help="Deliveries to send"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=0, help="Send for this many seconds instead"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Deliveries in flight at once"
+    )
+    parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        help="Weights of `event.action` kinds of deliveries",
+    )
+    parser.add_argument("--installations", type=int, default=4)
+    parser.add_argument(
+        "--repositories", type=int, default=10, help="Repositories per installation"
+    )
+    parser.add_argument(
+        "--pull-requests", type=int, default=20, help="Pull Requests per repository"
+    )
+    parser.add_argument(
+        "--member-share",
+        type=float,
+        default=0.5,
+        help="Share of dismissals by team members",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=1.0,
+        help="Seconds without API calls once processing is done",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed, for repeatable loads")
+    parser.add_argument(
+        "--json", help="Also write the report to this file, e.g. to compare runs"
+    )
+
+
+def runLoad(arguments, url: str, secret: str, api_url: Optional[str] = None) -> Dict:
+    if arguments.seed is not None:
+        random.seed(arguments.seed)
+    factory = PayloadFactory(
+        installations=arguments.installations,
+        repositories=arguments.repositories,
+        pull_requests=arguments.pull_requests,
+        members=arguments.members.split(","),
+        member_share=arguments.member_share,
+    )
+    generator = LoadGenerator(
+        url, secret, factory, parseMix(arguments.mix), concurrency=arguments.concurrency
+    )
+
+    fake_api = FakeGitHubStats(api_url) if api_url else None
+    if fake_api is not None:
+        fake_api.reset()
+
+    started_at = time.time()
+    results, elapsed = generator.run(
+        deliveries=arguments.deliveries, duration=arguments.duration
+    )
+    api = fake_api.settle(arguments.settle) if fake_api is not None else None
+
+    report = buildReport(results, elapsed, started_at, api)
+    printReport(report)
+    if arguments.json:
+        with open(arguments.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    arguments = parseArguments()
+    runLoad(arguments, arguments.url, arguments.secret, arguments.api)
@@ -0,0 +1,163 @@
+"""Benchmark of the GHAS Reviewer App against the stand-in GitHub API.
+
+Starts `benchmarks.fake_github` in this process, the app in a subprocess pointed at it (with
+gunicorn when it is installed) and sends the load of `benchmarks.loadgen`:
+
+    python -m benchmarks.run --deliveries 1000 --concurrency 16 --latency 50
+    python -m benchmarks.run --workers 4 --async --json results.json
+
+Any `GITHUB_APP_*` / `GITHUB_GHAS_*` variable in the environment is passed on to the app, e.g.
+`GITHUB_GHAS_PR_COALESCE_WINDOW=2` to benchmark with Pull Request notifications coalesced.
+"""
+
+import argparse
+import http.client
+import importlib.util
+import os
+import secrets
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_github import addApiArguments, apiFromArguments, serve
+from benchmarks.loadgen import addLoadArguments, runLoad
+
+# Serves the app with the threaded development server when gunicorn is not installed
+SERVE_APP = """
+import sys
+from ghasreview.app import create_app, config
+create_app(config).run("127.0.0.1", port=int(sys.argv[1]), threaded=True)
+"""
+
+
+def freePort() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def privateKey() -> str:
+    """New RSA key of the App, the stand-in API accepts any JWT"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    ).decode("utf-8")
+
+
+def startApp(arguments, port: int, api_url: str, secret: str) -> subprocess.Popen:
+    environment = dict(os.environ)
+    environment.update(
+        {
+            "GITHUB_APP_URL": api_url,
+            "GITHUB_APP_ID": "1",
+            "GITHUB_APP_KEY": privateKey(),
+            "GITHUB_APP_SECRET": secret,
+            "GITHUB_APP_ENDPOINT": "/",
+            "GITHUB_GHAS_TEAM": arguments.team,
+        }
+    )
+    environment.setdefault("GITHUB_GHAS_SEVERITIES", "critical,high,error,errors")
+    if arguments.use_async:
+        environment["GITHUB_APP_ASYNC"] = "1"
+    if not arguments.verbose:
+        environment.pop("DEBUG", None)
+
+    if importlib.util.find_spec("gunicorn") is not None and not arguments.dev_server:
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "ghasreview.app:app",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--workers",
+            str(arguments.workers),
+            "--threads",
+            str(arguments.threads),
+            "--log-level",
+            "info" if arguments.verbose else "warning",
+        ]
+    else:
+        print("gunicorn is not installed, serving the app with the development server")
+        command = [sys.executable, "-c", SERVE_APP, str(port)]
+
+    output = None if arguments.verbose else subprocess.DEVNULL
+    return subprocess.Popen(command, env=environment, stdout=output, stderr=output)
+
+
+def waitForApp(process: subprocess.Popen, port: int, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise Exception(
+                f"App exited with {process.returncode}, run with --verbose to see why"
+            )
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+        try:
+            connection.request("GET", "/healthcheck")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.25)
+    raise Exception("App did not become healthy in time")
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser("GHAS Reviewer benchmark")
+    parser.add_argument(
+        "--workers", type=int, default=4, help="gunicorn worker processes"
+    )
+    parser.add_argument(
+        "--threads", type=int, default=4, help="gunicorn threads per worker"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Process deliveries asynchronously",
+    )
+    parser.add_argument(
+        "--dev-server",
+        action="store_true",
+        help="Use the development server even with gunicorn",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the output of the app"
+    )
+    # `--team` and `--members` of the stand-in API are used for the payloads too
+    addApiArguments(parser)
+    addLoadArguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    api_server = serve(api=apiFromArguments(arguments))
+    api_url = f"http://127.0.0.1:{api_server.server_port}"
+
+    secret = secrets.token_hex(16)
+    port = freePort()
+    process = startApp(arguments, port, api_url, secret)
+    try:
+        waitForApp(process, port)
+        return runLoad(arguments, f"http://127.0.0.1:{port}/", secret, api_url)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        api_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,36 @@
+import functools
+import hmac
 import logging
-from typing import Dict
-
-from flask import Flask, redirect, current_app, jsonify
-from ghasreview.flask_githubapp import GitHubApp
+from typing import Callable, Dict, Optional
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    redirect,
+    current_app,
+    jsonify,
+    request,
+    send_file,
+)
+from ghasreview.flask_githubapp import (
+    GitHubApp,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+)
 from ghasreview.setup import setup_app
 from ghasreview import __url__
 from ghasreview.client import Client
+from ghasreview.coalesce import Coalescer
+from ghasreview.metrics import observeHook, observeTokenMint, registry as metrics
+from ghasreview.policy import (
+    reviewCodeScanningDismissal,
+    reviewDependabotDismissal,
+    reviewSecretScanningResolution,
+    runPolicy,
+)
+from ghasreview.notified import NotifiedIndex, SQLiteNotifiedIndex, pullRequestKey
 from ghasreview.models import (
     DependabotAlert,
     CodeScanningAlert,
@@ -15,11 +40,57 @@ from ghasreview.models import (
 logger = logging.getLogger("app")
 app = Flask("GHAS Review")
 githubapp = GitHubApp()
+# One `code_scanning_alert.created` event of a burst notifies its Pull Request
+pr_notifications = Coalescer(namespace="pr-notify")
+# Pull Requests already commented on and assigned to the GHAS team
+notified_prs: NotifiedIndex = NotifiedIndex()
 
 
 def create_app(config: Dict):
+    global notified_prs
     app.config.update(**config)
     githubapp.init_app(app)
+    metrics.configure(directory=config.get("GHAS_METRICS_DIR"))
+    if githubapp.cache.shared:
+        Client.configureSharedCache(githubapp.cache)
+    Client.configureCache(
+        size=config.get("GHAS_CACHE_SIZE"),
+        response_bytes=config.get("GHAS_RESPONSE_CACHE_BYTES"),
+        team_ttl=config.get("GHAS_TEAM_CACHE_TTL"),
+        membership_ttl=config.get("GHAS_MEMBERSHIP_CACHE_TTL"),
+    )
+    if config.get("GHAS_BOT_NAME"):
+        Client.setBotUsername(config["GHAS_BOT_NAME"])
+    pr_notifications.window = config.get("GHAS_PR_COALESCE_WINDOW") or 0
+    pr_notifications.backend = githubapp.cache
+    if pr_notifications.window and not githubapp.cache.shared:
+        logger.warning(
+            "PR notifications are only coalesced within each worker process, "
+            "set GITHUB_APP_CACHE_PATH to coalesce them across workers"
+        )
+    if config.get("GHAS_NOTIFIED_PATH"):
+        notified_prs = SQLiteNotifiedIndex(config["GHAS_NOTIFIED_PATH"])
+    Client.configureRetries(
+        retries=config.get("GHAS_API_RETRIES", 3),
+        circuit_threshold=config.get("GHAS_CIRCUIT_THRESHOLD") or 5,
+        circuit_reset_timeout=config.get("GHAS_CIRCUIT_RESET_TIMEOUT") or 30,
+    )
+    Client.configureFanOut(config.get("GHAS_FANOUT_WORKERS", 8))
+    Client.configureTokenRenewal(githubapp.renew_installation_token)
+    Client.configureReopenEngine(
+        config.get("GHAS_REOPEN_BATCHING", False),
+        concurrency=config.get("GHAS_REOPEN_CONCURRENCY") or 8,
+    )
+    # Fanned out calls and re-open batches run on their own threads, each may hold a connection
+    githubapp.reserve_connections(
+        "fanout", Client.fanout_workers if Client.fanout_workers > 1 else 0
+    )
+    if Client.reopen_engine is not None:
+        githubapp.reserve_connections("reopen", Client.reopen_engine.concurrency)
+    Client.configureRoster(
+        config.get("GHAS_TEAM_ROSTER", False),
+        refresh_interval=config.get("GHAS_TEAM_ROSTER_REFRESH"),
+    )
     return app
 
 
@@ -27,74 +98,104 @@ config = setup_app()
 app = create_app(config)
 
 
+# Re-opening dismissed alerts is a security control and overtakes PR notifications
+# in the queue, unless the alert is below the severities the security team reviews
+@githubapp.classifier
+def classifyDelivery(event: str, action: str, payload: Dict) -> Optional[int]:
+    alert = payload.get("alert", {})
+    if event == "code_scanning_alert" and action == "closed_by_user":
+        severities = config.get("GHAS_SEVERITIES")
+        if severities and alert.get("rule", {}).get("severity") not in severities:
+            return PRIORITY_NORMAL
+    elif event == "dependabot_alert" and action == "dismissed":
+        severity = alert.get("security_advisory", {}).get("severity", "")
+        if severity not in ("critical", "high"):
+            return PRIORITY_NORMAL
+    return None
+
+
+@githubapp.observer
+def observe(name: str, duration: float, **labels):
+    if name == "hook":
+        observeHook(labels["event"], labels["action"], duration, labels["outcome"])
+    elif name == "installation_token":
+        observeTokenMint(duration, labels["outcome"])
+
+
+metrics.gauge(
+    "ghas_cache_hit_ratio",
+    "Hit ratio of the lookup caches of this worker",
+    ("cache",),
+    lambda: [
+        ((name,), stats["hit_ratio"]) for name, stats in Client.cacheStats().items()
+    ],
+)
+metrics.gauge(
+    "ghas_queue_depth",
+    "Webhooks waiting in the queue of this worker by priority",
+    ("priority",),
+    lambda: (
+        [
+            ((str(priority),), depth)
+            for priority, depth in githubapp.queue.stats()["depth_by_priority"].items()
+        ]
+        if githubapp.queue is not None
+        else []
+    ),
+)
+metrics.gauge(
+    "ghas_ratelimit_remaining",
+    "Remaining GitHub API rate limit by installation and resource as last seen by this worker",
+    ("installation", "resource"),
+    lambda: [
+        ((key, resource), budget["remaining"])
+        for key, resources in Client.scheduler.budgets().items()
+        for resource, budget in resources.items()
+    ],
+)
+
+
 # Secret Scanning
-@githubapp.on("secret_scanning_alert.resolved")
+@githubapp.on("secret_scanning_alert.resolved", priority=PRIORITY_HIGH)
 def onSecretScanningAlertClose():
     """Secret Scanning Alert Resolved Event"""
     logger.debug("Secret Scanning Alert Resolved by User")
     client = Client(
-        githubapp.installation_client, githubapp.payload["installation"]["id"]
+        githubapp.installation_client,
+        installation_id=githubapp.payload["installation"]["id"],
     )
     alert = SecretScanningAlert()
     alert.payload = githubapp.payload
-
-    # Check if the user is part of the security team
-    if client.isUserPartOfTeam(alert.owner, config.get("GHAS_TEAM"), alert.getUser()):
-        return {"message": "User is part of the security team"}
-
-    # Open Alert back up
-    open_alert = client.reOpenSecretScanningAlert(
-        alert.owner, alert.repository, alert.id
-    )
-
-    if open_alert.status_code != 200:
-        logger.warning(f"Unable to re-open alert")
-        return
-    return {"message": "Secret Scanning Alert Reopened"}
+    return runPolicy(reviewSecretScanningResolution(client, alert, config))
 
 
 # Dependabot
-@githubapp.on("dependabot_alert.dismissed")
+@githubapp.on("dependabot_alert.dismissed", priority=PRIORITY_HIGH)
 def onDependabotAlertDismiss():
     """Dependabot Alert Dismissed Event"""
     logger.debug("Dependabot Alert Dismissed by User")
     client = Client(
-        githubapp.installation_client, githubapp.payload["installation"]["id"]
+        githubapp.installation_client,
+        installation_id=githubapp.payload["installation"]["id"],
     )
     alert = DependabotAlert()
     alert.payload = githubapp.payload
-
-    # Check if the user is part of the security team
-    if client.isUserPartOfTeam(alert.owner, config.get("GHAS_TEAM"), alert.getUser()):
-        return {"message": "User is part of the security team"}
-
-    # Open Alert back up
-    open_alert = client.reOpenDependabotAlert(alert.owner, alert.repository, alert.id)
-    if open_alert.status_code != 200:
-        logger.warning(f"Unable to re-open alert")
-        return
-    return {"message": "Dependabot Alert Reopened"}
+    return runPolicy(reviewDependabotDismissal(client, alert, config))
 
 
 # Code Scanning
 # https://docs.github.com/en/developers/webhooks-and-events/webhooks/webhook-events-and-payloads#code_scanning_alert
-@githubapp.on("code_scanning_alert.created")
+@githubapp.on("code_scanning_alert.created", priority=PRIORITY_LOW)
 def onCodeScanningAlertCreation():
     """Code Scanning Alert event
     https://docs.github.com/en/developers/webhooks-and-events/webhooks/webhook-events-and-payloads#code_scanning_alert
     """
     alert = CodeScanningAlert()
     alert.payload = githubapp.payload
-    alert.client = Client(
-        githubapp.installation_client,
-        githubapp.app_client,
-        githubapp.payload["installation"]["id"],
-    )
-    alert.ghas_team_name = config.get("GHAS_TEAM")
 
     # Check if in a PR
     if not alert.isPR():
-        logger.debug(f"Alert is not in a Pull Request, ignoring")
+        logger.debug("Alert is not in a Pull Request, ignoring")
         return {"message": "Alert is not in a Pull Request. Not doing anything."}
 
     logger.debug(f"Alert Opened :: {alert.id} ({alert.ref})")
@@ -112,89 +213,104 @@ def onCodeScanningAlertCreation():
         )
         return {"message": "Severity is not high enough to get security involved"}
 
-    # Currently, comment creating a very easy versus adding team to PR
-    if not alert.hasCommentedInPR():
-        alert.createCommentOnPR()
-        alert.addTeamToPullRequest()
+    if (
+        pullRequestKey(alert.owner, alert.repository, alert.pullRequest())
+        in notified_prs
+    ):
+        logger.debug(f"Pull Request already notified :: {alert.pullRequest()}")
+        return {"message": "Pull Request already notified"}
+
+    alert.client = Client(
+        githubapp.installation_client,
+        githubapp.app_client,
+        githubapp.payload["installation"]["id"],
+    )
+    alert.ghas_team_name = config.get("GHAS_TEAM")
+    alert.pr_backend = config.get("GHAS_PR_BACKEND") or "rest"
+
+    if not pr_notifications.window:
+        notifyPullRequest(alert)
+        return {"message": "Code Scanning create alert in PR handled"}
+
+    # The first alert of a burst claims the PR for the window, in all workers
+    key = pullRequestKey(alert.owner, alert.repository, alert.pullRequest())
+    if not pr_notifications.claim(key):
+        return {"message": "Pull Request is notified by another alert"}
+    notified = False
+    try:
+        notified = notifyPullRequest(alert)
+    finally:
+        if not notified:
+            pr_notifications.release(key)
     return {"message": "Code Scanning create alert in PR handled"}
 
 
-@githubapp.on("code_scanning_alert.closed_by_user")
+def notifyPullRequest(alert: CodeScanningAlert) -> bool:
+    """Comment on and request review for a Pull Request, returns True once it is notified"""
+    logger.debug(
+        f"Notifying PR :: {alert.owner}/{alert.repository}#{alert.pullRequest()}"
+    )
+    if not alert.notifyPullRequest():
+        return False
+    notified_prs.add(pullRequestKey(alert.owner, alert.repository, alert.pullRequest()))
+    return True
+
+
+@githubapp.on("code_scanning_alert.closed_by_user", priority=PRIORITY_HIGH)
 def onCodeScanningAlertClose():
     """Code Scanning Alert Close Event"""
     alert = CodeScanningAlert()
     alert.payload = githubapp.payload
     alert.client = Client(
-        githubapp.installation_client, githubapp.payload["installation"]["id"]
-    )
-
-    logger.info(
-        f"Processing Alert :: {alert.owner}/{alert.repository} => {alert.id} ({alert.ref})"
+        githubapp.installation_client,
+        installation_id=githubapp.payload["installation"]["id"],
     )
-
-    # Check if comment in alert
-    if current_app.config.get("GHAS_COMMENT_REQUIRED") and not alert.hasDismissedComment():
-        logger.debug(f"Comment required, reopeneing alert: {alert.id}")
-
-        open_alert = alert.client.reOpenCodeScanningAlert(
-            alert.owner, alert.repository, alert.id,
+    return runPolicy(reviewCodeScanningDismissal(alert.client, alert, config))
+
+
+# Pull Requests
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads#pull_request
+@githubapp.on("pull_request.closed", priority=PRIORITY_LOW)
+def onPullRequestClose():
+    """Pull Request Closed Event, forgets that the Pull Request was notified"""
+    payload = githubapp.payload
+    repository = payload.get("repository", {})
+    notified_prs.remove(
+        pullRequestKey(
+            repository.get("owner", {}).get("login", ""),
+            repository.get("name", ""),
+            payload.get("number") or payload.get("pull_request", {}).get("number", 0),
         )
-        if open_alert.status_code != 200:
-            logger.error(f"Unable to re-open alert :: {alert.id}")
-            logger.error("This might be a permissions issue, please check the documentation for more details")
-            return {"message": "Unable to re-open alert"}
-        return {
-            "message": "Comment required, re-opening alert"
-        }
-
-    # Check tool and severity
-    tool = current_app.config.get("GHAS_TOOL")
-    if tool and alert.tool != tool:
-        logger.debug(f"Tool is not in the list of approved tools: {alert.tool}")
-        return {"message": "Tool is not in the list of approved tools"}
-
-    # Severity check, if not high enough, do not involve security team
-    severities = current_app.config.get("GHAS_SEVERITIES")
-    if severities:
-        if alert.severity not in severities:
-            logger.debug(
-                f"Severity is not high enough to get security involved: {alert.severity}"
-            )
-            return {"message": "Severity is not high enough to get security involved, doing nothing."}
-        if alert.payload.get("alert", {}).get("rule", {}).get("security_severity_level", "") not in severities:
-            logger.debug(
-                f"Security severity level is not high enough to get security involved: {alert.payload.get('alert', {}).get('rule', {}).get('security_severity_level', '')}"
-            )
-            return {"message": "Security severity level is not high enough to get security involved, doing nothing."}
-    else:
-        logger.debug("No severities provided, reopening all findings")
-
-    # Check team exists
-    if not alert.client.checkIfTeamExists(alert.owner, config.get("GHAS_TEAM")):
-        logger.info(f"GHAS Reviewer Team `{config.get('GHAS_TEAM')}` does not exist, creating team.")
-        alert.client.createTeam(alert.owner, config.get("GHAS_TEAM"))
-
-    # check if the user is part of the security team
-    if alert.client.isUserPartOfTeam(alert.owner, config.get("GHAS_TEAM"), alert.getUser()):
-        logger.debug(f"User is part of security team, no action taken.")
-        return {"message": "User is part of the security team"}
-
-    logger.info(f"User is not allowed to close alerts: {alert.getUser()} ({alert.owner}/{alert.repository} => {alert.id})")
-
-    # Open Alert back up
-    open_alert = alert.client.reOpenCodeScanningAlert(
-        alert.owner, alert.repository, alert.id,
     )
-
-    if open_alert.status_code != 200:
-        logger.error(f"Unable to re-open alert :: {alert.id}")
-        logger.error("This might be a permissions issue, please check the documentation for more details")
-        return {"message": "Unable to re-open alert"}
-
-    if alert.isPR():
-        logger.debug(f"In PR request")
-
-    return {"message": "Code Scanning Alert Reopened"}
+    return {"message": "Pull Request removed from notified index"}
+
+
+# Teams
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads#membership
+@githubapp.on("membership")
+def onMembershipChange():
+    """Team Membership Event, drops cached membership of the user"""
+    payload = githubapp.payload
+    owner = payload.get("organization", {}).get("login", "")
+    user = payload.get("member", {}).get("login")
+    team = payload.get("team", {})
+    for team_name in {team.get("slug"), team.get("name")}:
+        if team_name:
+            Client.invalidateTeamCache(owner, team_name, user)
+            if payload.get("action") in ("added", "removed"):
+                Client.updateRoster(
+                    owner, team_name, user, payload["action"] == "added"
+                )
+    return {"message": "Team membership cache invalidated"}
+
+
+# https://docs.github.com/en/webhooks/webhook-events-and-payloads#team
+@githubapp.on("team")
+def onTeamChange():
+    """Team Event, drops all cached teams and memberships of the organization"""
+    owner = githubapp.payload.get("organization", {}).get("login", "")
+    Client.invalidateTeamCache(owner)
+    return {"message": "Team cache invalidated"}
 
 
 @app.errorhandler(500)
@@ -208,11 +324,78 @@ def page_not_found(error):
 
 @app.route("/", methods=["GET"])
 def index():
-    logger.info(f"Redirecting user to url...")
+    logger.info("Redirecting user to url...")
     return redirect(__url__)
 
 
 @app.route("/healthcheck", methods=["GET"])
 def healthcheck():
     logger.debug("Healthcheck status")
-    return jsonify({"status": "healthy"})
+    status = {"status": "healthy"}
+    if githubapp.queue is not None:
+        status["queue"] = githubapp.queue.stats()
+    if Client.reopen_engine is not None:
+        status["reopen"] = Client.reopen_engine.stats()
+    status["ratelimit"] = Client.scheduler.budgets()
+    status["cache"] = Client.cacheStats()
+    status["circuits"] = {
+        host: breaker.toDict() for host, breaker in Client.breakers.items()
+    }
+    return jsonify(status)
+
+
+def opsToken(required: bool = False) -> Callable:
+    """Serve the route only to requests authorized by `Bearer <GHAS_OPS_TOKEN>`.
+
+    Without a configured token, `required` routes are not served at all and the others are open.
+    """
+
+    def decorator(route: Callable) -> Callable:
+        @functools.wraps(route)
+        def wrapper(*args, **kwargs):
+            token = current_app.config.get("GHAS_OPS_TOKEN")
+            if not token:
+                if required:
+                    abort(404)
+                return route(*args, **kwargs)
+            authorization = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(
+                authorization.encode(), f"Bearer {token}".encode()
+            ):
+                logger.warning(f"Unauthorized request :: {request.path}")
+                abort(401)
+            return route(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@app.route("/metrics", methods=["GET"])
+@opsToken()
+def prometheusMetrics():
+    return Response(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# Reports hold the call stacks and API calls of webhooks, never served without a token
+@app.route("/profiles", methods=["GET"])
+@opsToken(required=True)
+def profiles():
+    if githubapp.profiler is None:
+        abort(404)
+    return jsonify({"profiles": githubapp.profiler.reports()})
+
+
+@app.route("/profiles/<name>", methods=["GET"])
+@opsToken(required=True)
+def profile(name: str):
+    path = (
+        githubapp.profiler.report_path(name) if githubapp.profiler is not None else None
+    )
+    if path is None:
+        abort(404)
+    return send_file(
+        path, mimetype="application/json", as_attachment=True, download_name=name
+    )
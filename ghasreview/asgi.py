@@ -0,0 +1,82 @@
+"""ASGI entry point, serves the same app as `ghasreview.app:app` on an event loop.
+
+    uvicorn ghasreview.asgi:app --host 0.0.0.0 --port 9000
+
+When `httpx` is installed the alert dismissal handlers below replace their synchronous
+versions and wait on the GitHub API without holding a thread. They run the same dismissal
+policies as the synchronous handlers, with an `AsyncClient`. All other hooks (and all
+hooks without `httpx`) run the handlers of `ghasreview.app` on a thread pool.
+"""
+
+import asyncio
+import logging
+
+from ghasreview.app import app as flask_app, config, githubapp
+from ghasreview.async_client import AsyncClient
+from ghasreview.flask_githubapp import GitHubAppASGI
+from ghasreview.policy import (
+    reviewCodeScanningDismissal,
+    reviewDependabotDismissal,
+    reviewSecretScanningResolution,
+    runPolicyAsync,
+)
+from ghasreview.models import (
+    DependabotAlert,
+    CodeScanningAlert,
+    SecretScanningAlert,
+)
+
+logger = logging.getLogger("app")
+
+with flask_app.app_context():
+    base_url = githubapp.client.session.base_url
+
+
+async def getClient() -> AsyncClient:
+    installation_id = githubapp.payload["installation"]["id"]
+    # Usually answered from the token cache, minting a token blocks
+    token = await asyncio.get_running_loop().run_in_executor(
+        None, githubapp.get_installation_token, installation_id
+    )
+    return AsyncClient(base_url, token.token, installation_id)
+
+
+if AsyncClient.isAvailable():
+
+    @githubapp.on("secret_scanning_alert.resolved")
+    async def onSecretScanningAlertCloseAsync():
+        """Secret Scanning Alert Resolved Event"""
+        logger.debug("Secret Scanning Alert Resolved by User")
+        client = await getClient()
+        alert = SecretScanningAlert()
+        alert.payload = githubapp.payload
+        return await runPolicyAsync(
+            reviewSecretScanningResolution(client, alert, config)
+        )
+
+    @githubapp.on("dependabot_alert.dismissed")
+    async def onDependabotAlertDismissAsync():
+        """Dependabot Alert Dismissed Event"""
+        logger.debug("Dependabot Alert Dismissed by User")
+        client = await getClient()
+        alert = DependabotAlert()
+        alert.payload = githubapp.payload
+        return await runPolicyAsync(reviewDependabotDismissal(client, alert, config))
+
+    @githubapp.on("code_scanning_alert.closed_by_user")
+    async def onCodeScanningAlertCloseAsync():
+        """Code Scanning Alert Close Event"""
+        client = await getClient()
+        alert = CodeScanningAlert()
+        alert.payload = githubapp.payload
+        return await runPolicyAsync(reviewCodeScanningDismissal(client, alert, config))
+
+else:
+    logger.info("httpx is not installed, all hooks run on the thread pool")
+
+
+app = GitHubAppASGI(
+    githubapp,
+    threads=config.get("GHAS_ASGI_THREADS") or 32,
+    on_shutdown=[AsyncClient.close],
+)
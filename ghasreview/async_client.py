@@ -0,0 +1,289 @@
+from typing import Any, Dict, Optional, Set, Tuple
+import asyncio
+import functools
+import logging
+import time
+
+try:
+    import httpx
+except ImportError:  # Only needed for the coroutine handlers of the ASGI entry point
+    httpx = None
+
+from ghasreview.client import Client
+from ghasreview.metrics import observeApiCall
+from ghasreview.ratelimit import PRIORITY_CRITICAL, PRIORITY_NORMAL, resourceFor
+
+logger = logging.getLogger("AsyncGitHubClient")
+
+
+class AsyncClient:
+    """Non-blocking counterpart of `Client` for the coroutine handlers in `ghasreview.asgi`.
+
+    Uses one `httpx.AsyncClient` (and so one connection pool) per process and shares the team
+    and membership caches, the team rosters, the rate limit scheduler, the retry policy and the
+    circuit breakers of `Client`. Only the calls needed to check a dismissal and re-open an alert
+    are provided. Calls into the shared SQLite cache run on the thread pool of the event loop.
+    """
+
+    http: Optional[Any] = None
+    pool_size: int = 100
+    timeout: float = 30
+
+    def __init__(self, base_url: str, token: str, installation_id: int = 0):
+        self.base_url = base_url.rstrip("/")
+        self.installation_id = installation_id
+        self.token = token
+        self.headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"token {token}",
+        }
+
+    @staticmethod
+    def isAvailable() -> bool:
+        return httpx is not None
+
+    @classmethod
+    def getHttpClient(cls):
+        if cls.http is None or cls.http.is_closed:
+            cls.http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=cls.pool_size,
+                    max_keepalive_connections=cls.pool_size,
+                ),
+                timeout=cls.timeout,
+            )
+        return cls.http
+
+    @classmethod
+    async def close(cls):
+        if cls.http is not None:
+            await cls.http.aclose()
+            cls.http = None
+
+    def getInstallationId(self) -> int:
+        return self.installation_id
+
+    def getBaseUrl(self) -> str:
+        return self.base_url
+
+    async def callApi(
+        self,
+        method: str,
+        url: str,
+        json: Optional[Dict] = None,
+        priority: int = PRIORITY_NORMAL,
+        idempotent: bool = False,
+    ):
+        """Make an API call once the rate limit allows it, retried like `Client.callApi`"""
+        key = self.installation_id
+        breaker = Client.getCircuitBreaker(url)
+        resource = resourceFor(url)
+        retry_policy = Client.retry_policy
+
+        attempt = 0
+        renewed = False
+        while True:
+            trial = breaker.before()
+            try:
+                await Client.scheduler.acquireAsync(key, priority, resource)
+                started = time.monotonic()
+                try:
+                    response = await self.getHttpClient().request(
+                        method, url, json=json, headers=self.headers
+                    )
+                except httpx.HTTPError as e:
+                    observeApiCall(method, url, time.monotonic() - started, "error")
+                    breaker.failure()
+                    if attempt >= retry_policy.retries or not retry_policy.shouldRetry(
+                        method, error=e, idempotent=idempotent
+                    ):
+                        raise
+                    logger.warning(f"API call failed, retrying :: {method} {url} - {e}")
+                else:
+                    observeApiCall(
+                        method,
+                        url,
+                        time.monotonic() - started,
+                        str(response.status_code),
+                    )
+                    Client.scheduler.update(key, response, resource)
+                    if response.status_code >= 500:
+                        breaker.failure()
+                    else:
+                        breaker.success()
+                    if (
+                        response.status_code == 401
+                        and not renewed
+                        and await self.renewToken()
+                    ):
+                        renewed = True
+                        continue
+                    if attempt >= retry_policy.retries or not retry_policy.shouldRetry(
+                        method, response=response, idempotent=idempotent
+                    ):
+                        return response
+                    logger.warning(
+                        f"API call failed, retrying :: {method} {url} - {response.status_code}"
+                    )
+            finally:
+                if trial:
+                    breaker.release()
+
+            await asyncio.sleep(retry_policy.backoff(attempt))
+            attempt += 1
+
+    async def renewToken(self) -> bool:
+        """Swap the installation token GitHub rejected for a new one, see `Client.renewToken`"""
+        if Client.renew_token is None or not self.installation_id:
+            return False
+        try:
+            # Minting a token blocks
+            token = await asyncio.get_running_loop().run_in_executor(
+                None, Client.renew_token, self.installation_id, self.token
+            )
+        except Exception as e:
+            logger.warning(
+                f"Failed to renew installation token :: {self.installation_id} - {e}"
+            )
+            return False
+        self.token = token.token
+        self.headers["Authorization"] = f"token {token.token}"
+        return True
+
+    @staticmethod
+    async def runBlocking(func, *args):
+        """Call `func` on the thread pool of the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(func, *args)
+        )
+
+    @classmethod
+    async def runCache(cls, func, *args):
+        """Call a team cache method, off the event loop when the cache is the shared SQLite database"""
+        if Client.shared_cache is None:
+            return func(*args)
+        return await cls.runBlocking(func, *args)
+
+    async def checkIfTeamExists(self, owner: str, team_name: str) -> bool:
+        key = (owner.lower(), team_name.lower())
+        exists = await self.runCache(Client.team_cache.get, key)
+        if exists is not None:
+            return exists
+
+        team = await self.callApi(
+            "GET",
+            f"{self.base_url}/orgs/{owner}/teams/{team_name}",
+            priority=PRIORITY_CRITICAL,
+        )
+        if team.status_code in (200, 404):
+            await self.runCache(Client.team_cache.set, key, team.status_code == 200)
+        if team.status_code != 200:
+            logger.debug(f"Team does not exist :: {team_name} - {team.status_code}")
+            return False
+        return True
+
+    async def getTeamMembers(self, owner: str, team_name: str) -> Optional[Set[str]]:
+        # https://docs.github.com/en/rest/teams/members#list-team-members
+        members: Set[str] = set()
+        url = f"{self.base_url}/orgs/{owner}/teams/{team_name}/members?per_page=100"
+        while url:
+            response = await self.callApi("GET", url, priority=PRIORITY_CRITICAL)
+            if response.status_code != 200:
+                logger.warning(
+                    f"Failed to list team members :: {team_name} ({response.status_code})"
+                )
+                return None
+            members.update(member["login"] for member in response.json())
+            url = response.links.get("next", {}).get("url")
+        return members
+
+    async def isTeamMember(self, owner_name: str, team_name: str, user: str) -> bool:
+        """Membership of `user`, False if the team does not exist"""
+        if Client.roster_mode:
+            loop = asyncio.get_running_loop()
+
+            def fetch() -> Optional[Set[str]]:
+                # Called on a thread, by the store or its background refresh
+                return asyncio.run_coroutine_threadsafe(
+                    self.getTeamMembers(owner_name, team_name), loop
+                ).result()
+
+            roster = await self.runBlocking(
+                Client.rosters.get, (owner_name.lower(), team_name.lower()), fetch
+            )
+            if roster is not None:
+                return user in roster
+            logger.warning(
+                f"Team roster unavailable, checking membership :: {team_name}"
+            )
+
+        key = (owner_name.lower(), team_name.lower(), (user or "").lower())
+        is_member = await self.runCache(Client.membership_cache.get, key)
+        if is_member is not None:
+            logger.debug(f"Team membership cache hit :: {user} ({is_member})")
+            return is_member
+
+        membership_res = await self.callApi(
+            "GET",
+            f"{self.base_url}/orgs/{owner_name}/teams/{team_name}/memberships/{user}",
+            priority=PRIORITY_CRITICAL,
+        )
+        # Only definitive answers are cached, errors are retried on the next event
+        if membership_res.status_code in (200, 404):
+            await self.runCache(
+                Client.membership_cache.set, key, membership_res.status_code == 200
+            )
+        return membership_res.status_code == 200
+
+    async def checkTeamMembership(
+        self, owner_name: str, team_name: str, user: str
+    ) -> Tuple[bool, bool]:
+        """Whether the team exists and `user` is a member of it"""
+        team_exists, is_member = await asyncio.gather(
+            self.checkIfTeamExists(owner_name, team_name),
+            self.isTeamMember(owner_name, team_name, user),
+        )
+        return team_exists, is_member
+
+    async def isUserPartOfTeam(
+        self, owner_name: str, team_name: str, user: str
+    ) -> bool:
+        team_exists, is_member = await self.checkTeamMembership(
+            owner_name, team_name, user
+        )
+        if not team_exists:
+            logger.error(f"Team does not exist :: {team_name}")
+            return False
+        return is_member
+
+    async def createTeam(self, owner: str, team_name: str) -> bool:
+        # https://docs.github.com/en/rest/reference/teams#create-a-team
+        team_creation = await self.callApi(
+            "POST",
+            f"{self.base_url}/orgs/{owner}/teams",
+            {"name": team_name, "description": "GitHub Advanced Security Reviewers"},
+        )
+        await self.runCache(Client.invalidateTeamCache, owner, team_name)
+        # GitHub answers 201 Created
+        if team_creation.status_code not in (200, 201):
+            logger.warning(f"Failed to create team :: {team_name} in {owner}")
+            return False
+        logger.debug(f"Created team for org :: {owner}")
+        return True
+
+    async def reOpenAlert(self, owner: str, repo: str, type: str, alert_id: int):
+        return await self.callApi(
+            "PATCH",
+            f"{self.base_url}/repos/{owner}/{repo}/{type}/alerts/{alert_id}",
+            {"state": "open"},
+            priority=PRIORITY_CRITICAL,
+        )
+
+    async def reOpenSecretScanningAlert(self, owner: str, repo: str, alert_id: int):
+        return await self.reOpenAlert(owner, repo, "secret-scanning", alert_id)
+
+    async def reOpenDependabotAlert(self, owner: str, repo: str, alert_id: int):
+        return await self.reOpenAlert(owner, repo, "dependabot", alert_id)
+
+    async def reOpenCodeScanningAlert(self, owner: str, repo: str, alert_id: int):
+        return await self.reOpenAlert(owner, repo, "code-scanning", alert_id)
@@ -0,0 +1,240 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import json
+import threading
+import time
+import logging
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger("Cache")
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe, bounded LRU cache where every entry expires after `ttl` seconds"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: Optional[int] = None, ttl: Optional[float] = None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] < time.monotonic():
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            self._evict()
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Remove all entries, or only the entries whose key matches"""
+        with self._lock:
+            if match is None:
+                count = len(self._data)
+                self._data.clear()
+                return count
+            keys = [key for key in self._data if match(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _evict(self):
+        while len(self._data) > max(self.maxsize, 0):
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+class SharedTTLCache(TTLCache):
+    """`TTLCache` keeping its entries in a cache backend shared by all worker processes
+    (see `GitHubApp.cache`), hits and misses are counted per process.
+
+    Keys are tuples of strings, values must be JSON serializable.
+    """
+
+    def __init__(
+        self, backend: Any, namespace: str, maxsize: int = 1024, ttl: float = 300
+    ):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.backend = backend
+        self.prefix = f"{namespace}:"
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self.backend.get(self._key(key), _MISSING)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if self.maxsize <= 0:
+            return
+        self.backend.set(self._key(key), value, ttl=self.ttl if ttl is None else ttl)
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> int:
+        count = 0
+        for stored in self.backend.keys(self.prefix):
+            key = json.loads(stored[len(self.prefix) :])
+            if match is None or match(tuple(key) if isinstance(key, list) else key):
+                self.backend.delete(stored)
+                count += 1
+        return count
+
+    def __len__(self) -> int:
+        return len(self.backend.keys(self.prefix))
+
+    def _evict(self):
+        # Bounded by the backend
+        pass
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats["entries"] = len(self)
+        return stats
+
+
+class CachedResponse:
+    def __init__(self, response: Any):
+        self.url = response.url
+        self.status_code = response.status_code
+        self.headers = dict(response.headers)
+        self.content = response.content
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+
+    def conditionalHeaders(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def toResponse(self) -> requests.Response:
+        response = requests.Response()
+        response.url = self.url
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.encoding = "utf-8"
+        return response
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of GET responses carrying an ETag or Last-Modified header,
+    bounded by number of entries and total body size.
+
+    Used for conditional requests, a `304 Not Modified` is answered from the cache.
+    """
+
+    def __init__(self, maxsize: int = 1024, maxbytes: int = 16 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, maxsize: Optional[int] = None, maxbytes: Optional[int] = None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if maxbytes is not None:
+                self.maxbytes = maxbytes
+            self._evict()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def store(self, key: Hashable, response: Any):
+        if (
+            self.maxbytes <= 0
+            or response.status_code != 200
+            or not (
+                response.headers.get("ETag") or response.headers.get("Last-Modified")
+            )
+        ):
+            return
+        entry = CachedResponse(response)
+        if len(entry.content) > self.maxbytes:
+            return
+        with self._lock:
+            previous = self._data.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.content)
+            self._data[key] = entry
+            self._bytes += len(entry.content)
+            self._evict()
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    def _evict(self):
+        while self._data and (
+            len(self._data) > self.maxsize or self._bytes > self.maxbytes
+        ):
+            _, entry = self._data.popitem(last=False)
+            self._bytes -= len(entry.content)
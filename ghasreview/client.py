@@ -1,5 +1,29 @@
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+import contextvars
 import logging
+import os
+import threading
+import time
+
+import requests
+
+from ghasreview.cache import ResponseCache, SharedTTLCache, TTLCache
+from ghasreview.flask_githubapp.profiling import annotate
+from ghasreview.flask_githubapp.tracing import SPAN_KIND_CLIENT, current_span, traced
+from ghasreview.metrics import endpointTemplate, observeApiCall
+from ghasreview.ratelimit import (
+    PRIORITY_CRITICAL,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    RateLimitScheduler,
+    resourceFor,
+)
+from ghasreview.reopen import ReopenEngine
+from ghasreview.retry import CircuitBreaker, RetryPolicy
+from ghasreview.roster import RosterStore
 
 logger = logging.getLogger("GitHubClient")
 
@@ -9,6 +33,50 @@ class Client:
     app_client: object = None
     installation_id: int = 0
 
+    # Shared across requests: (org, team) -> exists, (org, team, user) -> is member
+    team_cache: TTLCache = TTLCache(ttl=600)
+    membership_cache: TTLCache = TTLCache(ttl=300)
+
+    # Roster mode answers membership checks from a prefetched list of team members
+    roster_mode: bool = False
+    rosters: RosterStore = RosterStore()
+
+    # The app slug never changes while the process runs
+    bot_username: Optional[str] = None
+    _bot_username_lock = threading.Lock()
+
+    # Cache shared by all worker processes of a node, see `configureSharedCache`
+    shared_cache: Optional[Any] = None
+
+    # Bodies of GET responses, revalidated with conditional requests
+    response_cache: ResponseCache = ResponseCache()
+
+    # (owner, repo, pull) -> time of the last comment scan that did not find the bot
+    comment_scans: TTLCache = TTLCache(ttl=3600)
+
+    # Paces every API call by the rate limit budget of its installation
+    scheduler: RateLimitScheduler = RateLimitScheduler()
+
+    # Retries failed calls and stops calling hosts that keep failing
+    retry_policy: RetryPolicy = RetryPolicy()
+    circuit_threshold: int = 5
+    circuit_reset_timeout: float = 30
+    breakers: Dict[str, CircuitBreaker] = {}
+    _breakers_lock = threading.Lock()
+
+    # Mints a new installation token for one GitHub rejected, see `configureTokenRenewal`
+    renew_token: Optional[Callable[[int, str], Any]] = None
+
+    # Optional engine batching re-opens across concurrent requests
+    reopen_engine: Optional[ReopenEngine] = None
+
+    # Runs the independent calls of a handler concurrently, see `fanOut`
+    fanout_workers: int = 8
+    _fanout_executor: Optional[ThreadPoolExecutor] = None
+    _fanout_pid: Optional[int] = None
+    _fanout_lock = threading.Lock()
+    _fanout_local = threading.local()
+
     def __init__(
         self, installation_client, app_client: object = None, installation_id: int = 0
     ):
@@ -19,35 +87,400 @@ class Client:
     def getInstallationId(self) -> int:
         return self.installation_id
 
-    def isUserPartOfTeam(self, owner_name: str, team_name: str, user: str) -> bool:
+    @classmethod
+    def configureRetries(
+        cls,
+        retries: int = 3,
+        circuit_threshold: int = 5,
+        circuit_reset_timeout: float = 30,
+    ):
+        cls.retry_policy = RetryPolicy(retries=retries)
+        cls.circuit_threshold = circuit_threshold
+        cls.circuit_reset_timeout = circuit_reset_timeout
+        with cls._breakers_lock:
+            cls.breakers = {}
 
-        team = self.callApi(
-            "GET",
-            f"{self.installation_client.session.base_url}/orgs/{owner_name}/teams/{team_name}",
+    @classmethod
+    def configureTokenRenewal(cls, renew: Optional[Callable[[int, str], Any]]):
+        """Called with the installation ID and the rejected token when a call is answered
+        `401 Unauthorized`, returns the `InstallationToken` the call is sent again with once
+        """
+        cls.renew_token = renew
+
+    @classmethod
+    def getCircuitBreaker(cls, url: str) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        with cls._breakers_lock:
+            if host not in cls.breakers:
+                cls.breakers[host] = CircuitBreaker(
+                    host, cls.circuit_threshold, cls.circuit_reset_timeout
+                )
+            return cls.breakers[host]
+
+    @classmethod
+    def configureCache(
+        cls,
+        size: Optional[int] = None,
+        team_ttl: Optional[float] = None,
+        membership_ttl: Optional[float] = None,
+        response_bytes: Optional[int] = None,
+    ):
+        cls.team_cache.configure(maxsize=size, ttl=team_ttl)
+        cls.membership_cache.configure(maxsize=size, ttl=membership_ttl)
+        cls.response_cache.configure(maxsize=size, maxbytes=response_bytes)
+        cls.comment_scans.configure(maxsize=size)
+
+    @classmethod
+    def configureSharedCache(cls, backend: Any):
+        """Keep team lookups, memberships, rosters and the bot login in a cache shared by all
+        worker processes (e.g. `GitHubApp.cache` with `GITHUBAPP_CACHE_PATH`)"""
+        cls.shared_cache = backend
+        cls.team_cache = SharedTTLCache(
+            backend, "team", maxsize=cls.team_cache.maxsize, ttl=cls.team_cache.ttl
         )
-        if team.status_code != 200:
-            logger.error(f"Team does not exist :: {team_name} - {team.json()}")
+        cls.membership_cache = SharedTTLCache(
+            backend,
+            "membership",
+            maxsize=cls.membership_cache.maxsize,
+            ttl=cls.membership_cache.ttl,
+        )
+        cls.rosters.backend = backend
+
+    @classmethod
+    def cacheStats(cls) -> Dict:
+        return {
+            "teams": cls.team_cache.stats(),
+            "memberships": cls.membership_cache.stats(),
+            "responses": cls.response_cache.stats(),
+            "comment_scans": cls.comment_scans.stats(),
+        }
+
+    @classmethod
+    def configureRoster(cls, enabled: bool, refresh_interval: Optional[float] = None):
+        cls.roster_mode = enabled
+        if refresh_interval is not None:
+            cls.rosters.refresh_interval = refresh_interval
+
+    @classmethod
+    def updateRoster(cls, owner: str, team_name: str, user: str, added: bool):
+        """Apply a membership change to a loaded roster"""
+        key = (owner.lower(), team_name.lower())
+        if added:
+            cls.rosters.add(key, user)
+        else:
+            cls.rosters.remove(key, user)
+
+    @classmethod
+    def invalidateTeamCache(
+        cls,
+        owner: str,
+        team_name: Optional[str] = None,
+        user: Optional[str] = None,
+    ):
+        """Drop cached team / membership results for an org, team and / or user"""
+        owner = owner.lower()
+        team_name = team_name.lower() if team_name else None
+        user = user.lower() if user else None
+
+        def match(key) -> bool:
+            if key[0] != owner:
+                return False
+            if team_name and key[1] != team_name:
+                return False
+            if user and len(key) > 2 and key[2] != user:
+                return False
+            return True
+
+        teams = 0
+        if not user:
+            teams = cls.team_cache.invalidate(match)
+            cls.rosters.invalidate(match)
+        members = cls.membership_cache.invalidate(match)
+        logger.debug(
+            f"Invalidated team cache :: {owner}/{team_name} ({teams} teams, {members} members)"
+        )
+
+    @traced()
+    def checkTeamMembership(
+        self, owner_name: str, team_name: str, user: str
+    ) -> Tuple[bool, bool]:
+        """Whether the team exists and `user` is a member of it"""
+        # The membership lookup does not depend on the team lookup, both run at once
+        team_exists, is_member = self.fanOut(
+            lambda: self.checkIfTeamExists(owner_name, team_name),
+            lambda: self.isTeamMember(owner_name, team_name, user),
+        )
+        return team_exists, is_member
+
+    @traced()
+    def isUserPartOfTeam(self, owner_name: str, team_name: str, user: str) -> bool:
+        team_exists, is_member = self.checkTeamMembership(owner_name, team_name, user)
+        if not team_exists:
+            logger.error(f"Team does not exist :: {team_name}")
             return False
+        return is_member
+
+    @traced()
+    def isTeamMember(self, owner_name: str, team_name: str, user: str) -> bool:
+        """Membership of `user`, False if the team does not exist"""
+        if self.roster_mode:
+            roster = self.rosters.get(
+                (owner_name.lower(), team_name.lower()),
+                lambda: self.getTeamMembers(owner_name, team_name),
+            )
+            if roster is not None:
+                return user in roster
+            logger.warning(
+                f"Team roster unavailable, checking membership :: {team_name}"
+            )
+
+        key = (owner_name.lower(), team_name.lower(), (user or "").lower())
+        is_member = self.membership_cache.get(key)
+        if is_member is not None:
+            logger.debug(f"Team membership cache hit :: {user} ({is_member})")
+            return is_member
 
         membership_res = self.callApi(
             "GET",
             f"{self.installation_client.session.base_url}/orgs/{owner_name}/teams/{team_name}/memberships/{user}",
+            priority=PRIORITY_CRITICAL,
         )
 
+        # Only definitive answers are cached, errors are retried on the next event
+        if membership_res.status_code in (200, 404):
+            self.membership_cache.set(key, membership_res.status_code == 200)
+
         if membership_res.status_code == 200:
-            logger.debug(f"User is part of the security team, no action taken.")
+            logger.debug("User is part of the security team, no action taken.")
             return True
         return False
 
-    def callApi(self, method: str, url: str, json: Dict = {}) -> Dict:
-        response = self.installation_client.session.request(method, url, json=json)
+    @traced(kind=SPAN_KIND_CLIENT)
+    def callApi(
+        self,
+        method: str,
+        url: str,
+        json: Dict = {},
+        priority: int = PRIORITY_NORMAL,
+        as_app: bool = False,
+        idempotent: bool = False,
+    ) -> Dict:
+        """Make an API call as the installation (or the app) once the rate limit allows it.
+
+        GET responses with an ETag or Last-Modified header are cached, later GETs of the
+        same URL are sent as conditional requests and a `304 Not Modified` (which does not
+        count against the rate limit) is answered from the cache.
+
+        Failed calls are retried with backoff when it is safe to send them again. Raises
+        `CircuitOpenError` while the API host keeps failing.
+        """
+        client = self.app_client if as_app else self.installation_client
+        key = "app" if as_app else self.installation_id
+        breaker = self.getCircuitBreaker(url)
+        resource = resourceFor(url)
+
+        span = current_span()
+        if span.is_recording():
+            endpoint = endpointTemplate(urlparse(url).path)
+            span.update_name(f"{method} {endpoint}")
+            span.set_attributes(
+                {
+                    "http.request.method": method,
+                    "url.full": url,
+                    "url.template": endpoint,
+                }
+            )
+
+        cache_key = (key, url)
+        cached = self.response_cache.get(cache_key) if method == "GET" else None
+        headers = cached.conditionalHeaders() if cached else None
+
+        attempt = 0
+        renewed = False
+        while True:
+            trial = breaker.before()
+            try:
+                queued = time.monotonic()
+                self.scheduler.acquire(key, priority, resource)
+                started = time.monotonic()
+                try:
+                    response = client.session.request(
+                        method, url, json=json, headers=headers
+                    )
+                except requests.RequestException as e:
+                    self.recordCall(
+                        method, url, started, started - queued, "error", attempt
+                    )
+                    breaker.failure()
+                    if (
+                        attempt >= self.retry_policy.retries
+                        or not self.retry_policy.shouldRetry(
+                            method, error=e, idempotent=idempotent
+                        )
+                    ):
+                        raise
+                    logger.warning(f"API call failed, retrying :: {method} {url} - {e}")
+                else:
+                    self.recordCall(
+                        method,
+                        url,
+                        started,
+                        started - queued,
+                        str(response.status_code),
+                        attempt,
+                    )
+                    self.scheduler.update(key, response, resource)
+                    if response.status_code >= 500:
+                        breaker.failure()
+                    else:
+                        breaker.success()
+                    if (
+                        response.status_code == 401
+                        and not as_app
+                        and not renewed
+                        and self.renewToken(client.session)
+                    ):
+                        renewed = True
+                        continue
+                    if (
+                        attempt >= self.retry_policy.retries
+                        or not self.retry_policy.shouldRetry(
+                            method, response=response, idempotent=idempotent
+                        )
+                    ):
+                        return (
+                            self.cacheResponse(cache_key, cached, response)
+                            if method == "GET"
+                            else response
+                        )
+                    logger.warning(
+                        f"API call failed, retrying :: {method} {url} - {response.status_code}"
+                    )
+            finally:
+                # A trial interrupted before its result, e.g. deferred by the scheduler, must not block the host
+                if trial:
+                    breaker.release()
+
+            # Rate limited calls wait in the scheduler, everything else backs off
+            time.sleep(self.retry_policy.backoff(attempt))
+            attempt += 1
+
+    def renewToken(self, session) -> bool:
+        """Swap the installation token of `session` GitHub rejected (e.g. revoked) for a new one"""
+        renew = type(self).renew_token
+        if renew is None or not self.installation_id:
+            return False
+        rejected = getattr(session.auth, "token", None)
+        try:
+            token = renew(self.installation_id, rejected)
+        except Exception as e:
+            logger.warning(
+                f"Failed to renew installation token :: {self.installation_id} - {e}"
+            )
+            return False
+        session.app_installation_token_auth(token.as_json())
+        return True
+
+    @staticmethod
+    def recordCall(
+        method: str, url: str, started: float, waited: float, status: str, attempt: int
+    ):
+        """Report an API call to the metrics, and the profile and trace of the delivery being handled"""
+        duration = time.monotonic() - started
+        observeApiCall(method, url, duration, status)
+        span = current_span()
+        span.set_attribute("http.request.resend_count", attempt)
+        if status.isdigit():
+            span.set_attribute("http.response.status_code", int(status))
+        else:
+            span.set_attribute("error.type", status)
+        annotate(
+            "api",
+            f"{method} {url}",
+            started,
+            duration,
+            status=status,
+            attempt=attempt,
+            ratelimit_wait=round(waited, 6),
+        )
+
+    @classmethod
+    def configureReopenEngine(cls, enabled: bool, concurrency: int = 8):
+        """Batch re-opens piling up behind one of the same repository"""
+        if enabled:
+            cls.reopen_engine = ReopenEngine(concurrency=concurrency)
+        else:
+            cls.reopen_engine = None
+
+    @classmethod
+    def configureFanOut(cls, workers: int):
+        """Threads per process running fanned out calls, 1 or less runs them one after another"""
+        with cls._fanout_lock:
+            cls.fanout_workers = workers
+            if cls._fanout_executor is not None:
+                cls._fanout_executor.shutdown(wait=False)
+            cls._fanout_executor = None
+
+    @classmethod
+    def getFanOutExecutor(cls) -> ThreadPoolExecutor:
+        with cls._fanout_lock:
+            # Threads do not survive a fork, every worker process starts its own pool
+            if cls._fanout_executor is None or cls._fanout_pid != os.getpid():
+                cls._fanout_pid = os.getpid()
+                cls._fanout_executor = ThreadPoolExecutor(
+                    max_workers=cls.fanout_workers, thread_name_prefix="fanout"
+                )
+            return cls._fanout_executor
+
+    def fanOut(self, *calls: Callable[[], Any]) -> List[Any]:
+        """Run independent calls concurrently and return their results in order.
+
+        Waits for all calls, then re-raises the first exception of any of them.
+        Calls made from a fanned out call run inline so the pool can not deadlock.
+        """
+        if (
+            len(calls) < 2
+            or self.fanout_workers <= 1
+            or getattr(self._fanout_local, "active", False)
+        ):
+            return [call() for call in calls]
+
+        executor = self.getFanOutExecutor()
+        # Each call sees the context of the handler, e.g. the profile of its delivery
+        futures = [
+            executor.submit(contextvars.copy_context().run, self._runFannedOut, call)
+            for call in calls
+        ]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def _runFannedOut(self, call: Callable[[], Any]) -> Any:
+        self._fanout_local.active = True
+        try:
+            return call()
+        finally:
+            self._fanout_local.active = False
+
+    def cacheResponse(self, key, cached, response):
+        if response.status_code == 304 and cached is not None:
+            self.response_cache.record(hit=True)
+            return cached.toResponse()
+        self.response_cache.record(hit=False)
+        self.response_cache.store(key, response)
         return response
 
+    @traced()
     def reOpenAlert(self, owner: str, repo: str, type: str, alert_id: int) -> Dict:
+        if self.reopen_engine is not None:
+            return self.reopen_engine.submit(self, owner, repo, type, alert_id).result()
+        return self.sendReOpenAlert(owner, repo, type, alert_id)
+
+    def sendReOpenAlert(self, owner: str, repo: str, type: str, alert_id: int) -> Dict:
         return self.callApi(
             "PATCH",
             f"{self.installation_client.session.base_url}/repos/{owner}/{repo}/{type}/alerts/{alert_id}",
             {"state": "open"},
+            priority=PRIORITY_CRITICAL,
         )
 
     def reOpenSecretScanningAlert(self, owner: str, repo: str, alert_id: int) -> Dict:
@@ -59,31 +492,141 @@ class Client:
     def reOpenCodeScanningAlert(self, owner: str, repo: str, alert_id: int) -> Dict:
         return self.reOpenAlert(owner, repo, "code-scanning", alert_id)
 
+    @traced()
     def checkIfTeamExists(self, owner: str, team_name: str) -> bool:
-        team = self.installation_client.session.get(
-            f"{self.installation_client.session.base_url}/orgs/{owner}/teams/{team_name}"
+        key = (owner.lower(), team_name.lower())
+        exists = self.team_cache.get(key)
+        if exists is not None:
+            return exists
+
+        team = self.callApi(
+            "GET",
+            f"{self.installation_client.session.base_url}/orgs/{owner}/teams/{team_name}",
+            priority=PRIORITY_CRITICAL,
         )
+        if team.status_code in (200, 404):
+            self.team_cache.set(key, team.status_code == 200)
         if team.status_code != 200:
             logger.debug(f"Team does not exist :: {team_name} - {team.json()}")
             return False
         return True
 
+    @traced()
+    def getTeamMembers(self, owner: str, team_name: str) -> Optional[Set[str]]:
+        # https://docs.github.com/en/rest/teams/members#list-team-members
+        try:
+            return {
+                member["login"]
+                for member in self.paginate(
+                    f"{self.getBaseUrl()}/orgs/{owner}/teams/{team_name}/members",
+                    priority=PRIORITY_CRITICAL,
+                )
+            }
+        except requests.HTTPError as e:
+            logger.warning(f"Failed to list team members :: {team_name} ({e})")
+            return None
+
+    def paginate(
+        self,
+        url: str,
+        params: Optional[Dict] = None,
+        newest_first: bool = False,
+        priority: int = PRIORITY_NORMAL,
+    ) -> Iterator[Dict]:
+        """Lazily yield the items of a list endpoint, following its `Link` headers.
+
+        Pages are only requested while the caller keeps iterating. With `newest_first`
+        the last page is read first and the pages are walked backwards.
+        Raises `requests.HTTPError` if a page can not be read.
+        """
+        query = {"per_page": 100, **(params or {})}
+        separator = "&" if "?" in url else "?"
+        url += separator + "&".join(f"{key}={value}" for key, value in query.items())
+
+        def getPage(page_url: str):
+            response = self.callApi("GET", page_url, priority=priority)
+            response.raise_for_status()
+            return response
+
+        first = getPage(url)
+        last_url = first.links.get("last", {}).get("url")
+        if not newest_first or not last_url:
+            response = first
+            while True:
+                yield from response.json()
+                next_url = response.links.get("next", {}).get("url")
+                if not next_url:
+                    return
+                response = getPage(next_url)
+
+        # Walk back from the last page, the first page is already loaded
+        page_url = last_url
+        while (
+            page_url and parse_qs(urlparse(page_url).query).get("page", ["1"])[0] != "1"
+        ):
+            response = getPage(page_url)
+            yield from reversed(response.json())
+            page_url = response.links.get("prev", {}).get("url")
+        yield from reversed(first.json())
+
+    @traced()
+    def hasUserCommented(
+        self, owner: str, repo: str, pull_number: int, login: str
+    ) -> bool:
+        """Scan the comments of a PR (newest first) for one by `login`, stops at the first match.
+
+        Scans that find nothing are remembered, the next scan of the PR only reads the
+        comments created or updated since then.
+        """
+        key = (owner, repo, pull_number)
+        scanned_at = datetime.now(timezone.utc)
+        params = {}
+        since = self.comment_scans.get(key)
+        if since is not None:
+            # Allow for clock skew between us and GitHub
+            params["since"] = (since - timedelta(minutes=1)).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            )
+
+        try:
+            for comment in self.paginate(
+                f"{self.getBaseUrl()}/repos/{owner}/{repo}/issues/{pull_number}/comments",
+                params=params,
+                newest_first=True,
+                priority=PRIORITY_LOW,
+            ):
+                if comment.get("user", {}).get("login") == login:
+                    self.comment_scans.invalidate(lambda k: k == key)
+                    return True
+        except requests.HTTPError as e:
+            logger.warning(f"Error getting PR comments: {e}")
+            return False
+
+        self.comment_scans.set(key, scanned_at)
+        return False
+
+    @traced()
     def createTeam(self, owner: str, team_name: str) -> bool:
         # https://docs.github.com/en/rest/reference/teams#create-a-team
         team_request = {
             "name": team_name,
             "description": "GitHub Advanced Security Reviewers",
         }
-        team_creation = self.installation_client.session.post(
-            f"{self.installation_client.session.base_url}/orgs/{owner}/teams", json=team_request
+        team_creation = self.callApi(
+            "POST",
+            f"{self.installation_client.session.base_url}/orgs/{owner}/teams",
+            team_request,
         )
-        if team_creation.status_code != 200:
+        self.invalidateTeamCache(owner, team_name)
+        # GitHub answers 201 Created
+        if team_creation.status_code not in (200, 201):
             logger.warning(f"Failed to create team :: {team_name} in {owner}")
             logger.debug(f"{team_creation.json()}")
             return False
         logging.debug(f"Created team for org :: {owner}")
         return True
 
+    @traced()
     def postComment(
         self, owner: str, repo: str, issue_number: int, comment: str
     ) -> Dict:
@@ -91,21 +634,51 @@ class Client:
             "POST",
             f"{self.installation_client.session.base_url}/repos/{owner}/{repo}/issues/{issue_number}/comments",
             {"body": comment},
+            priority=PRIORITY_LOW,
         )
 
+    @traced()
     def getPRComments(self, owner: str, repo: str, pull_number: int) -> Dict:
         return self.callApi(
             "GET",
             f"{self.getBaseUrl()}/repos/{owner}/{repo}/issues/{pull_number}/comments",
+            priority=PRIORITY_LOW,
         )
 
     def getBaseUrl(self) -> str:
         return self.installation_client.session.base_url
 
-    def getBotUsername(self) -> str:
+    @classmethod
+    def setBotUsername(cls, bot_username: Optional[str]):
+        """Pin the bot login (e.g. from config), or reset it with None to resolve it again"""
+        cls.bot_username = bot_username
+
+    def getBotUsername(self, refresh: bool = False) -> str:
+        if self.bot_username and not refresh:
+            return self.bot_username
+
+        with self._bot_username_lock:
+            if Client.bot_username and not refresh:
+                return Client.bot_username
+            bot_username = None
+            if self.shared_cache is not None and not refresh:
+                bot_username = self.shared_cache.get("bot_username")
+            if not bot_username:
+                bot_username = self.fetchBotUsername()
+                if bot_username and self.shared_cache is not None:
+                    self.shared_cache.set("bot_username", bot_username, ttl=24 * 3600)
+            if bot_username:
+                logger.debug(f"Resolved bot username :: {bot_username}")
+                Client.bot_username = bot_username
+            return bot_username
 
-        app_req = self.app_client.session.get(
+    @traced()
+    def fetchBotUsername(self) -> Optional[str]:
+        app_req = self.callApi(
+            "GET",
             f"{self.app_client.session.base_url}/app",
+            priority=PRIORITY_LOW,
+            as_app=True,
         )
         if app_req.status_code != 200:
             logger.warning(f"Error getting app details: {app_req.status_code}")
@@ -119,13 +692,16 @@ class Client:
 
         return app_name + "[bot]"
 
+    @traced()
     def getPRReviewers(self, owner: str, repo: str, pull_number: int) -> Dict:
         # https://docs.github.com/en/rest/reference/pulls#list-requested-reviewers-for-a-pull-request
         return self.callApi(
             "GET",
             f"{self.getBaseUrl()}/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
+            priority=PRIORITY_LOW,
         )
 
+    @traced()
     def addTeamToPullRequestReviewer(
         self, team_name: str, owner: str, repo: str, pull_number: int
     ) -> bool:
@@ -133,19 +709,115 @@ class Client:
         team_names = [team["name"] for team in pr_reviewers.get("teams", [])]
         # If the team is already attached to the PR
         if team_name in team_names:
-            logger.debug(f"Team is already a reviewer. Skipping")
-        else:
-            logger.debug(f"Team is not a reviewer. Adding")
-            # https://docs.github.com/en/rest/reference/pulls#request-reviewers-for-a-pull-request
-            pr_add_reviewer = self.callApi(
-                "POST",
-                f"{self.getBaseUrl()}/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
-                {"team_reviewers": [team_name]},
+            logger.debug("Team is already a reviewer. Skipping")
+            return True
+        logger.debug("Team is not a reviewer. Adding")
+        return self.requestTeamReview(team_name, owner, repo, pull_number)
+
+    @traced()
+    def requestTeamReview(
+        self, team_name: str, owner: str, repo: str, pull_number: int
+    ) -> bool:
+        # https://docs.github.com/en/rest/reference/pulls#request-reviewers-for-a-pull-request
+        pr_add_reviewer = self.callApi(
+            "POST",
+            f"{self.getBaseUrl()}/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
+            {"team_reviewers": [team_name]},
+            priority=PRIORITY_LOW,
+        )
+        if pr_add_reviewer.status_code != 201:
+            logger.warning(f"Failed to add to PR: {pull_number}")
+            logger.debug(
+                f"Response: {pr_add_reviewer.status_code} - {pr_add_reviewer.text}"
             )
-            if pr_add_reviewer.status_code != 201:
-                logger.warning(f"Failed to add to PR: {pull_number}")
-                logger.debug(
-                    f"Response: {pr_add_reviewer.status_code} - {pr_add_reviewer.text}"
-                )
-                return False
+            return False
         return True
+
+    def getGraphQLUrl(self) -> str:
+        base_url = self.getBaseUrl().rstrip("/")
+        # GitHub Enterprise Server: https://{host}/api/v3 -> https://{host}/api/graphql
+        if base_url.endswith("/v3"):
+            return base_url[: -len("/v3")] + "/graphql"
+        return base_url + "/graphql"
+
+    @traced()
+    def graphql(
+        self, query: str, variables: Dict, priority: int = PRIORITY_NORMAL
+    ) -> Optional[Dict]:
+        """Run a GraphQL query, returns its `data` or None on errors"""
+        response = self.callApi(
+            "POST",
+            self.getGraphQLUrl(),
+            {"query": query, "variables": variables},
+            priority=priority,
+            idempotent=True,
+        )
+        if response.status_code != 200:
+            logger.warning(f"GraphQL request failed: {response.status_code}")
+            return None
+        result = response.json()
+        if result.get("errors"):
+            logger.warning(f"GraphQL errors: {result['errors']}")
+            return None
+        return result.get("data")
+
+    @traced()
+    def getPRNotificationState(
+        self, owner: str, repo: str, pull_number: int
+    ) -> Optional[Dict]:
+        """Whether the bot commented on a PR and which teams are requested as reviewers,
+        read in one GraphQL round-trip (plus one per further 100 comments).
+        """
+        bot_username = self.getBotUsername()
+        if not bot_username:
+            return None
+        # GraphQL reports bots by their slug, without the `[bot]` suffix
+        bot_logins = {bot_username, bot_username.removesuffix("[bot]")}
+
+        state = {"commented": False, "team_reviewers": set()}
+        before = None
+        while True:
+            data = self.graphql(
+                PR_NOTIFICATION_QUERY,
+                {"owner": owner, "repo": repo, "number": pull_number, "before": before},
+                priority=PRIORITY_LOW,
+            )
+            pull_request = ((data or {}).get("repository") or {}).get("pullRequest")
+            if pull_request is None:
+                return None
+
+            if before is None:
+                for request in pull_request["reviewRequests"]["nodes"]:
+                    reviewer = request.get("requestedReviewer") or {}
+                    state["team_reviewers"].update(
+                        name
+                        for name in (reviewer.get("name"), reviewer.get("slug"))
+                        if name
+                    )
+
+            comments = pull_request["comments"]
+            for comment in comments["nodes"]:
+                if (comment.get("author") or {}).get("login") in bot_logins:
+                    state["commented"] = True
+                    return state
+
+            if not comments["pageInfo"]["hasPreviousPage"]:
+                return state
+            before = comments["pageInfo"]["startCursor"]
+
+
+PR_NOTIFICATION_QUERY = """
+query ($owner: String!, $repo: String!, $number: Int!, $before: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      comments(last: 100, before: $before) {
+        nodes { author { login } }
+        pageInfo { hasPreviousPage startCursor }
+      }
+      reviewRequests(first: 100) {
+        nodes { requestedReviewer { ... on Team { name slug } } }
+      }
+    }
+  }
+}
+"""
@@ -0,0 +1,42 @@
+from typing import Any, Hashable, Optional
+import json
+import os
+import logging
+
+from ghasreview.flask_githubapp.cache import MemoryCacheBackend
+
+logger = logging.getLogger("Coalescer")
+
+
+class Coalescer:
+    """Lets one caller per key act on a burst of events arriving within `window` seconds.
+
+    The first caller claims the key and the others are told to skip. Claims are kept in
+    `backend`, so with a cache shared by all worker processes (see `GitHubApp.cache`) one
+    caller of all processes wins. A claim expires with the window, or is released when
+    the caller failed.
+    """
+
+    def __init__(
+        self,
+        window: float = 5,
+        backend: Optional[Any] = None,
+        namespace: str = "coalesce",
+    ):
+        self.window = window
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.prefix = f"{namespace}:"
+
+    def _key(self, key: Hashable) -> str:
+        return self.prefix + json.dumps(list(key) if isinstance(key, tuple) else key)
+
+    def claim(self, key: Hashable) -> bool:
+        """True if the caller acts for the burst of `key`, False if another caller already does"""
+        claimed = self.backend.add(self._key(key), os.getpid(), ttl=self.window)
+        if not claimed:
+            logger.debug(f"Already claimed :: {key}")
+        return claimed
+
+    def release(self, key: Hashable):
+        """Let the next event of `key` act again, e.g. after the claiming caller failed"""
+        self.backend.delete(self._key(key))
@@ -1,8 +1,18 @@
-from .core import GitHubApp
+from .core import GitHubApp, GitHubAppDeferred, GitHubAppError
+from .asgi import GitHubAppASGI
+from .queue import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
 
 __version__ = "1.0.0"
 
-__all__ = ["GitHubApp"]
+__all__ = [
+    "GitHubApp",
+    "GitHubAppASGI",
+    "GitHubAppDeferred",
+    "GitHubAppError",
+    "PRIORITY_HIGH",
+    "PRIORITY_LOW",
+    "PRIORITY_NORMAL",
+]
 
 # Set default logging handler to avoid "No handler found" warnings.
 import logging
@@ -0,0 +1,331 @@
+"""ASGI application serving GitHub hooks on an event loop"""
+
+import asyncio
+import io
+import json
+import logging
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from werkzeug.datastructures import Headers
+
+from .core import (
+    STATUS_DEFERRED,
+    STATUS_DUPLICATE,
+    STATUS_FUNC_CALLED,
+    STATUS_NO_FUNC_CALLED,
+    STATUS_QUEUED,
+    current_payload,
+    verify_signature,
+)
+from .exceptions import GitHubAppDeferred
+from .queue import Delivery
+from .tracing import SPAN_KIND_SERVER, STATUS_ERROR, trace_id_for
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 32
+
+
+class GitHubAppASGI(object):
+    """ASGI application for the hooks of an initialized `GitHubApp`, e.g. `uvicorn module:asgi_app`.
+
+    Verified hooks are dispatched with the `GitHubApp.on` registry. Coroutine hook functions run on
+    the event loop, so a process can wait on the GitHub API for many hooks at once. Hooks that only
+    have regular hook functions run them on a thread pool in a recreated request context, the same
+    way `GITHUBAPP_ASYNC` processes queued hooks. Every other route is served by the Flask app on
+    the same thread pool.
+
+    Arguments:
+        github_app {GitHubApp} -- GitHubApp, `init_app` must have been called
+
+    Keyword Arguments:
+        threads {int} -- Threads running regular hook functions and Flask routes (default: {32})
+        on_shutdown {list} -- Coroutine functions called when the server shuts down (default: {None})
+    """
+
+    def __init__(self, github_app, threads=DEFAULT_THREADS, on_shutdown=None):
+        if github_app._app is None:
+            raise RuntimeError(
+                "GitHubApp.init_app must be called before serving it with ASGI"
+            )
+        self.github_app = github_app
+        self.app = github_app._app
+        self.threads = threads
+        github_app.reserve_connections("asgi", threads)
+        self.on_shutdown = list(on_shutdown or [])
+        self._executor = None
+
+    @property
+    def route(self):
+        return self.app.config.get("GITHUBAPP_ROUTE") or "/"
+
+    @property
+    def executor(self):
+        # Created by the serving process, not by a pre-forking parent
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.threads, thread_name_prefix="asgi"
+            )
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            raise RuntimeError("Unsupported ASGI scope type %r" % scope["type"])
+
+        body = await self._read_body(receive)
+        if scope["method"] == "POST" and scope["path"] == self.route:
+            status, data = await self._handle_hook(self._headers(scope), body)
+            return await self._send_json(send, status, data)
+        return await self._call_wsgi(scope, body, send)
+
+    async def _run_in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(func, *args)
+        )
+
+    async def _handle_hook(self, headers, body):
+        mimetype = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not (
+            mimetype == "application/json"
+            or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+        ):
+            return 400, {
+                "status": "ERROR",
+                "description": "Invalid HTTP Content-Type header for JSON body "
+                "(must be application/json or application/*+json).",
+            }
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400, {
+                "status": "ERROR",
+                "description": "Invalid HTTP body (must be JSON).",
+            }
+        event = headers.get("X-GitHub-Event")
+        if event is None:
+            return 400, {
+                "status": "ERROR",
+                "description": "Missing X-GitHub-Event HTTP header.",
+            }
+        action = payload.get("action") if isinstance(payload, dict) else None
+
+        secret = self.app.config["GITHUBAPP_SECRET"]
+        if secret is not False:
+            if hasattr(secret, "encode"):
+                secret = secret.encode("utf-8")
+            if not verify_signature(secret, headers, body):
+                return 400, {"status": "ERROR", "description": "Invalid signature."}
+
+        delivery_id = headers.get("X-GitHub-Delivery")
+        with self.github_app.tracer.start_span(
+            "webhook %s" % ".".join(filter(None, [event, action])),
+            kind=SPAN_KIND_SERVER,
+            attributes=self.github_app._span_attributes(
+                event, action, delivery_id, payload
+            ),
+            trace_id=trace_id_for(delivery_id),
+        ) as span:
+            status, data = await self._receive(
+                headers, body, event, action, payload, delivery_id, span
+            )
+            span.set_attribute("http.response.status_code", status)
+            span.set_attribute("githubapp.status", data.get("status"))
+            if status >= 500:
+                span.set_status(STATUS_ERROR, data.get("msg"))
+            return status, data
+
+    async def _receive(self, headers, body, event, action, payload, delivery_id, span):
+        deliveries = self.github_app.deliveries
+        if deliveries is not None and delivery_id:
+            if await self._run_in_thread(deliveries.check_and_add, delivery_id):
+                LOG.info("Skipping duplicate delivery :: %s", delivery_id)
+                return 200, {"status": STATUS_DUPLICATE, "calls": {}}
+
+        delivery = Delivery(event, action, dict(headers), body)
+        delivery.span_id = span.span_id
+        functions = self.github_app._functions_for(event, action, coroutines=True)
+        coroutines = [f for f in functions if asyncio.iscoroutinefunction(f)]
+        regular = [f for f in functions if not asyncio.iscoroutinefunction(f)]
+
+        hook_queue = self.github_app.queue
+        if hook_queue is not None and regular and not coroutines:
+            try:
+                await self._run_in_thread(hook_queue.put, delivery)
+                return 202, {"status": STATUS_QUEUED}
+            except queue.Full:
+                LOG.warning(
+                    "Delivery queue is full, processing %r synchronously", delivery
+                )
+            except Exception:
+                # Neither queued nor processed, GitHub's redelivery must not be skipped
+                await self._run_in_thread(self._forget, delivery_id)
+                LOG.exception("Failed to queue %r", delivery)
+                return 500, {"error": 500, "msg": "Internal Server Error"}
+
+        calls = {}
+        try:
+            if coroutines:
+                await self._call_coroutines(event, action, payload, coroutines, calls)
+            if regular:
+                _, regular_calls = await self._run_in_thread(
+                    self.github_app._process_delivery, delivery, regular
+                )
+                calls.update(regular_calls)
+        except GitHubAppDeferred as e:
+            await self._run_in_thread(self._forget, delivery_id)
+            # Replays run the regular hook functions on a thread
+            LOG.warning("Deferring %r for %ss :: %s", delivery, e.retry_after, e)
+            self.github_app._defer(delivery, e.retry_after)
+            return 202, {"status": STATUS_DEFERRED}
+        except Exception:
+            await self._run_in_thread(self._forget, delivery_id)
+            LOG.exception("Failed to process %r", delivery)
+            return 500, {"error": 500, "msg": "Internal Server Error"}
+
+        status = STATUS_FUNC_CALLED if functions else STATUS_NO_FUNC_CALLED
+        return 200, {"status": status, "calls": calls}
+
+    async def _call_coroutines(self, event, action, payload, coroutines, calls):
+        token = current_payload.set(payload)
+        started = time.monotonic()
+        try:
+            for function in coroutines:
+                with self.github_app.tracer.start_span(
+                    function.__name__,
+                    attributes={
+                        "code.function": function.__name__,
+                        "code.namespace": function.__module__,
+                    },
+                ):
+                    calls[function.__name__] = await function()
+        except Exception as e:
+            outcome = "deferred" if isinstance(e, GitHubAppDeferred) else "error"
+            self.github_app._observe(
+                "hook",
+                time.monotonic() - started,
+                event=event,
+                action=action,
+                outcome=outcome,
+            )
+            raise
+        finally:
+            current_payload.reset(token)
+        self.github_app._observe(
+            "hook", time.monotonic() - started, event=event, action=action, outcome="ok"
+        )
+
+    def _forget(self, delivery_id):
+        self.github_app._forget(delivery_id)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if self.github_app.queue is not None:
+                    await self._run_in_thread(self.github_app.queue.start)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                for callback in self.on_shutdown:
+                    await callback()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        return body
+
+    @staticmethod
+    def _headers(scope):
+        return Headers(
+            [
+                (name.decode("latin-1"), value.decode("latin-1"))
+                for name, value in scope["headers"]
+            ]
+        )
+
+    @staticmethod
+    async def _send_json(send, status, data):
+        body = json.dumps(data).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+    async def _call_wsgi(self, scope, body, send):
+        """Serve a request with the Flask app on the thread pool"""
+        server = scope.get("server") or ("localhost", 80)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", ""),
+            "PATH_INFO": scope["path"],
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": str(server[0]),
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in self._headers(scope).items():
+            if name.lower() == "content-type":
+                environ["CONTENT_TYPE"] = value
+            elif name.lower() != "content-length":
+                key = "HTTP_" + name.upper().replace("-", "_")
+                environ[key] = environ[key] + "," + value if key in environ else value
+
+        def run():
+            response = {}
+
+            def start_response(status, headers, exc_info=None):
+                response["status"] = int(status.split(" ", 1)[0])
+                response["headers"] = headers
+
+            chunks = self.app(environ, start_response)
+            try:
+                response["body"] = b"".join(chunks)
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+            return response
+
+        response = await self._run_in_thread(run)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response["status"],
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response["headers"]
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": response["body"]})
@@ -0,0 +1,212 @@
+"""Key-value caches shared by the GitHub App extension and the app using it"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 100000
+
+
+class CacheBackend(object):
+    """Interface of a key-value cache with per-entry expiry.
+
+    Keys are strings, values anything JSON serializable. Backends with `shared` set are
+    read by every worker process on a node, so one process warms the cache for all of them.
+    """
+
+    shared = False
+
+    def get(self, key, default=None):
+        """Value of an unexpired entry or `default`"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        """Store a value, `ttl` in seconds or None to keep it until it is evicted"""
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Store a value only if the key is missing or expired, returns True if it was stored"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def keys(self, prefix=""):
+        """Keys of all unexpired entries starting with `prefix`"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process LRU cache
+
+    Keyword Arguments:
+        maxsize {int} -- Maximum number of entries (default: {100000})
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key, time.time())
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def add(self, key, value, ttl=None):
+        # Checked and stored under one lock, of concurrent callers only one adds the key
+        with self._lock:
+            now = time.time()
+            if self._live(key, now) is not None:
+                return False
+            self._store(key, value, ttl, now)
+            return True
+
+    def _store(self, key, value, ttl, now):
+        self._data[key] = (value, now + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self, prefix=""):
+        now = time.time()
+        with self._lock:
+            return [
+                key
+                for key, (_, expires_at) in self._data.items()
+                if key.startswith(prefix) and (expires_at is None or expires_at >= now)
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache stored in SQLite, shared by all processes on a node and kept across restarts.
+
+    The database may hold installation tokens, it is created readable by its owner only.
+
+    Arguments:
+        path {str} -- Path of the SQLite database
+
+    Keyword Arguments:
+        maxsize {int} -- Maximum number of entries (default: {100000})
+    """
+
+    shared = True
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, maxsize=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+
+        if not os.path.exists(path):
+            os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        with self._connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    @property
+    def _connection(self):
+        # SQLite connections can not be shared between threads or with a forked child
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key, default=None):
+        row = self._connection.execute(
+            "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else default
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl is not None else None),
+            )
+        self._written(now)
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._connection as connection:
+            cursor = connection.execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE cache.expires_at IS NOT NULL AND cache.expires_at < ?",
+                (key, json.dumps(value), now + ttl if ttl is not None else None, now),
+            )
+            added = cursor.rowcount > 0
+        self._written(now)
+        return added
+
+    def delete(self, key):
+        with self._connection as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def keys(self, prefix=""):
+        rows = self._connection.execute(
+            "SELECT key FROM cache WHERE substr(key, 1, ?) = ? "
+            "AND (expires_at IS NULL OR expires_at >= ?)",
+            (len(prefix), prefix, time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def clear(self):
+        with self._connection as connection:
+            connection.execute("DELETE FROM cache")
+
+    def _written(self, now):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY:
+            return
+        with self._connection as connection:
+            connection.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            # Entries expiring first are evicted first, entries without expiry last
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY expires_at IS NULL DESC, expires_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
@@ -1,24 +1,97 @@
 """Flask extension for rapid GitHub app development"""
 
+import contextvars
 import hmac
+import inspect
 import logging
+import queue
+import threading
+import time
 
-from flask import abort, current_app, jsonify, make_response, request
+from flask import abort, current_app, g, jsonify, make_response, request
 from github3 import GitHub, GitHubEnterprise
+from github3.apps import APP_PREVIEW_HEADERS
+from github3.session import AppBearerTokenAuth
 from werkzeug.exceptions import BadRequest
 
+from .cache import DEFAULT_CACHE_SIZE, MemoryCacheBackend, SQLiteCacheBackend
+from .dedup import (
+    DEFAULT_DEDUP_SIZE,
+    DEFAULT_DEDUP_WINDOW,
+    CacheDeliveryLog,
+    MemoryDeliveryLog,
+    SQLiteDeliveryLog,
+)
+from .exceptions import GitHubAppDeferred, GitHubAppError, GitHubAppValidationError
+from .pool import DEFAULT_POOL_SIZE, ConnectionPools
+from .profiling import DEFAULT_PROFILE_KEEP, DeliveryProfiler, annotate
+from .queue import (
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    PRIORITY_NORMAL,
+    Delivery,
+    DurableWorkQueue,
+    WorkQueue,
+)
+from .store import DeliveryStore
+from .tracing import (
+    SPAN_KIND_CLIENT,
+    SPAN_KIND_CONSUMER,
+    SPAN_KIND_SERVER,
+    FileSpanExporter,
+    trace_id_for,
+    traced,
+    tracer,
+)
+from .tokens import (
+    DEFAULT_REFRESH_MARGIN,
+    AppToken,
+    InstallationToken,
+    InstallationTokenCache,
+    load_private_key,
+)
+
 LOG = logging.getLogger(__name__)
 
 STATUS_FUNC_CALLED = "HIT"
 STATUS_NO_FUNC_CALLED = "MISS"
+STATUS_QUEUED = "QUEUED"
+STATUS_DUPLICATE = "DUPLICATE"
+STATUS_DEFERRED = "DEFERRED"
+
+# Payload of the hook being handled by a coroutine hook function (see `GitHubAppASGI`)
+current_payload = contextvars.ContextVar("githubapp_payload", default=None)
 
 
-class GitHubAppError(Exception):
-    pass
+def verify_signature(secret, headers, body):
+    """Check the `X-Hub-Signature-256` (or legacy `X-Hub-Signature`) HMAC of a hook body.
 
+    Arguments:
+        secret {bytes} -- Webhook secret
+        headers {mapping} -- Case-insensitive request headers
+        body {bytes} -- Raw request body
+
+    Returns:
+        bool -- True if the signature is present and valid
+    """
+    if headers.get("X-Hub-Signature-256"):
+        signature = headers["X-Hub-Signature-256"].split("=")[1]
+        digestmod = "sha256"
+    elif headers.get("X-Hub-Signature"):
+        signature = headers["X-Hub-Signature"].split("=")[1]
+        digestmod = "sha1"
+    else:
+        LOG.warning(
+            "Signature header missing. Configure your GitHub App with a secret or set GITHUBAPP_SECRET"
+            "to False to disable verification."
+        )
+        return False
 
-class GitHubAppValidationError(GitHubAppError):
-    pass
+    mac = hmac.new(secret, msg=body, digestmod=digestmod)
+    if not hmac.compare_digest(mac.hexdigest(), signature):
+        LOG.warning("GitHub hook signature verification failed.")
+        return False
+    return True
 
 
 class GitHubApp(object):
@@ -34,6 +107,18 @@ class GitHubApp(object):
 
     def __init__(self, app=None):
         self._hook_mappings = {}
+        self._hook_priorities = {}
+        self._classifier = None
+        self._observers = []
+        self._installation_tokens = InstallationTokenCache()
+        self._app_token = None
+        self._pools = ConnectionPools()
+        self._app = None
+        self.cache = MemoryCacheBackend()
+        self.queue = None
+        self.deliveries = None
+        self.profiler = None
+        self.tracer = tracer
         if app is not None:
             self.init_app(app)
 
@@ -67,6 +152,113 @@ class GitHubApp(object):
 
             Path used for GitHub hook requests as a string.
             Default: '/'
+
+        `GITHUBAPP_TOKEN_REFRESH_MARGIN`:
+
+            Seconds before an installation token expires that it is refreshed in the background as an int.
+            Default: 300
+
+        `GITHUBAPP_CACHE_PATH`:
+
+            Path of a SQLite database shared by all processes on a node as a string. Installation tokens and
+            delivery IDs (unless `GITHUBAPP_DEDUP_PATH` is set) are kept in it, and it is available to the app as
+            `GitHubApp.cache`. Without it every process keeps its own in-memory cache.
+            Default: None
+
+        `GITHUBAPP_CACHE_SIZE`:
+
+            Maximum number of entries in `GitHubApp.cache` as an int.
+            Default: 100000
+
+        `GITHUBAPP_POOL_SIZE`:
+
+            Number of keep-alive connections to the GitHub API for the threads serving requests of a
+            process as an int. The pool keeps one more connection for each queue worker, ASGI thread and
+            thread reserved with `reserve_connections`.
+            Default: 16
+
+        `GITHUBAPP_ASYNC`:
+
+            Acknowledge verified hooks with `202 Accepted` and run the hook functions on a pool of worker
+            threads as a bool.
+            Default: False
+
+        `GITHUBAPP_WORKERS`:
+
+            Number of worker threads processing hooks when `GITHUBAPP_ASYNC` is enabled as an int.
+            Default: 4
+
+        `GITHUBAPP_QUEUE_SIZE`:
+
+            Maximum number of queued hooks, once full hooks are processed synchronously as an int.
+            Default: 1000
+
+        `GITHUBAPP_PRIORITY_WEIGHTS`:
+
+            Share of the queued hooks served from each priority while several priorities are waiting as a
+            dict of priority to weight, see `on` and `classifier`.
+            Default: {0: 8, 1: 3, 2: 1}
+
+        `GITHUBAPP_QUEUE_PATH`:
+
+            Path of a SQLite database persisting queued hooks as a string. Hooks are only acknowledged once
+            stored and hooks left over by a crash or restart are processed on start up (see `start`).
+            Default: None
+
+        `GITHUBAPP_DEDUP_WINDOW`:
+
+            Seconds a `X-GitHub-Delivery` ID is remembered, redeliveries within the window are skipped as an
+            int. Set to `0` to disable deduplication.
+            Default: 3600
+
+        `GITHUBAPP_DEDUP_SIZE`:
+
+            Maximum number of remembered delivery IDs as an int.
+            Default: 10000
+
+        `GITHUBAPP_DEDUP_PATH`:
+
+            Path of a SQLite database to share remembered delivery IDs between processes as a string.
+            Default: None
+
+        `GITHUBAPP_PROFILE_PATH`:
+
+            Directory of delivery profiles as a string, see `GITHUBAPP_PROFILE_PERCENT` and `GITHUBAPP_PROFILE_SLOW`.
+            Profiling is disabled without it.
+            Default: None
+
+        `GITHUBAPP_PROFILE_PERCENT`:
+
+            Percentage of deliveries whose hook functions run under cProfile as a float.
+            Default: 0
+
+        `GITHUBAPP_PROFILE_SLOW`:
+
+            Seconds from which the hook functions of a delivery are reported with samples of their stack as a
+            float. Set to `0` to disable.
+            Default: 0
+
+        `GITHUBAPP_PROFILE_KEEP`:
+
+            Number of delivery profiles kept, older profiles are removed as an int.
+            Default: 50
+
+        `GITHUBAPP_TRACE_PATH`:
+
+            Path of a file the spans of every delivery are appended to as OTLP JSON lines as a string. Tracing is
+            disabled without it (or `GITHUBAPP_TRACE_EXPORTER`).
+            Default: None
+
+        `GITHUBAPP_TRACE_EXPORTER`:
+
+            `SpanExporter` receiving the spans of every delivery, e.g. an `InMemorySpanExporter` in tests. Takes
+            precedence over `GITHUBAPP_TRACE_PATH`.
+            Default: None
+
+        `GITHUBAPP_TRACE_SERVICE`:
+
+            `service.name` of the spans as a string.
+            Default: the name of the Flask app
         """
         required_settings = ["GITHUBAPP_ID", "GITHUBAPP_KEY", "GITHUBAPP_SECRET"]
         for setting in required_settings:
@@ -75,12 +267,97 @@ class GitHubApp(object):
                     "Flask-GitHubApp requires the '%s' config var to be set" % setting
                 )
 
+        cache_size = app.config.get("GITHUBAPP_CACHE_SIZE") or DEFAULT_CACHE_SIZE
+        if app.config.get("GITHUBAPP_CACHE_PATH"):
+            self.cache = SQLiteCacheBackend(
+                app.config["GITHUBAPP_CACHE_PATH"], maxsize=cache_size
+            )
+        else:
+            self.cache = MemoryCacheBackend(maxsize=cache_size)
+
+        self._installation_tokens.refresh_margin = app.config.get(
+            "GITHUBAPP_TOKEN_REFRESH_MARGIN", DEFAULT_REFRESH_MARGIN
+        )
+        # The per-process token cache is only backed by a cache other processes can read
+        self._installation_tokens.backend = self.cache if self.cache.shared else None
+        self._pools.pool_size = (
+            app.config.get("GITHUBAPP_POOL_SIZE") or DEFAULT_POOL_SIZE
+        )
+        # Parse the private key once, every app JWT is signed with the same key object
+        self._app_token = AppToken(
+            load_private_key(app.config["GITHUBAPP_KEY"]), app.config["GITHUBAPP_ID"]
+        )
+
+        dedup_window = app.config.get("GITHUBAPP_DEDUP_WINDOW", DEFAULT_DEDUP_WINDOW)
+        if dedup_window:
+            dedup_options = {
+                "window": dedup_window,
+                "maxsize": app.config.get("GITHUBAPP_DEDUP_SIZE") or DEFAULT_DEDUP_SIZE,
+            }
+            if app.config.get("GITHUBAPP_DEDUP_PATH"):
+                self.deliveries = SQLiteDeliveryLog(
+                    app.config["GITHUBAPP_DEDUP_PATH"], **dedup_options
+                )
+            elif self.cache.shared:
+                self.deliveries = CacheDeliveryLog(self.cache, window=dedup_window)
+            else:
+                self.deliveries = MemoryDeliveryLog(**dedup_options)
+
+        if app.config.get("GITHUBAPP_PROFILE_PATH") and (
+            app.config.get("GITHUBAPP_PROFILE_PERCENT")
+            or app.config.get("GITHUBAPP_PROFILE_SLOW")
+        ):
+            self.profiler = DeliveryProfiler(
+                app.config["GITHUBAPP_PROFILE_PATH"],
+                percent=app.config.get("GITHUBAPP_PROFILE_PERCENT"),
+                slow=app.config.get("GITHUBAPP_PROFILE_SLOW"),
+                keep=app.config.get("GITHUBAPP_PROFILE_KEEP") or DEFAULT_PROFILE_KEEP,
+            )
+
+        if app.config.get("GITHUBAPP_TRACE_EXPORTER") is not None:
+            self.tracer.exporter = app.config["GITHUBAPP_TRACE_EXPORTER"]
+        elif app.config.get("GITHUBAPP_TRACE_PATH"):
+            self.tracer.exporter = FileSpanExporter(app.config["GITHUBAPP_TRACE_PATH"])
+        self.tracer.service_name = app.config.get("GITHUBAPP_TRACE_SERVICE") or app.name
+
+        self._app = app
+        if app.config.get("GITHUBAPP_ASYNC"):
+            options = {
+                "workers": app.config.get("GITHUBAPP_WORKERS") or DEFAULT_WORKERS,
+                "maxsize": app.config.get("GITHUBAPP_QUEUE_SIZE", DEFAULT_QUEUE_SIZE),
+                "classifier": self._classify,
+                "weights": app.config.get("GITHUBAPP_PRIORITY_WEIGHTS"),
+            }
+            if app.config.get("GITHUBAPP_QUEUE_PATH"):
+                store = DeliveryStore(app.config["GITHUBAPP_QUEUE_PATH"])
+                self.queue = DurableWorkQueue(self._process_delivery, store, **options)
+            else:
+                self.queue = WorkQueue(self._process_delivery, **options)
+            self.reserve_connections("queue", options["workers"])
+            # Start the workers (and recover stored hooks) with the first request of each process,
+            # unless the server already called `start` when the process started
+            app.before_request(self.start)
+
         app.add_url_rule(
             app.config.get("GITHUBAPP_ROUTE", "/"),
             view_func=self._flask_view_func,
             methods=["POST"],
         )
 
+    def reserve_connections(self, name, connections):
+        """Keep `connections` more connections to each API host for threads of the app calling the API
+        at once, e.g. a thread pool. Reserving again under the same `name` replaces the
+        previous reservation."""
+        self._pools.reserve(name, connections)
+
+    def start(self):
+        """Start the hook workers of this process and process the hooks stored by crashed or stopped
+        processes. Call it once a (pre-forked) server process starts, e.g. in the `post_worker_init`
+        hook of gunicorn, so stored hooks do not wait for the first request of a process.
+        """
+        if self.queue is not None:
+            self.queue.start()
+
     @property
     def id(self):
         return current_app.config["GITHUBAPP_ID"]
@@ -106,13 +383,19 @@ class GitHubApp(object):
     @property
     def client(self):
         """Unauthenticated GitHub client"""
-        if current_app.config.get("GITHUBAPP_URL"):
-            return GitHubEnterprise(current_app.config["GITHUBAPP_URL"])
-        return GitHub()
+        return self._create_client(current_app.config.get("GITHUBAPP_URL"))
+
+    def _create_client(self, url=None):
+        client = GitHubEnterprise(url) if url else GitHub()
+        self._pools.mount(client.session)
+        return client
 
     @property
     def payload(self):
         """GitHub hook payload"""
+        payload = current_payload.get()
+        if payload is not None:
+            return payload
         if request and request.json and "installation" in request.json:
             return request.json
 
@@ -123,33 +406,91 @@ class GitHubApp(object):
     @property
     def installation_client(self):
         """GitHub client authenticated as GitHub app installation"""
-        # Get the current application context
-        ctx = current_app.app_context()
-        if ctx is not None:
-            if not hasattr(ctx, "githubapp_installation"):
-                client = self.client
-                client.login_as_app_installation(
-                    self.key, self.id, self.payload["installation"]["id"]
+        if "githubapp_installation" not in g:
+            installation_id = self.payload["installation"]["id"]
+            token = self._installation_tokens.get(
+                installation_id, self._token_minter(installation_id)
+            )
+            client = self.client
+            client.session.app_installation_token_auth(token.as_json())
+            g.githubapp_installation = client
+        return g.githubapp_installation
+
+    def get_installation_token(self, installation_id):
+        """Cached installation token, usable outside of a request (e.g. from a coroutine hook function)"""
+        with self._app.app_context():
+            return self._installation_tokens.get(
+                installation_id, self._token_minter(installation_id)
+            )
+
+    def renew_installation_token(self, installation_id, rejected):
+        """New installation token replacing `rejected`, after GitHub answered `401 Unauthorized` for it"""
+        LOG.warning(
+            "Installation token rejected, minting a new one :: %s", installation_id
+        )
+        with self._app.app_context():
+            return self._installation_tokens.renew(
+                installation_id, rejected, self._token_minter(installation_id)
+            )
+
+    def _token_minter(self, installation_id):
+        """Callable minting a new installation token, usable outside of the app context"""
+        app_token, url = self._app_token, current_app.config.get("GITHUBAPP_URL")
+
+        @traced("mint installation token", kind=SPAN_KIND_CLIENT)
+        def mint():
+            client = self._create_client(url)
+            token, expire_in = app_token.get()
+            started = time.monotonic()
+            try:
+                response = client.session.post(
+                    client.session.build_url(
+                        "app", "installations", str(installation_id), "access_tokens"
+                    ),
+                    auth=AppBearerTokenAuth(token, expire_in),
+                    headers=APP_PREVIEW_HEADERS,
+                )
+            except Exception:
+                self._observe(
+                    "installation_token", time.monotonic() - started, outcome="error"
+                )
+                raise
+            duration = time.monotonic() - started
+            self._observe(
+                "installation_token",
+                duration,
+                outcome="ok" if response.status_code == 201 else "error",
+            )
+            annotate(
+                "installation_token",
+                "mint %s" % installation_id,
+                started,
+                duration,
+                status=response.status_code,
+            )
+            if response.status_code != 201:
+                raise GitHubAppError(
+                    f"Failed to create installation token :: {installation_id} ({response.status_code})"
                 )
-                ctx.githubapp_installation = client
-            return ctx.githubapp_installation
+            data = response.json()
+            return InstallationToken(data["token"], data["expires_at"])
+
+        return mint
 
     @property
     def app_client(self):
         """GitHub client authenticated as GitHub app"""
-        ctx = current_app.app_context()
-        if ctx is not None:
-            if not hasattr(ctx, "githubapp_app"):
-                client = self.client
-                client.login_as_app(self.key, self.id)
-                ctx.githubapp_app = client
-            return ctx.githubapp_app
+        if "githubapp_app" not in g:
+            client = self.client
+            client.session.app_bearer_token_auth(*self._app_token.get())
+            g.githubapp_app = client
+        return g.githubapp_app
 
     @property
     def installation_token(self):
         return self.installation_client.session.auth.token
 
-    def on(self, event_action):
+    def on(self, event_action, priority=None):
         """Decorator routes a GitHub hook to the wrapped function.
 
         Functions decorated as a hook recipient are registered as the function for the given GitHub event.
@@ -163,12 +504,23 @@ class GitHubApp(object):
             issue.create_comment('Could not replicate.')
             issue.close()
 
+        Coroutine functions are only called when serving hooks with `GitHubAppASGI`, where they replace the
+        regular functions registered for the same event and action. The payload is available to them as
+        `github_app.payload`.
+
         Arguments:
             event_action {str} -- Name of the event and optional action (separated by a period), e.g. 'issues.opened' or
                 'pull_request'
+
+        Keyword Arguments:
+            priority {int} -- Priority of queued hooks of this event, lower is more urgent. The most urgent priority
+                of all matching mappings is used (default: {PRIORITY_NORMAL})
         """
 
         def decorator(f):
+            if priority is not None:
+                current = self._hook_priorities.get(event_action, priority)
+                self._hook_priorities[event_action] = min(current, priority)
             if event_action not in self._hook_mappings:
                 self._hook_mappings[event_action] = [f]
             else:
@@ -180,6 +532,60 @@ class GitHubApp(object):
 
         return decorator
 
+    def classifier(self, f):
+        """Decorator registering the function deciding the priority of queued hooks.
+
+        The function is called with the event, action and payload of a hook and returns its priority, or None to
+        use the priority given to `on`.
+
+        @github_app.classifier
+        def classify(event, action, payload):
+            if payload.get('alert', {}).get('severity') == 'critical':
+                return PRIORITY_HIGH
+        """
+        self._classifier = f
+        return f
+
+    def observer(self, f):
+        """Decorator registering a function called with the duration of the work done by the extension.
+
+        The function is called with a name, a duration in seconds and labels as keyword arguments:
+
+        - `hook` -- hook functions of a delivery ran, labels `event`, `action` and `outcome` (`ok`, `error` or
+          `deferred`)
+        - `installation_token` -- an installation token was minted, label `outcome` (`ok` or `error`)
+
+        @github_app.observer
+        def observe(name, duration, **labels):
+            histograms[name].observe(duration, **labels)
+        """
+        self._observers.append(f)
+        return f
+
+    def _observe(self, name, duration, **labels):
+        for observer in self._observers:
+            try:
+                observer(name, duration, **labels)
+            except Exception:
+                LOG.exception("Observer %r failed", observer)
+
+    def _classify(self, delivery):
+        """Priority of a queued delivery"""
+        if self._classifier is not None:
+            priority = self._classifier(
+                delivery.event, delivery.action, delivery.payload
+            )
+            if priority is not None:
+                return priority
+
+        keys = [delivery.event]
+        if delivery.action:
+            keys.append(".".join([delivery.event, delivery.action]))
+        priorities = [
+            self._hook_priorities[key] for key in keys if key in self._hook_priorities
+        ]
+        return min(priorities) if priorities else PRIORITY_NORMAL
+
     def _validate_request(self):
         if not request.is_json:
             raise GitHubAppValidationError(
@@ -202,9 +608,6 @@ class GitHubApp(object):
         return event, action
 
     def _flask_view_func(self):
-        functions_to_call = []
-        calls = {}
-
         try:
             event, action = self._validate_request()
         except GitHubAppValidationError as e:
@@ -214,44 +617,185 @@ class GitHubApp(object):
             )
             return abort(error_response)
 
+        delivery_id = request.headers.get("X-GitHub-Delivery")
+        with self.tracer.start_span(
+            "webhook %s" % ".".join(filter(None, [event, action])),
+            kind=SPAN_KIND_SERVER,
+            attributes=self._span_attributes(event, action, delivery_id, request.json),
+            trace_id=trace_id_for(delivery_id),
+        ) as span:
+            return self._receive(event, action, delivery_id, span)
+
+    def _receive(self, event, action, delivery_id, span):
         if current_app.config["GITHUBAPP_SECRET"] is not False:
             self._verify_webhook()
 
-        if event in self._hook_mappings:
-            functions_to_call += self._hook_mappings[event]
+        if self.deliveries is not None and delivery_id:
+            if self.deliveries.check_and_add(delivery_id):
+                LOG.info("Skipping duplicate delivery :: %s", delivery_id)
+                span.set_attribute("githubapp.status", STATUS_DUPLICATE)
+                return jsonify({"status": STATUS_DUPLICATE, "calls": {}})
+
+        delivery = Delivery(event, action, dict(request.headers), request.get_data())
+        delivery.span_id = span.span_id
+        if self.queue is not None and self._functions_for(event, action):
+            try:
+                self.queue.put(delivery)
+                span.set_attribute("githubapp.status", STATUS_QUEUED)
+                return make_response(jsonify({"status": STATUS_QUEUED}), 202)
+            except queue.Full:
+                LOG.warning(
+                    "Delivery queue is full, processing %r synchronously", delivery
+                )
+            except Exception:
+                # Neither queued nor processed, GitHub's redelivery must not be skipped
+                self._forget(delivery_id)
+                raise
+
+        try:
+            status, calls = self._dispatch(event, action, delivery_id)
+        except GitHubAppDeferred as e:
+            LOG.warning("Deferring %r for %ss :: %s", delivery, e.retry_after, e)
+            span.set_attribute("githubapp.status", STATUS_DEFERRED)
+            self._defer(delivery, e.retry_after)
+            return make_response(jsonify({"status": STATUS_DEFERRED}), 202)
+        span.set_attribute("githubapp.status", status)
+        return jsonify({"status": status, "calls": calls})
 
+    @staticmethod
+    def _span_attributes(event, action, delivery_id, payload):
+        payload = payload if isinstance(payload, dict) else {}
+        return {
+            "github.delivery": delivery_id,
+            "github.event": event,
+            "github.action": action,
+            "github.installation.id": (payload.get("installation") or {}).get("id"),
+            "github.repository": (payload.get("repository") or {}).get("full_name"),
+        }
+
+    def _defer(self, delivery, delay):
+        """Park a delivery and replay it after `delay` seconds"""
+        if self.queue is not None:
+            self.queue.defer(delivery, delay)
+            return
+
+        def replay():
+            try:
+                self._process_delivery(delivery)
+            except GitHubAppDeferred as e:
+                LOG.warning(
+                    "Deferring %r again for %ss :: %s", delivery, e.retry_after, e
+                )
+                self._defer(delivery, e.retry_after)
+            except Exception:
+                LOG.exception("Failed to replay delivery %r", delivery)
+
+        timer = threading.Timer(delay, replay)
+        timer.daemon = True
+        timer.start()
+
+    def _functions_for(self, event, action, coroutines=False):
+        """Hook functions of an event and action.
+
+        With `coroutines` the coroutine functions of a mapping are preferred over its regular
+        functions, otherwise coroutine functions are left out.
+        """
+        keys = [event]
         if action:
-            event_action = ".".join([event, action])
-            if event_action in self._hook_mappings:
-                functions_to_call += self._hook_mappings[event_action]
+            keys.append(".".join([event, action]))
+
+        functions_to_call = []
+        for key in keys:
+            functions = self._hook_mappings.get(key, [])
+            asynchronous = [f for f in functions if inspect.iscoroutinefunction(f)]
+            if coroutines and asynchronous:
+                functions_to_call += asynchronous
+            else:
+                functions_to_call += [
+                    f for f in functions if not inspect.iscoroutinefunction(f)
+                ]
+        return functions_to_call
+
+    def _dispatch(self, event, action, delivery_id=None, functions_to_call=None):
+        calls = {}
+        if functions_to_call is None:
+            functions_to_call = self._functions_for(event, action)
+        started = time.monotonic()
+        try:
+            if self.profiler is not None and functions_to_call:
+                with self.profiler.profile(event, action, delivery_id):
+                    self._call_functions(functions_to_call, calls)
+            else:
+                self._call_functions(functions_to_call, calls)
+        except Exception as e:
+            self._forget(delivery_id)
+            outcome = "deferred" if isinstance(e, GitHubAppDeferred) else "error"
+            self._observe(
+                "hook",
+                time.monotonic() - started,
+                event=event,
+                action=action,
+                outcome=outcome,
+            )
+            raise
+        if functions_to_call:
+            self._observe(
+                "hook",
+                time.monotonic() - started,
+                event=event,
+                action=action,
+                outcome="ok",
+            )
 
         if functions_to_call:
-            for function in functions_to_call:
-                calls[function.__name__] = function()
             status = STATUS_FUNC_CALLED
         else:
             status = STATUS_NO_FUNC_CALLED
-        return jsonify({"status": status, "calls": calls})
+        return status, calls
+
+    def _forget(self, delivery_id):
+        """Let a redelivery of a failed (or deferred) hook through"""
+        if self.deliveries is not None and delivery_id:
+            self.deliveries.forget(delivery_id)
+
+    def _call_functions(self, functions_to_call, calls):
+        for function in functions_to_call:
+            with self.tracer.start_span(
+                function.__name__,
+                attributes={
+                    "code.function": function.__name__,
+                    "code.namespace": function.__module__,
+                },
+            ):
+                calls[function.__name__] = function()
 
-    def _verify_webhook(self):
-        signature_header = "X-Hub-Signature-256"
-        signature_header_legacy = "X-Hub-Signature"
-
-        if request.headers.get(signature_header):
-            signature = request.headers[signature_header].split("=")[1]
-            digestmod = "sha256"
-        elif request.headers.get(signature_header_legacy):
-            signature = request.headers[signature_header_legacy].split("=")[1]
-            digestmod = "sha1"
-        else:
-            LOG.warning(
-                "Signature header missing. Configure your GitHub App with a secret or set GITHUBAPP_SECRET"
-                "to False to disable verification."
+    def _process_delivery(self, delivery, functions_to_call=None):
+        """Run the hook functions of a queued delivery in a recreated request context"""
+        with self._app.test_request_context(
+            self._app.config.get("GITHUBAPP_ROUTE") or "/",
+            method="POST",
+            data=delivery.body,
+            headers=delivery.headers,
+        ), self.tracer.start_span(
+            "process %s" % ".".join(filter(None, [delivery.event, delivery.action])),
+            kind=SPAN_KIND_CONSUMER,
+            attributes=dict(
+                self._span_attributes(
+                    delivery.event, delivery.action, delivery.id, delivery.payload
+                ),
+                **{"githubapp.attempt": delivery.attempts},
+            ),
+            # Child of the span that received the delivery, when it was received by this process
+            trace_id=trace_id_for(delivery.id),
+            parent_id=delivery.span_id,
+        ) as span:
+            status, calls = self._dispatch(
+                delivery.event, delivery.action, delivery.id, functions_to_call
             )
-            return abort(400)
-
-        mac = hmac.new(self.secret, msg=request.data, digestmod=digestmod)
+            span.set_attribute("githubapp.status", status)
+            LOG.debug("Processed %r :: %s %s", delivery, status, calls)
+            return status, calls
 
-        if not hmac.compare_digest(mac.hexdigest(), signature):
-            LOG.warning("GitHub hook signature verification failed.")
+    def _verify_webhook(self):
+        if not verify_signature(self.secret, request.headers, request.data):
             return abort(400)
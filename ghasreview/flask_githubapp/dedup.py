@@ -0,0 +1,144 @@
+"""Time-windowed seen-sets of webhook delivery IDs"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_DEDUP_WINDOW = 3600
+DEFAULT_DEDUP_SIZE = 10000
+
+
+class MemoryDeliveryLog(object):
+    """Per-process seen-set of delivery IDs, bounded in size and time
+
+    Keyword Arguments:
+        window {int} -- Seconds a delivery ID is remembered (default: {3600})
+        maxsize {int} -- Maximum number of remembered IDs (default: {10000})
+    """
+
+    def __init__(self, window=DEFAULT_DEDUP_WINDOW, maxsize=DEFAULT_DEDUP_SIZE):
+        self.window = window
+        self.maxsize = maxsize
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check_and_add(self, delivery_id):
+        """Remember the delivery ID, returns True if it was already seen within the window"""
+        now = time.monotonic()
+        with self._lock:
+            while self._seen:
+                oldest, seen_at = next(iter(self._seen.items()))
+                if now - seen_at <= self.window and len(self._seen) < self.maxsize:
+                    break
+                del self._seen[oldest]
+
+            if delivery_id in self._seen:
+                return True
+            self._seen[delivery_id] = now
+            return False
+
+    def forget(self, delivery_id):
+        with self._lock:
+            self._seen.pop(delivery_id, None)
+
+
+class SQLiteDeliveryLog(object):
+    """Seen-set of delivery IDs stored in SQLite, shared by all processes on a node
+
+    Arguments:
+        path {str} -- Path of the SQLite database
+
+    Keyword Arguments:
+        window {int} -- Seconds a delivery ID is remembered (default: {3600})
+        maxsize {int} -- Maximum number of remembered IDs (default: {10000})
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, window=DEFAULT_DEDUP_WINDOW, maxsize=DEFAULT_DEDUP_SIZE):
+        self.path = path
+        self.window = window
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._inserts = 0
+
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS seen_deliveries "
+                "(delivery_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+
+    @property
+    def _connection(self):
+        # SQLite connections can not be shared between threads or with a forked child
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def check_and_add(self, delivery_id):
+        """Remember the delivery ID, returns True if it was already seen within the window"""
+        now = time.time()
+        connection = self._connection
+        with connection:
+            # Claims the ID if it is new or its previous sighting is outside the window
+            cursor = connection.execute(
+                "INSERT INTO seen_deliveries (delivery_id, seen_at) VALUES (?, ?) "
+                "ON CONFLICT (delivery_id) DO UPDATE SET seen_at = excluded.seen_at "
+                "WHERE seen_deliveries.seen_at < ?",
+                (delivery_id, now, now - self.window),
+            )
+            duplicate = cursor.rowcount == 0
+
+        self._inserts += 1
+        if self._inserts % self.PRUNE_EVERY == 0:
+            self._prune(now)
+        return duplicate
+
+    def forget(self, delivery_id):
+        with self._connection as connection:
+            connection.execute(
+                "DELETE FROM seen_deliveries WHERE delivery_id = ?", (delivery_id,)
+            )
+
+    def _prune(self, now):
+        with self._connection as connection:
+            connection.execute(
+                "DELETE FROM seen_deliveries WHERE seen_at < ?", (now - self.window,)
+            )
+            connection.execute(
+                "DELETE FROM seen_deliveries WHERE delivery_id IN ("
+                "SELECT delivery_id FROM seen_deliveries ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+
+
+class CacheDeliveryLog(object):
+    """Seen-set of delivery IDs kept in a `CacheBackend`, shared by all processes if the backend is
+
+    Arguments:
+        backend {CacheBackend} -- Cache holding the delivery IDs
+
+    Keyword Arguments:
+        window {int} -- Seconds a delivery ID is remembered (default: {3600})
+    """
+
+    def __init__(self, backend, window=DEFAULT_DEDUP_WINDOW):
+        self.backend = backend
+        self.window = window
+
+    def check_and_add(self, delivery_id):
+        """Remember the delivery ID, returns True if it was already seen within the window"""
+        return not self.backend.add(f"delivery:{delivery_id}", 1, ttl=self.window)
+
+    def forget(self, delivery_id):
+        self.backend.delete(f"delivery:{delivery_id}")
@@ -0,0 +1,21 @@
+"""Flask-GitHubApp exceptions"""
+
+
+class GitHubAppError(Exception):
+    pass
+
+
+class GitHubAppValidationError(GitHubAppError):
+    pass
+
+
+class GitHubAppDeferred(GitHubAppError):
+    """Raised by hook functions that can not run right now, the hook is replayed later
+
+    Keyword Arguments:
+        retry_after {float} -- Seconds to wait before replaying the hook (default: {60})
+    """
+
+    def __init__(self, message="", retry_after=60):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,75 @@
+"""Keep-alive connection pools shared by every GitHub client of a process"""
+
+import logging
+import os
+import threading
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 16
+
+
+class ConnectionPools(object):
+    """One `HTTPAdapter` (and so one urllib3 connection pool) per API host and process.
+
+    github3 creates a new `requests` session for every client. Mounting the shared adapter
+    on each of them lets all clients reuse the same keep-alive connections, while the
+    authentication (installation token or app JWT) stays on the session and is attached
+    to every request.
+
+    Besides `pool_size` connections for the threads serving requests, the pool keeps one
+    connection for every thread reserved with `reserve`, so threads calling the API at the
+    same time do not open connections the pool then has to discard.
+
+    Keyword Arguments:
+        pool_size {int} -- Connections kept per host for the threads serving requests (default: {16})
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._reserved = {}
+        self._adapters = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        """Connections kept per host, `pool_size` and one per reserved thread"""
+        return self.pool_size + sum(self._reserved.values())
+
+    def reserve(self, name, connections):
+        """Make room for `connections` threads of `name` (e.g. queue workers) calling the API at once.
+
+        Reserving again under the same name replaces the previous reservation.
+        """
+        with self._lock:
+            before = self.maxsize
+            self._reserved[name] = max(connections, 0)
+            if self.maxsize != before:
+                # Sessions mounted before keep the old adapter, new clients get the new size
+                self._adapters = {}
+
+    def adapter(self, url):
+        """Shared adapter for the scheme and host of `url`"""
+        parsed = urlparse(url)
+        prefix = f"{parsed.scheme}://{parsed.netloc}/"
+        with self._lock:
+            # Pooled sockets must not be shared with a forked child
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._adapters = {}
+            if prefix not in self._adapters:
+                LOG.debug("Creating connection pool :: %s (%d)", prefix, self.maxsize)
+                self._adapters[prefix] = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.maxsize, pool_block=False
+                )
+            return prefix, self._adapters[prefix]
+
+    def mount(self, session):
+        """Route the requests of a session to the base URL through the shared pool"""
+        prefix, adapter = self.adapter(session.base_url)
+        session.mount(prefix, adapter)
+        return session
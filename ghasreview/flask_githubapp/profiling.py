@@ -0,0 +1,281 @@
+"""Profiles of sampled and slow hook deliveries, kept in a bounded directory of reports"""
+
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from .exceptions import GitHubAppDeferred
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_KEEP = 50
+DEFAULT_SAMPLE_INTERVAL = 0.01
+STACK_DEPTH = 40
+REPORT_NAME = re.compile(r"^[\w.-]+\.json$")
+
+# Profile of the delivery being processed, copied into threads started with its context
+current_profile = contextvars.ContextVar("githubapp_profile", default=None)
+
+
+def annotate(kind, name, started, duration, **fields):
+    """Add an entry to the timeline of the delivery being profiled, does nothing otherwise.
+
+    Arguments:
+        kind {str} -- Kind of entry, e.g. 'api'
+        name {str} -- Description, e.g. the method and URL of an API call
+        started {float} -- `time.monotonic()` when the work started
+        duration {float} -- Seconds the work took
+    """
+    profile = current_profile.get()
+    if profile is not None:
+        profile.annotate(kind, name, started, duration, fields)
+
+
+class StackSampler(object):
+    """Samples the stacks of registered threads from a background thread.
+
+    Keyword Arguments:
+        interval {float} -- Seconds between samples (default: {0.01})
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def register(self, thread_id):
+        """Start counting the stacks of a thread, returns the Counter they are added to"""
+        stacks = Counter()
+        with self._lock:
+            self._threads[thread_id] = stacks
+            # The sampling thread is not inherited by forked workers
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                thread = threading.Thread(
+                    target=self._run, name="githubapp-sampler", daemon=True
+                )
+                thread.start()
+        return stacks
+
+    def unregister(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            # Counted under the lock, so no sample is added once a thread is unregistered
+            with self._lock:
+                if not self._threads:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, stacks in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None and len(names) < STACK_DEPTH:
+            code = frame.f_code
+            names.append(
+                "%s (%s:%d)"
+                % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno)
+            )
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+class Profile(object):
+    """Timeline, and optionally cProfile stats and stack samples, of one delivery"""
+
+    def __init__(self, event, action, delivery_id):
+        self.event = event
+        self.action = action
+        self.delivery_id = delivery_id
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.timeline = []
+        self.profiler = None
+        self.stacks = None
+        self._lock = threading.Lock()
+
+    def annotate(self, kind, name, started, duration, fields):
+        entry = {
+            "kind": kind,
+            "name": name,
+            "thread": threading.current_thread().name,
+            "offset": round(started - self.started, 6),
+            "duration": round(duration, 6),
+        }
+        entry.update(fields)
+        with self._lock:
+            self.timeline.append(entry)
+
+    def report(self, reason, duration, outcome):
+        report = {
+            "event": self.event,
+            "action": self.action,
+            "delivery": self.delivery_id,
+            "reason": reason,
+            "started_at": self.started_at,
+            "duration": round(duration, 6),
+            "outcome": outcome,
+            "pid": os.getpid(),
+        }
+        with self._lock:
+            report["timeline"] = sorted(
+                self.timeline, key=lambda entry: entry["offset"]
+            )
+        if self.stacks:
+            report["samples"] = [
+                {"stack": stack, "count": count}
+                for stack, count in self.stacks.most_common(50)
+            ]
+        if self.profiler is not None:
+            output = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=output)
+            stats.sort_stats("cumulative").print_stats(50)
+            report["profile"] = output.getvalue()
+        return report
+
+
+class DeliveryProfiler(object):
+    """Profiles a share of all deliveries and captures deliveries whose hook functions are slow.
+
+    Sampled deliveries run under cProfile. With a slow threshold the stack of every delivery is
+    sampled in the background and kept only if its hook functions took at least `slow` seconds.
+    Both record a timeline of the work reported with `annotate`. Reports are written as JSON files
+    to `path`, of which the newest `keep` are kept.
+
+    Arguments:
+        path {str} -- Directory of the reports
+
+    Keyword Arguments:
+        percent {float} -- Percentage of deliveries profiled with cProfile (default: {0})
+        slow {float} -- Seconds from which a delivery is reported, None or 0 disables (default: {None})
+        keep {int} -- Number of reports kept (default: {50})
+        interval {float} -- Seconds between stack samples of a delivery (default: {0.01})
+    """
+
+    def __init__(
+        self,
+        path,
+        percent=0,
+        slow=None,
+        keep=DEFAULT_PROFILE_KEEP,
+        interval=DEFAULT_SAMPLE_INTERVAL,
+    ):
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.abspath(path)
+        self.percent = percent or 0
+        self.slow = slow or None
+        self.keep = keep
+        self.sampler = StackSampler(interval) if self.slow else None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, event, action, delivery_id=None):
+        """Context of the hook functions of a delivery"""
+        profile = Profile(event, action, delivery_id)
+        sampled = random.random() * 100 < self.percent
+        if sampled:
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError:
+                # Another profiler is active on this thread
+                profile.profiler = None
+                sampled = False
+        thread_id = threading.get_ident()
+        if self.sampler is not None:
+            profile.stacks = self.sampler.register(thread_id)
+
+        token = current_profile.set(profile)
+        outcome = "ok"
+        try:
+            yield profile
+        except Exception as e:
+            outcome = "deferred" if isinstance(e, GitHubAppDeferred) else "error"
+            raise
+        finally:
+            current_profile.reset(token)
+            duration = time.monotonic() - profile.started
+            if profile.profiler is not None:
+                profile.profiler.disable()
+            if self.sampler is not None:
+                self.sampler.unregister(thread_id)
+
+            if self.slow and duration >= self.slow:
+                self._write(profile.report("slow", duration, outcome))
+            elif sampled:
+                self._write(profile.report("sampled", duration, outcome))
+
+    def _write(self, report):
+        name = "%d-%d-%s.json" % (
+            time.time_ns(),
+            os.getpid(),
+            re.sub(
+                r"[^\w-]",
+                "_",
+                "-".join(filter(None, [report["event"], report["action"]])),
+            ),
+        )
+        path = os.path.join(self.path, name)
+        try:
+            with open(path + ".tmp", "w") as handle:
+                json.dump(report, handle, indent=2)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            LOG.warning("Failed to write profile :: %s", e)
+            return
+        LOG.info(
+            "Wrote %s profile of %s (%.2fs) :: %s",
+            report["reason"],
+            report["event"],
+            report["duration"],
+            name,
+        )
+
+        with self._lock:
+            for old in self.reports()[self.keep :]:
+                try:
+                    os.remove(os.path.join(self.path, old["name"]))
+                except FileNotFoundError:
+                    # Removed by another process
+                    pass
+
+    def reports(self):
+        """Reports in the directory, newest first"""
+        reports = []
+        for name in os.listdir(self.path):
+            if not REPORT_NAME.match(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            reports.append(
+                {"name": name, "size": stat.st_size, "created_at": stat.st_mtime}
+            )
+        return sorted(reports, key=lambda report: report["name"], reverse=True)
+
+    def report_path(self, name):
+        """Path of a report, None if there is no report of that name"""
+        if not REPORT_NAME.match(name):
+            return None
+        path = os.path.join(self.path, name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,414 @@
+"""In-process work queue for asynchronous webhook processing"""
+
+import collections
+import json
+import logging
+import queue
+import threading
+import time
+
+from .exceptions import GitHubAppDeferred
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Lower values are more urgent
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Share of the deliveries served from each priority while several are waiting
+DEFAULT_PRIORITY_WEIGHTS = {PRIORITY_HIGH: 8, PRIORITY_NORMAL: 3, PRIORITY_LOW: 1}
+
+# Share of the queue capacity each priority leaves free for more urgent deliveries
+PRIORITY_RESERVES = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: 0.05, PRIORITY_LOW: 0.2}
+
+
+class Delivery(object):
+    """Verified webhook delivery waiting to be dispatched to its hook functions"""
+
+    def __init__(self, event, action, headers, body):
+        self.event = event
+        self.action = action
+        self.headers = headers
+        self.body = body
+        self.received_at = time.time()
+        self.attempts = 0
+        self.store_id = None
+        self.priority = None
+        # Span that received the delivery, the parent of the span processing it
+        self.span_id = None
+        self._payload = None
+
+    def header(self, name):
+        """Case-insensitive header lookup"""
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+    @property
+    def id(self):
+        return self.header("X-GitHub-Delivery")
+
+    @property
+    def payload(self):
+        if self._payload is None:
+            self._payload = json.loads(self.body)
+        return self._payload
+
+    def __repr__(self):
+        return "<Delivery {} {}.{}>".format(self.id, self.event, self.action)
+
+
+class PriorityDeliveryQueue(object):
+    """Bounded queue serving deliveries by weighted priority.
+
+    Deliveries of the same priority are served in order. While several priorities are
+    waiting they are served in proportion to their weights (smooth weighted round-robin),
+    so urgent deliveries overtake a backlog without starving it. Less urgent priorities
+    stop at their reserve of the capacity (see `PRIORITY_RESERVES`).
+
+    Implements the parts of the `queue.Queue` interface used by `WorkQueue`.
+
+    Keyword Arguments:
+        maxsize {int} -- Maximum number of queued deliveries, 0 for unbounded (default: {0})
+        weights {dict} -- Weight of each priority (default: {DEFAULT_PRIORITY_WEIGHTS})
+    """
+
+    def __init__(self, maxsize=0, weights=None):
+        self.maxsize = maxsize
+        self.weights = dict(weights or DEFAULT_PRIORITY_WEIGHTS)
+        self._queues = collections.defaultdict(collections.deque)
+        self._credits = collections.defaultdict(int)
+        self._size = 0
+        self._unfinished = 0
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._all_done = threading.Condition(self._mutex)
+
+    def _priority(self, delivery):
+        priority = getattr(delivery, "priority", None)
+        return PRIORITY_NORMAL if priority is None else priority
+
+    def _capacity(self, priority):
+        if self.maxsize <= 0:
+            return None
+        return self.maxsize - int(self.maxsize * PRIORITY_RESERVES.get(priority, 0))
+
+    def _has_room(self, priority):
+        capacity = self._capacity(priority)
+        return capacity is None or self._size < capacity
+
+    def put(self, delivery, block=True, timeout=None):
+        priority = self._priority(delivery)
+        with self._not_full:
+            if not self._has_room(priority):
+                if not block:
+                    raise queue.Full
+                if not self._not_full.wait_for(
+                    lambda: self._has_room(priority), timeout
+                ):
+                    raise queue.Full
+            self._queues[priority].append(delivery)
+            self._size += 1
+            self._unfinished += 1
+            self._not_empty.notify()
+
+    def put_nowait(self, delivery):
+        self.put(delivery, block=False)
+
+    def get(self):
+        with self._not_empty:
+            self._not_empty.wait_for(lambda: self._size > 0)
+            priority = self._next_priority()
+            delivery = self._queues[priority].popleft()
+            self._size -= 1
+            self._not_full.notify_all()
+            return delivery
+
+    def _next_priority(self):
+        waiting = [priority for priority, items in self._queues.items() if items]
+        total = 0
+        for priority in waiting:
+            weight = self.weights.get(priority, 1)
+            self._credits[priority] += weight
+            total += weight
+        chosen = max(waiting, key=lambda priority: (self._credits[priority], -priority))
+        self._credits[chosen] -= total
+        # Idle priorities do not save up credit
+        for priority in list(self._credits):
+            if priority not in waiting:
+                self._credits[priority] = 0
+        return chosen
+
+    def task_done(self):
+        with self._all_done:
+            self._unfinished -= 1
+            if self._unfinished <= 0:
+                self._all_done.notify_all()
+
+    def join(self):
+        with self._all_done:
+            self._all_done.wait_for(lambda: self._unfinished <= 0)
+
+    def qsize(self):
+        return self._size
+
+    def depths(self):
+        with self._mutex:
+            return {
+                priority: len(items) for priority, items in sorted(self._queues.items())
+            }
+
+    def full(self, priority=None):
+        if priority is None:
+            priority = PRIORITY_NORMAL
+        with self._mutex:
+            return not self._has_room(priority)
+
+
+class WorkQueue(object):
+    """Bounded queue of deliveries served by a pool of worker threads.
+
+    Worker threads are started lazily by `start` or the first `put` so that they are
+    created in the serving process and not in a pre-forking parent.
+
+    Arguments:
+        handler {callable} -- Called with each `Delivery`
+
+    Keyword Arguments:
+        workers {int} -- Number of worker threads (default: {4})
+        maxsize {int} -- Maximum number of queued deliveries, 0 for unbounded (default: {1000})
+        classifier {callable} -- Returns the priority of a `Delivery` (default: {None})
+        weights {dict} -- Weight of each priority (default: {DEFAULT_PRIORITY_WEIGHTS})
+    """
+
+    def __init__(
+        self,
+        handler,
+        workers=DEFAULT_WORKERS,
+        maxsize=DEFAULT_QUEUE_SIZE,
+        classifier=None,
+        weights=None,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.classifier = classifier
+        self._queue = PriorityDeliveryQueue(maxsize=maxsize, weights=weights)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._processed = 0
+        self._failed = 0
+        self._deferred = 0
+
+    def classify(self, delivery):
+        if delivery.priority is None and self.classifier is not None:
+            try:
+                delivery.priority = self.classifier(delivery)
+            except Exception:
+                LOG.exception("Failed to classify %r", delivery)
+        return delivery
+
+    def put(self, delivery):
+        """Enqueue a delivery, raises `queue.Full` when the queue is at capacity"""
+        self.start()
+        self._queue.put_nowait(self.classify(delivery))
+
+    def defer(self, delivery, delay):
+        """Put a delivery back on the queue after `delay` seconds"""
+        with self._lock:
+            self._deferred += 1
+
+        def put():
+            with self._lock:
+                self._deferred -= 1
+            try:
+                self._queue.put_nowait(delivery)
+            except queue.Full:
+                self._on_defer_dropped(delivery)
+
+        timer = threading.Timer(delay, put)
+        timer.daemon = True
+        timer.start()
+
+    def join(self):
+        """Block until every queued delivery has been processed"""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            busy = self._busy
+            return {
+                "depth": self._queue.qsize(),
+                "depth_by_priority": self._queue.depths(),
+                "workers": len(self._threads),
+                "busy": busy,
+                "utilisation": busy / len(self._threads) if self._threads else 0.0,
+                "processed": self._processed,
+                "failed": self._failed,
+                "deferred": self._deferred,
+            }
+
+    def start(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work,
+                    name=f"githubapp-worker-{len(self._threads)}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            delivery = self._queue.get()
+            with self._lock:
+                self._busy += 1
+            outcome, retry_after = "ok", None
+            try:
+                delivery.attempts += 1
+                self.handler(delivery)
+            except GitHubAppDeferred as e:
+                # Parked, it neither counts as an attempt nor as processed
+                outcome, retry_after = "deferred", e.retry_after
+                delivery.attempts -= 1
+                LOG.warning("Deferring %r for %ss :: %s", delivery, e.retry_after, e)
+            except Exception:
+                outcome = "failed"
+                LOG.exception("Failed to process delivery %r", delivery)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    if outcome != "deferred":
+                        self._processed += 1
+                        self._failed += int(outcome == "failed")
+                try:
+                    if outcome == "deferred":
+                        # Stays in the store until it is processed after the delay
+                        self.defer(delivery, retry_after)
+                    elif outcome == "failed":
+                        self._on_failure(delivery)
+                    else:
+                        self._on_success(delivery)
+                finally:
+                    self._queue.task_done()
+                    self._feed()
+
+    def _feed(self):
+        pass
+
+    def _on_success(self, delivery):
+        pass
+
+    def _on_failure(self, delivery):
+        pass
+
+    def _on_defer_dropped(self, delivery):
+        LOG.error("Delivery queue is full, dropping deferred %r", delivery)
+
+
+class DurableWorkQueue(WorkQueue):
+    """`WorkQueue` backed by a `DeliveryStore`, deliveries survive restarts and crashes.
+
+    A delivery is only accepted once it is committed to the store and only removed
+    after its hook functions ran (at-least-once). Failed deliveries are retried up
+    to `max_attempts` times before they are kept as failed in the store.
+
+    Arguments:
+        handler {callable} -- Called with each `Delivery`
+        store {DeliveryStore} -- Durable delivery store
+    """
+
+    def __init__(self, handler, store, max_attempts=DEFAULT_MAX_ATTEMPTS, **kwargs):
+        super().__init__(handler, **kwargs)
+        self.store = store
+        self.max_attempts = max_attempts
+        self._recovered = False
+        # Deliveries claimed by this process that did not fit in the queue, fed in by
+        # the workers as soon as there is room
+        self._overflow = collections.deque()
+
+    def put(self, delivery):
+        self.start()
+        self.classify(delivery)
+        if self._queue.full(delivery.priority):
+            raise queue.Full
+        self.store.append(delivery)
+        # Once stored the delivery must not be dropped, block instead of raising
+        self._queue.put(delivery)
+
+    def stats(self):
+        stats = super().stats()
+        stats["failed_stored"] = self.store.counts().get("failed", 0)
+        stats["overflow"] = len(self._overflow)
+        return stats
+
+    def start(self):
+        super().start()
+        if self._recovered:
+            return
+        with self._lock:
+            if self._recovered:
+                return
+            self._recovered = True
+        for delivery in self.store.recover():
+            self._enqueue(self.classify(delivery))
+        if self._overflow:
+            LOG.warning(
+                "Delivery queue is full, %d recovered deliveries wait for room",
+                len(self._overflow),
+            )
+            # The workers may have made room meanwhile
+            self._feed()
+
+    def _enqueue(self, delivery):
+        """Put a claimed delivery on the queue, or keep it in the overflow when the queue is full"""
+        try:
+            self._queue.put_nowait(delivery)
+            return True
+        except queue.Full:
+            self._overflow.append(delivery)
+            return False
+
+    def _feed(self):
+        # One pass, a priority without room must not hold back the others
+        for _ in range(len(self._overflow)):
+            try:
+                delivery = self._overflow.popleft()
+            except IndexError:
+                return
+            try:
+                self._queue.put_nowait(delivery)
+            except queue.Full:
+                self._overflow.append(delivery)
+
+    def _on_success(self, delivery):
+        self.store.ack(delivery)
+
+    def _on_defer_dropped(self, delivery):
+        self._overflow.append(delivery)
+        LOG.warning(
+            "Delivery queue is full, keeping deferred %r until there is room", delivery
+        )
+        self._feed()
+
+    def _on_failure(self, delivery):
+        if delivery.attempts < self.max_attempts:
+            self.store.retry(delivery)
+            if not self._enqueue(delivery):
+                LOG.warning(
+                    "Delivery queue is full, retrying %r once there is room", delivery
+                )
+        else:
+            LOG.error("Giving up on %r after %d attempts", delivery, delivery.attempts)
+            self.store.dead_letter(delivery)
@@ -0,0 +1,285 @@
+"""Durable SQLite store for accepted webhook deliveries"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from .queue import Delivery
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BATCH_INTERVAL = 0.005
+DEFAULT_BATCH_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    delivery_id TEXT,
+    event TEXT NOT NULL,
+    action TEXT,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    received_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    -- `process_token` of the process handling the delivery
+    claimed_by TEXT
+)
+"""
+
+
+class _Write(object):
+    def __init__(self, sql, params, wait=False):
+        self.sql = sql
+        self.params = params
+        self.rowid = None
+        self.error = None
+        self.done = threading.Event() if wait else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as handle:
+            return handle.read().strip()
+    except OSError:
+        return None
+
+
+def _start_time(pid):
+    """Start time of a process in clock ticks since boot, None where /proc is not available"""
+    try:
+        with open("/proc/%d/stat" % pid) as handle:
+            # The command name may contain spaces, the fields after it are fixed
+            return handle.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+_token = (None, None)
+
+
+def process_token():
+    """Identifies this process across PID reuse, e.g. by the workers of a restarted container.
+
+    `pid:boot_id:start_time` where /proc is available, `pid:uuid` otherwise. Created anew
+    after a fork.
+    """
+    global _token
+    pid, token = _token
+    if pid != os.getpid():
+        pid = os.getpid()
+        boot_id, start_time = _boot_id(), _start_time(pid)
+        if boot_id and start_time:
+            token = "%d:%s:%s" % (pid, boot_id, start_time)
+        else:
+            token = "%d:%s" % (pid, uuid.uuid4().hex)
+        _token = (pid, token)
+    return token
+
+
+def _claim_alive(claimed_by):
+    """Whether the process that claimed a row is still running"""
+    pid, _, rest = str(claimed_by).partition(":")
+    if not rest or not pid.isdigit():
+        # Claimed by a previous version, which did not survive the restart that upgraded it
+        return False
+    if claimed_by == process_token():
+        return True
+    if not _pid_alive(int(pid)):
+        return False
+    boot_id, _, start_time = rest.partition(":")
+    if start_time:
+        # Alive when a process with this PID started at the same time since the same boot
+        return boot_id == _boot_id() and start_time == _start_time(int(pid))
+    # Without /proc a live PID is all there is to go by
+    return True
+
+
+class DeliveryStore(object):
+    """SQLite (WAL mode) log of deliveries that were acknowledged but not yet processed.
+
+    All writes go through a single writer thread which commits them in groups, so a
+    burst of deliveries shares one fsync. `append` only returns once its delivery is
+    on disk. Rows are claimed by the process that stored them (see `process_token`), rows
+    of processes that no longer exist are reclaimed by `recover`.
+
+    Arguments:
+        path {str} -- Path of the SQLite database
+
+    Keyword Arguments:
+        batch_interval {float} -- Seconds to wait for more writes before committing (default: {0.005})
+        batch_size {int} -- Maximum number of writes per commit (default: {256})
+    """
+
+    def __init__(
+        self, path, batch_interval=DEFAULT_BATCH_INTERVAL, batch_size=DEFAULT_BATCH_SIZE
+    ):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        self._pending = []
+        self._cond = threading.Condition()
+        self._writer = None
+        self._pid = None
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def append(self, delivery):
+        """Persist a delivery, returns once it is committed"""
+        write = _Write(
+            "INSERT INTO deliveries "
+            "(delivery_id, event, action, headers, body, received_at, state, claimed_by) "
+            "VALUES (?, ?, ?, ?, ?, ?, 'claimed', ?)",
+            (
+                delivery.id,
+                delivery.event,
+                delivery.action,
+                json.dumps(delivery.headers),
+                delivery.body,
+                delivery.received_at,
+                process_token(),
+            ),
+            wait=True,
+        )
+        self._submit(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        delivery.store_id = write.rowid
+        return delivery
+
+    def ack(self, delivery):
+        """Remove a processed delivery"""
+        self._submit(
+            _Write("DELETE FROM deliveries WHERE id = ?", (delivery.store_id,))
+        )
+
+    def retry(self, delivery):
+        """Record a failed attempt, the delivery stays claimed"""
+        self._submit(
+            _Write(
+                "UPDATE deliveries SET attempts = ? WHERE id = ?",
+                (delivery.attempts, delivery.store_id),
+            )
+        )
+
+    def dead_letter(self, delivery):
+        """Keep a delivery that exhausted its attempts for manual inspection"""
+        self._submit(
+            _Write(
+                "UPDATE deliveries SET state = 'failed', attempts = ?, claimed_by = NULL WHERE id = ?",
+                (delivery.attempts, delivery.store_id),
+            )
+        )
+
+    def recover(self):
+        """Claim the deliveries of crashed or stopped processes, returns them oldest first"""
+        recovered = []
+        with closing(self._connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT id, claimed_by FROM deliveries WHERE state != 'failed' ORDER BY id"
+            ).fetchall()
+            for rowid, claimed_by in rows:
+                if claimed_by is not None and _claim_alive(claimed_by):
+                    continue
+                cursor = connection.execute(
+                    "UPDATE deliveries SET state = 'claimed', claimed_by = ? "
+                    "WHERE id = ? AND claimed_by IS ?",
+                    (process_token(), rowid, claimed_by),
+                )
+                if not cursor.rowcount:
+                    continue
+
+                event, action, headers, body, received_at, attempts = (
+                    connection.execute(
+                        "SELECT event, action, headers, body, received_at, attempts "
+                        "FROM deliveries WHERE id = ?",
+                        (rowid,),
+                    ).fetchone()
+                )
+                delivery = Delivery(event, action, json.loads(headers), body)
+                delivery.received_at = received_at
+                delivery.attempts = attempts
+                delivery.store_id = rowid
+                recovered.append(delivery)
+
+        if recovered:
+            LOG.warning("Recovered %d unprocessed deliveries", len(recovered))
+        return recovered
+
+    def counts(self):
+        with closing(self._connect()) as connection:
+            return dict(
+                connection.execute(
+                    "SELECT state, COUNT(*) FROM deliveries GROUP BY state"
+                ).fetchall()
+            )
+
+    def flush(self):
+        """Block until all submitted writes are committed"""
+        write = _Write("SELECT 1", (), wait=True)
+        self._submit(write)
+        write.done.wait()
+
+    def _submit(self, write):
+        with self._cond:
+            # The writer thread does not survive a fork, start one per process
+            if self._writer is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pending = []
+                self._writer = threading.Thread(
+                    target=self._write_loop, name="githubapp-store-writer", daemon=True
+                )
+                self._writer.start()
+            self._pending.append(write)
+            self._cond.notify()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            # Give concurrent requests a moment to join this commit
+            time.sleep(self.batch_interval)
+            with self._cond:
+                batch = self._pending[: self.batch_size]
+                del self._pending[: self.batch_size]
+
+            error = None
+            try:
+                with connection:
+                    for write in batch:
+                        write.rowid = connection.execute(
+                            write.sql, write.params
+                        ).lastrowid
+            except sqlite3.Error as e:
+                LOG.error("Failed to write %d deliveries :: %s", len(batch), e)
+                error = e
+
+            for write in batch:
+                write.error = error
+                if write.done is not None:
+                    write.done.set()
@@ -0,0 +1,232 @@
+"""Process-wide caches of GitHub App JWTs and installation access tokens"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import dateutil.parser
+import jwt
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_MARGIN = 300
+
+# GitHub rejects app JWTs living longer than 10 minutes, `iat` is backdated for clock drift
+APP_JWT_LIFETIME = 600
+APP_JWT_CLOCK_DRIFT = 60
+APP_JWT_REFRESH_MARGIN = 60
+
+
+def load_private_key(key):
+    """Parse a PEM encoded private key (bytes or utf-8 string) into a key object"""
+    if hasattr(key, "encode"):
+        key = key.encode("utf-8")
+    return load_pem_private_key(key, password=None)
+
+
+class AppToken(object):
+    """Signed GitHub App JWT shared by every app-level request.
+
+    The private key is parsed once and the JWT is only re-signed shortly before it expires.
+
+    Arguments:
+        private_key {object} -- Private key object, see `load_private_key`
+        app_id {int} -- GitHub App ID
+    """
+
+    def __init__(self, private_key, app_id):
+        self.private_key = private_key
+        self.app_id = app_id
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _sign(self):
+        now = int(time.time())
+        expires_at = now - APP_JWT_CLOCK_DRIFT + APP_JWT_LIFETIME
+        payload = {
+            "iat": now - APP_JWT_CLOCK_DRIFT,
+            "exp": expires_at,
+            "iss": str(self.app_id),
+        }
+        return jwt.encode(payload, self.private_key, algorithm="RS256"), expires_at
+
+    def get(self):
+        """Return the current JWT and the number of seconds it is still valid for"""
+        with self._lock:
+            if self._expires_at - time.time() <= APP_JWT_REFRESH_MARGIN:
+                LOG.debug("Signing new app token")
+                self._token, self._expires_at = self._sign()
+            return self._token, int(self._expires_at - time.time())
+
+
+class InstallationToken(object):
+    """Installation access token as returned by `/app/installations/{id}/access_tokens`"""
+
+    def __init__(self, token, expires_at):
+        self.token = token
+        self.expires_at_str = expires_at
+        self.expires_at = dateutil.parser.parse(expires_at)
+
+    def __repr__(self):
+        return "installation token {}... expiring at {}".format(
+            self.token[:4], self.expires_at_str
+        )
+
+    def as_json(self):
+        """Token in the format github3's `app_installation_token_auth` expects"""
+        return {"token": self.token, "expires_at": self.expires_at_str}
+
+    def expires_within(self, seconds):
+        now = datetime.now(timezone.utc)
+        return now + timedelta(seconds=seconds) >= self.expires_at
+
+    @property
+    def expired(self):
+        return self.expires_within(0)
+
+    @property
+    def seconds_left(self):
+        return (self.expires_at - datetime.now(timezone.utc)).total_seconds()
+
+
+class InstallationTokenCache(object):
+    """Thread-safe cache of installation access tokens keyed by installation ID.
+
+    Tokens are reused until they expire. Once a token enters its refresh margin it is
+    still handed out, while a single background thread mints its replacement.
+    With a shared `backend` tokens minted by one worker process are reused by the others.
+
+    Keyword Arguments:
+        refresh_margin {int} -- Seconds before `expires_at` to start refreshing (default: {300})
+        backend {CacheBackend} -- Shared cache of tokens (default: {None})
+    """
+
+    def __init__(self, refresh_margin=DEFAULT_REFRESH_MARGIN, backend=None):
+        self.refresh_margin = refresh_margin
+        self.backend = backend
+        self._tokens = {}
+        self._locks = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _installation_lock(self, installation_id):
+        with self._lock:
+            if installation_id not in self._locks:
+                self._locks[installation_id] = threading.Lock()
+            return self._locks[installation_id]
+
+    def get(self, installation_id, mint):
+        """Return a valid token for the installation.
+
+        Arguments:
+            installation_id {int} -- GitHub App installation ID
+            mint {callable} -- Called with no arguments, returns a new `InstallationToken`
+        """
+        token = self._tokens.get(installation_id)
+        if token is not None and not token.expired:
+            if token.expires_within(self.refresh_margin):
+                self._refresh_in_background(installation_id, mint)
+            return token
+
+        with self._installation_lock(installation_id):
+            # Another thread may have minted the token while we waited
+            token = self._tokens.get(installation_id)
+            if token is not None and not token.expired:
+                return token
+
+            token = self._load(installation_id)
+            if token is None:
+                LOG.debug("Minting installation token :: %s", installation_id)
+                token = mint()
+                self._store(installation_id, token)
+            self._tokens[installation_id] = token
+            return token
+
+    def invalidate(self, installation_id=None, token=None):
+        """Drop the cached token for an installation, or all tokens.
+
+        With `token` (the string GitHub rejected) a cached token is only dropped while it is
+        still that token, so concurrent requests failing with the same token mint one replacement.
+        """
+        with self._lock:
+            if installation_id is None:
+                if self.backend is not None:
+                    for key in self.backend.keys("installation_token:"):
+                        self.backend.delete(key)
+                self._tokens.clear()
+                return
+
+            cached = self._tokens.get(installation_id)
+            if token is None or (cached is not None and cached.token == token):
+                self._tokens.pop(installation_id, None)
+            if self.backend is not None:
+                key = f"installation_token:{installation_id}"
+                data = self.backend.get(key) if token is not None else None
+                if token is None or (data is not None and data["token"] == token):
+                    self.backend.delete(key)
+
+    def renew(self, installation_id, rejected, mint):
+        """Replace the token GitHub rejected before it expired (e.g. revoked) and return a valid one.
+
+        Arguments:
+            installation_id {int} -- GitHub App installation ID
+            rejected {str} -- Token a request was answered `401 Unauthorized` for
+            mint {callable} -- Called with no arguments, returns a new `InstallationToken`
+        """
+        with self._installation_lock(installation_id):
+            self.invalidate(installation_id, token=rejected)
+        return self.get(installation_id, mint)
+
+    def _load(self, installation_id):
+        """Token another process stored in the shared backend, unless it needs refreshing"""
+        if self.backend is None:
+            return None
+        data = self.backend.get(f"installation_token:{installation_id}")
+        if data is None:
+            return None
+        token = InstallationToken(data["token"], data["expires_at"])
+        if token.expires_within(self.refresh_margin):
+            return None
+        LOG.debug("Reusing shared installation token :: %s", installation_id)
+        return token
+
+    def _store(self, installation_id, token):
+        if self.backend is not None:
+            self.backend.set(
+                f"installation_token:{installation_id}",
+                token.as_json(),
+                ttl=token.seconds_left,
+            )
+
+    def _refresh_in_background(self, installation_id, mint):
+        with self._lock:
+            if installation_id in self._refreshing:
+                return
+            self._refreshing.add(installation_id)
+
+        thread = threading.Thread(
+            target=self._refresh,
+            args=(installation_id, mint),
+            name=f"githubapp-token-refresh-{installation_id}",
+            daemon=True,
+        )
+        thread.start()
+
+    def _refresh(self, installation_id, mint):
+        try:
+            with self._installation_lock(installation_id):
+                token = self._load(installation_id)
+                if token is None:
+                    LOG.debug("Refreshing installation token :: %s", installation_id)
+                    token = mint()
+                    self._store(installation_id, token)
+                self._tokens[installation_id] = token
+        except Exception as e:
+            # The current token is still valid, the next request will try again
+            LOG.warning(f"Failed to refresh installation token :: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(installation_id)
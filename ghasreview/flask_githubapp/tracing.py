@@ -0,0 +1,344 @@
+"""Spans of hook deliveries in the OpenTelemetry data model, exported to a pluggable exporter"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LOG = logging.getLogger(__name__)
+
+SPAN_KIND_INTERNAL = "SPAN_KIND_INTERNAL"
+SPAN_KIND_SERVER = "SPAN_KIND_SERVER"
+SPAN_KIND_CLIENT = "SPAN_KIND_CLIENT"
+SPAN_KIND_CONSUMER = "SPAN_KIND_CONSUMER"
+
+STATUS_UNSET = "STATUS_CODE_UNSET"
+STATUS_OK = "STATUS_CODE_OK"
+STATUS_ERROR = "STATUS_CODE_ERROR"
+
+# Span the code running in this context belongs to, copied into threads started with the context
+current_span_var = contextvars.ContextVar("githubapp_span", default=None)
+
+
+def trace_id_for(delivery_id):
+    """Trace ID of a delivery, the `X-GitHub-Delivery` GUID so every node handling it shares the trace"""
+    try:
+        return uuid.UUID(delivery_id).hex
+    except (TypeError, ValueError, AttributeError):
+        return "%032x" % random.getrandbits(128)
+
+
+def _span_id():
+    return "%016x" % random.getrandbits(64)
+
+
+class Span(object):
+    """An operation within a trace, see https://opentelemetry.io/docs/concepts/signals/traces/#spans"""
+
+    def __init__(
+        self,
+        tracer,
+        name,
+        trace_id,
+        parent_id=None,
+        kind=SPAN_KIND_INTERNAL,
+        attributes=None,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _span_id()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = {}
+        self.set_attributes(attributes or {})
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = None
+        self.start_time = time.time_ns()
+        self.end_time = None
+
+    def is_recording(self):
+        return self.end_time is None
+
+    def update_name(self, name):
+        self.name = name
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def set_status(self, status, message=None):
+        self.status = status
+        self.status_message = message
+
+    def record_exception(self, exception):
+        self.events.append(
+            {
+                "name": "exception",
+                "timeUnixNano": time.time_ns(),
+                "attributes": {
+                    "exception.type": type(exception).__name__,
+                    "exception.message": str(exception),
+                },
+            }
+        )
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+            self.tracer._export(self)
+
+    def to_dict(self):
+        """Span in the OTLP JSON encoding"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": _attributes(self.attributes),
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = [
+                dict(
+                    event,
+                    timeUnixNano=str(event["timeUnixNano"]),
+                    attributes=_attributes(event["attributes"]),
+                )
+                for event in self.events
+            ]
+        return span
+
+    def __repr__(self):
+        return "<Span {} {}/{}>".format(self.name, self.trace_id, self.span_id)
+
+
+class NonRecordingSpan(object):
+    """Span handed out while tracing is disabled, all operations are ignored"""
+
+    trace_id = None
+    span_id = None
+
+    def is_recording(self):
+        return False
+
+    def update_name(self, name):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def set_status(self, status, message=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+NON_RECORDING_SPAN = NonRecordingSpan()
+
+
+def _attributes(attributes):
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        values.append({"key": key, "value": encoded})
+    return values
+
+
+class SpanExporter(object):
+    """Interface of the destination of finished spans, called with each span as it ends"""
+
+    def export(self, spans, resource):
+        """Export finished spans
+
+        Arguments:
+            spans {list} -- Finished `Span` objects
+            resource {dict} -- Attributes of the process that recorded them
+        """
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class InMemorySpanExporter(SpanExporter):
+    """Keeps finished spans in memory, e.g. to inspect them in tests"""
+
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans, resource):
+        with self._lock:
+            self._spans.extend(spans)
+
+    def get_finished_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans = []
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one OTLP JSON `ResourceSpans` object per line.
+
+    Every process appends to the same file with whole-line writes, so the file of a node holds the
+    spans of all its workers.
+
+    Arguments:
+        path {str} -- Path of the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans, resource):
+        line = json.dumps(
+            {
+                "resource": {"attributes": _attributes(resource)},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "flask_githubapp"},
+                        "spans": [span.to_dict() for span in spans],
+                    }
+                ],
+            }
+        )
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            try:
+                os.write(fd, (line + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+
+
+class Tracer(object):
+    """Creates spans and hands finished spans to `exporter`, tracing is disabled without an exporter.
+
+    Keyword Arguments:
+        exporter {SpanExporter} -- Destination of finished spans (default: {None})
+        service_name {str} -- `service.name` of the spans (default: {'flask_githubapp'})
+    """
+
+    def __init__(self, exporter=None, service_name="flask_githubapp"):
+        self.exporter = exporter
+        self.service_name = service_name
+
+    @property
+    def enabled(self):
+        return self.exporter is not None
+
+    @property
+    def resource(self):
+        return {
+            "service.name": self.service_name,
+            "host.name": socket.gethostname(),
+            "process.pid": os.getpid(),
+        }
+
+    @contextmanager
+    def start_span(
+        self,
+        name,
+        kind=SPAN_KIND_INTERNAL,
+        attributes=None,
+        trace_id=None,
+        parent_id=None,
+    ):
+        """Context of a span, a child of the current span unless `trace_id` starts a new root.
+
+        Exceptions raised in the context are recorded and set the error status of the span.
+        """
+        if not self.enabled:
+            yield NON_RECORDING_SPAN
+            return
+
+        parent = current_span_var.get()
+        if trace_id is None and parent is not None:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+        span = Span(
+            self, name, trace_id or trace_id_for(None), parent_id, kind, attributes
+        )
+        token = current_span_var.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.record_exception(e)
+            span.set_status(STATUS_ERROR, str(e))
+            raise
+        finally:
+            current_span_var.reset(token)
+            span.end()
+
+    def _export(self, span):
+        try:
+            self.exporter.export([span], self.resource)
+        except Exception:
+            LOG.exception("Failed to export %r", span)
+
+
+# Tracer of the process, configured by `GitHubApp.init_app`
+tracer = Tracer()
+
+
+def current_span():
+    """Span of the running code, a non-recording span outside of a trace"""
+    return current_span_var.get() or NON_RECORDING_SPAN
+
+
+def traced(name=None, kind=SPAN_KIND_INTERNAL):
+    """Decorator running each call of the function in a child span of the current span.
+
+    Keyword Arguments:
+        name {str} -- Name of the span (default: {the qualified name of the function})
+        kind {str} -- Kind of the span (default: {SPAN_KIND_INTERNAL})
+    """
+
+    def decorator(f):
+        span_name = name or f.__qualname__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled or current_span_var.get() is None:
+                return f(*args, **kwargs)
+            with tracer.start_span(span_name, kind=kind):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,374 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import bisect
+import glob
+import json
+import os
+import re
+import threading
+import time
+import logging
+
+logger = logging.getLogger("Metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# GitHub API paths reduced to their endpoint, so every repository shares one series
+ENDPOINT_TEMPLATES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(pattern), template)
+    for pattern, template in [
+        (
+            r"^/app/installations/[^/]+/access_tokens$",
+            "/app/installations/{installation_id}/access_tokens",
+        ),
+        (r"^/app$", "/app"),
+        (
+            r"^/orgs/[^/]+/teams/[^/]+/memberships/[^/]+$",
+            "/orgs/{org}/teams/{team_slug}/memberships/{username}",
+        ),
+        (r"^/orgs/[^/]+/teams/[^/]+/members$", "/orgs/{org}/teams/{team_slug}/members"),
+        (r"^/orgs/[^/]+/teams/[^/]+$", "/orgs/{org}/teams/{team_slug}"),
+        (r"^/orgs/[^/]+/teams$", "/orgs/{org}/teams"),
+        (
+            r"^/repos/[^/]+/[^/]+/(code-scanning|dependabot|secret-scanning)/alerts/[^/]+$",
+            r"/repos/{owner}/{repo}/\1/alerts/{alert_number}",
+        ),
+        (
+            r"^/repos/[^/]+/[^/]+/issues/[^/]+/comments$",
+            "/repos/{owner}/{repo}/issues/{issue_number}/comments",
+        ),
+        (
+            r"^/repos/[^/]+/[^/]+/pulls/[^/]+/requested_reviewers$",
+            "/repos/{owner}/{repo}/pulls/{pull_number}/requested_reviewers",
+        ),
+        (r"^(/api)?/graphql$", "/graphql"),
+    ]
+]
+
+
+def endpointTemplate(path: str) -> str:
+    """`/repos/octo/app/issues/1/comments` -> `/repos/{owner}/{repo}/issues/{issue_number}/comments`"""
+    path = re.sub(r"^/api/v3", "", path.split("?")[0]).rstrip("/") or "/"
+    for pattern, template in ENDPOINT_TEMPLATES:
+        match = pattern.match(path)
+        if match:
+            return match.expand(template)
+    return "other"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return (
+        repr(float(value))
+        if isinstance(value, float) and not value.is_integer()
+        else str(int(value))
+    )
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {json.dumps(key): value for key, value in self.values.items()}
+
+    def render(self, values: Dict) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(
+                f"{self.name}{_labels(self.labels, json.loads(key))} {_number(value)}"
+            )
+        return lines
+
+    @staticmethod
+    def merge(total: Dict, values: Dict):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, count, sum]
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * (len(self.buckets) + 3)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                json.dumps(key): list(series) for key, series in self.values.items()
+            }
+
+    def render(self, values: Dict) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(values.items()):
+            labels = json.loads(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(
+                    f"{self.name}_bucket{_labels(self.labels, labels, le)} {_number(cumulative)}"
+                )
+            le = 'le="+Inf"'
+            lines.append(
+                f"{self.name}_bucket{_labels(self.labels, labels, le)} {_number(series[-2])}"
+            )
+            lines.append(
+                f"{self.name}_count{_labels(self.labels, labels)} {_number(series[-2])}"
+            )
+            lines.append(
+                f"{self.name}_sum{_labels(self.labels, labels)} {_number(series[-1])}"
+            )
+        return lines
+
+    @staticmethod
+    def merge(total: Dict, values: Dict):
+        for key, series in values.items():
+            if key not in total:
+                total[key] = list(series)
+            else:
+                total[key] = [a + b for a, b in zip(total[key], series)]
+
+
+class Gauge:
+    """Value read from the process serving the scrape when it is rendered"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]],
+    ):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            for labels, value in self.collect():
+                if value is not None:
+                    lines.append(
+                        f"{self.name}{_labels(self.labels, labels)} {_number(value)}"
+                    )
+        except Exception as e:
+            logger.warning(f"Failed to collect {self.name} :: {e}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms in the Prometheus text format.
+
+    Every worker process counts on its own. With `directory` set each process writes its
+    counts there (at most every `flush_interval` seconds) and a scrape of any worker sums
+    the counts of all of them, including workers that exited. Gauges always describe the
+    process serving the scrape.
+
+    The files of exited workers are folded into one by `retire`, and `clear` drops the
+    counts of a previous run, see `gunicorn_config.py`.
+    """
+
+    EXITED = "metrics-exited.json"
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics: Dict[str, object] = {}
+        self.gauges: List[Gauge] = []
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(
+        self, directory: Optional[str] = None, flush_interval: Optional[float] = None
+    ):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Tuple[str, ...] = (), **kwargs
+    ) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, labels, **kwargs))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...], collect: Callable):
+        self.gauges.append(Gauge(name, help, labels, collect))
+
+    def changed(self):
+        """Called after every update, writes the counts of this process when they are due"""
+        if (
+            not self.directory
+            or time.monotonic() - self._flushed_at < self.flush_interval
+        ):
+            return
+        self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            snapshot = {
+                name: metric.snapshot() for name, metric in self.metrics.items()
+            }
+            self._write(
+                os.path.join(self.directory, f"metrics-{os.getpid()}.json"), snapshot
+            )
+
+    def retire(self, pid: int):
+        """Add the counts of an exited worker process to those of all exited workers and
+        remove its file, so the directory does not grow with every worker ever started
+        """
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f"metrics-{pid}.json")
+        snapshot = self._read(path)
+        if snapshot is None:
+            return
+        exited = os.path.join(self.directory, self.EXITED)
+        totals = self._merge([self._read(exited) or {}, snapshot])
+        if self._write(exited, totals):
+            os.remove(path)
+
+    def clear(self):
+        """Remove the counts of all processes, e.g. of a previous run when the server starts"""
+        if not self.directory:
+            return
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json*")):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Failed to remove metrics :: {e}")
+
+    @staticmethod
+    def _read(path: str) -> Optional[Dict]:
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write(path: str, snapshot: Dict) -> bool:
+        try:
+            with open(path + ".tmp", "w") as handle:
+                json.dump(snapshot, handle)
+            os.replace(path + ".tmp", path)
+            return True
+        except OSError as e:
+            logger.warning(f"Failed to write metrics :: {e}")
+            return False
+
+    def _merge(self, snapshots: Iterable[Dict]) -> Dict[str, Dict]:
+        totals: Dict[str, Dict] = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                if name in self.metrics:
+                    self.metrics[name].merge(totals[name], values)
+        return totals
+
+    def _collect(self) -> Dict[str, Dict]:
+        if not self.directory:
+            return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+        self.flush()
+        snapshots = (
+            self._read(path)
+            for path in glob.glob(os.path.join(self.directory, "metrics-*.json"))
+        )
+        return self._merge(snapshot for snapshot in snapshots if snapshot is not None)
+
+    def render(self) -> str:
+        values = self._collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines += metric.render(values.get(name, {}))
+        for gauge in self.gauges:
+            lines += gauge.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+hook_duration = registry.histogram(
+    "ghas_webhook_duration_seconds",
+    "Time spent running the handlers of a webhook",
+    ("event", "action", "outcome"),
+)
+token_duration = registry.histogram(
+    "ghas_installation_token_mint_duration_seconds",
+    "Time spent minting installation access tokens",
+    ("outcome",),
+)
+api_duration = registry.histogram(
+    "ghas_github_api_request_duration_seconds",
+    "Latency of GitHub API requests by endpoint",
+    ("method", "endpoint"),
+)
+api_responses = registry.counter(
+    "ghas_github_api_responses_total",
+    "GitHub API responses by endpoint and status code",
+    ("method", "endpoint", "status"),
+)
+
+
+def observeApiCall(method: str, url: str, duration: float, status: str):
+    endpoint = endpointTemplate(re.sub(r"^[a-z]+://[^/]+", "", url))
+    api_duration.observe(duration, method, endpoint)
+    api_responses.inc(method, endpoint, status)
+    registry.changed()
+
+
+def observeHook(event: str, action: Optional[str], duration: float, outcome: str):
+    hook_duration.observe(duration, event, action or "", outcome)
+    registry.changed()
+
+
+def observeTokenMint(duration: float, outcome: str):
+    token_duration.observe(duration, outcome)
+    registry.changed()
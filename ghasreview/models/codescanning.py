@@ -2,6 +2,8 @@ from typing import Dict
 import logging
 import json
 
+from ghasreview.flask_githubapp.tracing import traced
+
 logger = logging.getLogger("CodeScanningAlert")
 
 
@@ -16,6 +18,9 @@ class CodeScanningAlert:
 
     ghas_team_name: str = ""
 
+    # Backend used to read the state of the PR: "rest" or "graphql"
+    pr_backend: str = "rest"
+
     @property
     def client(self):
         return self._client
@@ -38,7 +43,6 @@ class CodeScanningAlert:
             "ref"
         ) or self.payload.get("ref", "")
 
-
     def hasDismissedComment(self) -> bool:
         return self.payload.get("dismissed_comment") is not None
 
@@ -102,7 +106,7 @@ class CodeScanningAlert:
         return True
 
     def createProjectBoard(self, board_name: str) -> bool:
-        logger.warning(f"Creating Org level is currently not present")
+        logger.warning("Creating Org level is currently not present")
         return False
 
     def getBotUsername(self) -> str:
@@ -118,16 +122,7 @@ class CodeScanningAlert:
             logger.warning("Bot username could not be determined.")
             return False
 
-        pr_comments_req = self.client.getPRComments(owner, repo, pull_number)
-        pr_comments = pr_comments_req.json()
-        if pr_comments_req.status_code != 200:
-            logger.warning(f"Error getting PR comments: {pr_comments_req.status_code}")
-            return False
-
-        for comment in pr_comments:
-            if comment.get("user", {}).get("login") == bot_username:
-                return True
-        return False
+        return self.client.hasUserCommented(owner, repo, pull_number, bot_username)
 
     def addTeamToPullRequest(self) -> bool:
         org_name = self.owner
@@ -138,3 +133,49 @@ class CodeScanningAlert:
         return self.client.addTeamToPullRequestReviewer(
             team_name, org_name, repo_name, pull_number
         )
+
+    @traced()
+    def notifyPullRequest(self) -> bool:
+        """Comment on the PR and request a review from the GHAS team, once per PR.
+
+        Returns True if the PR has been notified, now or before.
+        """
+        owner = self.owner
+        repo = self.repository
+        pull_number = self.pullRequest()
+
+        state = None
+        if self.pr_backend == "graphql":
+            state = self.client.getPRNotificationState(owner, repo, pull_number)
+            if state is None:
+                logger.warning(
+                    "Unable to read PR state using GraphQL, falling back to REST"
+                )
+
+        if state is None:
+            # The comment scan and the reviewer lookup are independent reads
+            commented, reviewers = self.client.fanOut(
+                self.hasCommentedInPR,
+                lambda: self.client.getPRReviewers(owner, repo, pull_number),
+            )
+            team_reviewers = []
+            if reviewers.status_code == 200:
+                team_reviewers = [
+                    team["name"] for team in reviewers.json().get("teams", [])
+                ]
+            state = {"commented": commented, "team_reviewers": team_reviewers}
+
+        if state["commented"]:
+            return True
+
+        # Both writes are independent of each other
+        calls = [self.createCommentOnPR]
+        if self.ghas_team_name not in state["team_reviewers"]:
+            calls.append(
+                lambda: self.client.requestTeamReview(
+                    self.ghas_team_name, owner, repo, pull_number
+                )
+            )
+        else:
+            logger.debug("Team is already a reviewer. Skipping")
+        return all(self.client.fanOut(*calls))
@@ -0,0 +1,137 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger("NotifiedIndex")
+
+# (owner, repo, pull request number)
+PullRequestKey = Tuple[str, str, int]
+
+
+def pullRequestKey(owner: str, repo: str, pull_number: int) -> PullRequestKey:
+    # Owner and repository names are case-insensitive on GitHub
+    return (owner.lower(), repo.lower(), int(pull_number))
+
+
+class NotifiedIndex:
+    """Per-process index of Pull Requests the bot has already commented on and
+    requested a review for.
+
+    Entries are removed when the Pull Request is closed, or after `max_age` seconds
+    for installations that do not send `pull_request` events.
+    """
+
+    def __init__(self, max_age: float = 30 * 24 * 3600, maxsize: int = 100000):
+        self.max_age = max_age
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: PullRequestKey) -> bool:
+        with self._lock:
+            notified_at = self._entries.get(key)
+            if notified_at is None:
+                return False
+            if time.time() - notified_at > self.max_age:
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key: PullRequestKey):
+        with self._lock:
+            self._entries[key] = time.time()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def remove(self, key: PullRequestKey):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteNotifiedIndex(NotifiedIndex):
+    """`NotifiedIndex` stored in SQLite, shared by all worker processes and kept across restarts"""
+
+    PRUNE_EVERY = 100
+
+    def __init__(
+        self, path: str, max_age: float = 30 * 24 * 3600, maxsize: int = 100000
+    ):
+        super().__init__(max_age=max_age, maxsize=maxsize)
+        self.path = path
+        self._local = threading.local()
+        self._inserts = 0
+
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS notified_pull_requests ("
+                "owner TEXT NOT NULL, repo TEXT NOT NULL, pull_number INTEGER NOT NULL, "
+                "notified_at REAL NOT NULL, PRIMARY KEY (owner, repo, pull_number))"
+            )
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # SQLite connections can not be shared between threads or with a forked child
+        connection: Optional[sqlite3.Connection] = getattr(
+            self._local, "connection", None
+        )
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def __contains__(self, key: PullRequestKey) -> bool:
+        row = self._connection.execute(
+            "SELECT 1 FROM notified_pull_requests "
+            "WHERE owner = ? AND repo = ? AND pull_number = ? AND notified_at >= ?",
+            (*key, time.time() - self.max_age),
+        ).fetchone()
+        return row is not None
+
+    def add(self, key: PullRequestKey):
+        now = time.time()
+        with self._connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO notified_pull_requests "
+                "(owner, repo, pull_number, notified_at) VALUES (?, ?, ?, ?)",
+                (*key, now),
+            )
+        self._inserts += 1
+        if self._inserts % self.PRUNE_EVERY == 0:
+            self._prune(now)
+
+    def remove(self, key: PullRequestKey):
+        with self._connection as connection:
+            connection.execute(
+                "DELETE FROM notified_pull_requests "
+                "WHERE owner = ? AND repo = ? AND pull_number = ?",
+                key,
+            )
+
+    def __len__(self) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM notified_pull_requests"
+        ).fetchone()[0]
+
+    def _prune(self, now: float):
+        with self._connection as connection:
+            connection.execute(
+                "DELETE FROM notified_pull_requests WHERE notified_at < ?",
+                (now - self.max_age,),
+            )
+            connection.execute(
+                "DELETE FROM notified_pull_requests WHERE rowid IN ("
+                "SELECT rowid FROM notified_pull_requests ORDER BY notified_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+        logger.debug(f"Pruned notified Pull Requests older than {self.max_age}s")
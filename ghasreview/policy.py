@@ -0,0 +1,175 @@
+"""Dismissal policies of the alert handlers.
+
+Each policy is a generator yielding the client calls it makes, so the synchronous handlers of
+`ghasreview.app` (with a `Client`, see `runPolicy`) and the coroutine handlers of `ghasreview.asgi`
+(with an `AsyncClient`, see `runPolicyAsync`) share one implementation.
+"""
+
+from typing import Any, Dict, Generator, Optional
+import logging
+
+from ghasreview.models import (
+    DependabotAlert,
+    CodeScanningAlert,
+    SecretScanningAlert,
+)
+
+logger = logging.getLogger("app")
+
+
+def runPolicy(policy: Generator) -> Any:
+    """Run a policy with a `Client`, whose calls have already returned when they are yielded"""
+    try:
+        result = next(policy)
+        while True:
+            result = policy.send(result)
+    except StopIteration as done:
+        return done.value
+
+
+async def runPolicyAsync(policy: Generator) -> Any:
+    """Run a policy with an `AsyncClient`, awaiting each call it yields"""
+    try:
+        call = next(policy)
+        while True:
+            call = policy.send(await call)
+    except StopIteration as done:
+        return done.value
+
+
+def reviewSecretScanningResolution(
+    client, alert: SecretScanningAlert, config: Dict
+) -> Generator:
+    # Check if the user is part of the security team
+    if (
+        yield client.isUserPartOfTeam(
+            alert.owner, config.get("GHAS_TEAM"), alert.getUser()
+        )
+    ):
+        return {"message": "User is part of the security team"}
+
+    # Open Alert back up
+    open_alert = yield client.reOpenSecretScanningAlert(
+        alert.owner, alert.repository, alert.id
+    )
+    if open_alert.status_code != 200:
+        logger.warning("Unable to re-open alert")
+        return None
+    return {"message": "Secret Scanning Alert Reopened"}
+
+
+def reviewDependabotDismissal(
+    client, alert: DependabotAlert, config: Dict
+) -> Generator:
+    # Check if the user is part of the security team
+    if (
+        yield client.isUserPartOfTeam(
+            alert.owner, config.get("GHAS_TEAM"), alert.getUser()
+        )
+    ):
+        return {"message": "User is part of the security team"}
+
+    # Open Alert back up
+    open_alert = yield client.reOpenDependabotAlert(
+        alert.owner, alert.repository, alert.id
+    )
+    if open_alert.status_code != 200:
+        logger.warning("Unable to re-open alert")
+        return None
+    return {"message": "Dependabot Alert Reopened"}
+
+
+def reviewCodeScanningDismissal(
+    client, alert: CodeScanningAlert, config: Dict
+) -> Generator:
+    team = config.get("GHAS_TEAM")
+    logger.info(
+        f"Processing Alert :: {alert.owner}/{alert.repository} => {alert.id} ({alert.ref})"
+    )
+
+    # Check if comment in alert
+    if config.get("GHAS_COMMENT_REQUIRED") and not alert.hasDismissedComment():
+        logger.debug(f"Comment required, reopeneing alert: {alert.id}")
+        open_alert = yield client.reOpenCodeScanningAlert(
+            alert.owner, alert.repository, alert.id
+        )
+        if open_alert.status_code != 200:
+            logger.error(f"Unable to re-open alert :: {alert.id}")
+            logger.error(
+                "This might be a permissions issue, please check the documentation for more details"
+            )
+            return {"message": "Unable to re-open alert"}
+        return {"message": "Comment required, re-opening alert"}
+
+    # Check tool and severity
+    ignored = ignoreCodeScanningDismissal(alert, config)
+    if ignored:
+        return ignored
+
+    # Check team exists and if the user is part of the security team, at the same time
+    team_exists, is_member = yield client.checkTeamMembership(
+        alert.owner, team, alert.getUser()
+    )
+    if not team_exists:
+        logger.info(f"GHAS Reviewer Team `{team}` does not exist, creating team.")
+        yield client.createTeam(alert.owner, team)
+
+    if team_exists and is_member:
+        logger.debug("User is part of security team, no action taken.")
+        return {"message": "User is part of the security team"}
+
+    logger.info(
+        f"User is not allowed to close alerts: {alert.getUser()} ({alert.owner}/{alert.repository} => {alert.id})"
+    )
+
+    # Open Alert back up
+    open_alert = yield client.reOpenCodeScanningAlert(
+        alert.owner, alert.repository, alert.id
+    )
+    if open_alert.status_code != 200:
+        logger.error(f"Unable to re-open alert :: {alert.id}")
+        logger.error(
+            "This might be a permissions issue, please check the documentation for more details"
+        )
+        return {"message": "Unable to re-open alert"}
+
+    if alert.isPR():
+        logger.debug("In PR request")
+
+    return {"message": "Code Scanning Alert Reopened"}
+
+
+def ignoreCodeScanningDismissal(
+    alert: CodeScanningAlert, config: Dict
+) -> Optional[Dict]:
+    """Response for dismissals of other tools or lower severities, None if the dismissal needs review"""
+    tool = config.get("GHAS_TOOL")
+    if tool and alert.tool != tool:
+        logger.debug(f"Tool is not in the list of approved tools: {alert.tool}")
+        return {"message": "Tool is not in the list of approved tools"}
+
+    # Severity check, if not high enough, do not involve security team
+    severities = config.get("GHAS_SEVERITIES")
+    if severities:
+        if alert.severity not in severities:
+            logger.debug(
+                f"Severity is not high enough to get security involved: {alert.severity}"
+            )
+            return {
+                "message": "Severity is not high enough to get security involved, doing nothing."
+            }
+        if (
+            alert.payload.get("alert", {})
+            .get("rule", {})
+            .get("security_severity_level", "")
+            not in severities
+        ):
+            logger.debug(
+                f"Security severity level is not high enough to get security involved: {alert.payload.get('alert', {}).get('rule', {}).get('security_severity_level', '')}"
+            )
+            return {
+                "message": "Security severity level is not high enough to get security involved, doing nothing."
+            }
+    else:
+        logger.debug("No severities provided, reopening all findings")
+    return None
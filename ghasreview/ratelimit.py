@@ -0,0 +1,238 @@
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+from ghasreview.flask_githubapp import GitHubAppDeferred
+
+logger = logging.getLogger("RateLimit")
+
+# Lower values are served first
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# Share of the primary limit each priority leaves untouched for more important calls
+RESERVES = {
+    PRIORITY_CRITICAL: 0.0,
+    PRIORITY_NORMAL: 0.05,
+    PRIORITY_LOW: 0.2,
+}
+
+# Budget of REST calls, GraphQL queries count against a separate `graphql` budget
+RESOURCE_CORE = "core"
+RESOURCE_GRAPHQL = "graphql"
+
+
+class RateLimitDeferred(GitHubAppDeferred):
+    """Raised instead of waiting long for the rate limit, the webhook is replayed later"""
+
+
+def resourceFor(url: str) -> str:
+    """Rate limit resource a call to `url` counts against"""
+    return (
+        RESOURCE_GRAPHQL
+        if url.split("?")[0].rstrip("/").endswith("/graphql")
+        else RESOURCE_CORE
+    )
+
+
+class Budget:
+    """Rate limit state of one installation and resource as last reported by GitHub"""
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset: float = 0
+        self.blocked_until: float = 0
+        self.last_request: float = 0
+        self.waiters: List[Tuple[int, int]] = []
+        self.cond = threading.Condition()
+
+    def toDict(self) -> Dict:
+        now = time.time()
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_in": max(round(self.reset - now), 0),
+            "blocked_for": max(round(self.blocked_until - now), 0),
+            "waiting": len(self.waiters),
+        }
+
+
+class RateLimitScheduler:
+    """Paces GitHub API calls per installation and resource (`core`, `graphql`, ...) using the
+    rate limit response headers.
+
+    Calls wait in a priority queue per budget. Once the remaining budget drops below
+    `pace_below` of the limit, calls are spread evenly until the limit resets. Lower
+    priorities stop at their reserve (see `RESERVES`) so security-critical calls keep the
+    last part of the budget. `Retry-After` and secondary rate limit responses block the
+    budget until GitHub allows calls again. No call waits longer than `max_wait` seconds.
+    Calls of `defer_priority` or less urgent, which would wait longer than `defer_after`
+    seconds, raise `RateLimitDeferred` instead of holding on to their thread.
+    """
+
+    def __init__(
+        self,
+        pace_below: float = 0.5,
+        max_wait: float = 300,
+        defer_after: float = 5,
+        defer_priority: int = PRIORITY_LOW,
+    ):
+        self.pace_below = pace_below
+        self.max_wait = max_wait
+        self.defer_after = defer_after
+        self.defer_priority = defer_priority
+        self._budgets: Dict[Tuple[Hashable, str], Budget] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def getBudget(self, key: Hashable, resource: str = RESOURCE_CORE) -> Budget:
+        with self._lock:
+            if (key, resource) not in self._budgets:
+                self._budgets[(key, resource)] = Budget()
+            return self._budgets[(key, resource)]
+
+    def budgets(self) -> Dict[str, Dict[str, Dict]]:
+        """Installation -> resource -> budget"""
+        with self._lock:
+            budgets = dict(self._budgets)
+        result: Dict[str, Dict[str, Dict]] = {}
+        for (key, resource), budget in budgets.items():
+            result.setdefault(str(key), {})[resource] = budget.toDict()
+        return result
+
+    def checkDefer(self, key: Hashable, priority: int, delay: float):
+        if priority >= self.defer_priority and delay > self.defer_after:
+            raise RateLimitDeferred(
+                f"Rate limit of {key} allows the call in {delay:.0f}s",
+                retry_after=delay,
+            )
+
+    def acquire(
+        self,
+        key: Hashable,
+        priority: int = PRIORITY_NORMAL,
+        resource: str = RESOURCE_CORE,
+    ):
+        """Block until a call of `priority` may be made for `key`"""
+        budget = self.getBudget(key, resource)
+        deadline = time.time() + self.max_wait
+        with budget.cond:
+            ticket = (priority, next(self._counter))
+            heapq.heappush(budget.waiters, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    delay = self._delay(budget, priority, now)
+                    if budget.waiters[0] == ticket and delay <= 0:
+                        break
+                    self.checkDefer(key, priority, delay)
+                    if now >= deadline:
+                        logger.warning(
+                            f"Waited {self.max_wait}s for rate limit :: {key}"
+                        )
+                        break
+                    if delay > 5:
+                        logger.debug(
+                            f"Rate limit :: {key} waiting {delay:.0f}s (priority {priority})"
+                        )
+                    budget.cond.wait(min(max(delay, 0.05), deadline - now, 1))
+            finally:
+                budget.waiters.remove(ticket)
+                heapq.heapify(budget.waiters)
+
+            budget.last_request = time.time()
+            if budget.remaining is not None:
+                budget.remaining -= 1
+            budget.cond.notify_all()
+
+    def tryAcquire(
+        self,
+        key: Hashable,
+        priority: int = PRIORITY_NORMAL,
+        resource: str = RESOURCE_CORE,
+    ) -> float:
+        """Take a call slot without blocking, returns 0 on success or the seconds to wait"""
+        budget = self.getBudget(key, resource)
+        with budget.cond:
+            now = time.time()
+            delay = self._delay(budget, priority, now)
+            if delay <= 0 and budget.waiters and budget.waiters[0][0] <= priority:
+                # Blocked callers of the same or a higher priority go first
+                delay = 0.05
+            if delay > 0:
+                return delay
+            budget.last_request = now
+            if budget.remaining is not None:
+                budget.remaining -= 1
+            budget.cond.notify_all()
+            return 0
+
+    async def acquireAsync(
+        self,
+        key: Hashable,
+        priority: int = PRIORITY_NORMAL,
+        resource: str = RESOURCE_CORE,
+    ):
+        """`acquire` for coroutines, waits on the event loop instead of blocking a thread"""
+        deadline = time.time() + self.max_wait
+        while True:
+            delay = self.tryAcquire(key, priority, resource)
+            if delay <= 0:
+                return
+            self.checkDefer(key, priority, delay)
+            if time.time() >= deadline:
+                logger.warning(f"Waited {self.max_wait}s for rate limit :: {key}")
+                return
+            await asyncio.sleep(min(delay, deadline - time.time(), 1))
+
+    def update(self, key: Hashable, response: Any, resource: str = RESOURCE_CORE):
+        """Record the rate limit headers of a response to a call made for `resource`"""
+        headers = response.headers
+        # GitHub names the budget the call counted against
+        resource = headers.get("X-RateLimit-Resource") or resource
+        budget = self.getBudget(key, resource)
+        now = time.time()
+        with budget.cond:
+            if headers.get("X-RateLimit-Remaining") is not None:
+                budget.remaining = int(headers["X-RateLimit-Remaining"])
+                budget.limit = (
+                    int(headers.get("X-RateLimit-Limit") or budget.limit or 0) or None
+                )
+                budget.reset = float(headers.get("X-RateLimit-Reset") or 0)
+
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                budget.blocked_until = now + float(retry_after)
+            elif response.status_code in (403, 429) and budget.remaining == 0:
+                budget.blocked_until = budget.reset
+            elif (
+                response.status_code in (403, 429)
+                and "rate limit" in response.text.lower()
+            ):
+                # Secondary rate limit without Retry-After, GitHub asks to wait a minute
+                budget.blocked_until = now + 60
+
+            if budget.blocked_until > now:
+                logger.warning(
+                    f"Rate limited :: {key} ({resource}) blocked for {budget.blocked_until - now:.0f}s"
+                )
+            budget.cond.notify_all()
+
+    def _delay(self, budget: Budget, priority: int, now: float) -> float:
+        if budget.blocked_until > now:
+            return budget.blocked_until - now
+        if budget.remaining is None or not budget.limit or budget.reset <= now:
+            return 0
+
+        if budget.remaining <= budget.limit * RESERVES.get(priority, 0):
+            return budget.reset - now
+        if budget.remaining < budget.limit * self.pace_below:
+            interval = (budget.reset - now) / max(budget.remaining, 1)
+            return budget.last_request + interval - now
+        return 0
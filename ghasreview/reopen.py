@@ -0,0 +1,140 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger("ReopenEngine")
+
+
+class ReopenRequest:
+    def __init__(self, client: Any, owner: str, repo: str, type: str, alert_id: int):
+        self.client = client
+        self.owner = owner
+        self.repo = repo
+        self.type = type
+        self.alert_id = alert_id
+        self.future: Future = Future()
+
+
+class ReopenEngine:
+    """Groups alert re-opens by installation and repository and runs each group
+    with bounded concurrency over the shared keep-alive connection pool.
+
+    A re-open of a repository with nothing in flight is sent at once on the calling
+    thread. Re-opens arriving while one of the same repository is in flight wait for
+    it and are then sent together as the next batch, so a lone re-open never waits
+    and a bulk dismissal is batched by the requests that pile up behind it. Every
+    re-open still goes through `Client.callApi`, so the batch is paced by the rate
+    limit scheduler of its installation.
+    """
+
+    def __init__(self, concurrency: int = 8):
+        self.concurrency = concurrency
+        self.results: deque = deque(maxlen=100)
+        # Repositories with a batch in flight, and the requests waiting behind it
+        self._waiting: Dict[Tuple, List[ReopenRequest]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def submit(
+        self, client: Any, owner: str, repo: str, type: str, alert_id: int
+    ) -> Future:
+        request = ReopenRequest(client, owner, repo, type, alert_id)
+        key = (client.getInstallationId(), owner, repo)
+        with self._lock:
+            waiting = self._waiting.get(key)
+            if waiting is not None:
+                waiting.append(request)
+                return request.future
+            self._waiting[key] = []
+
+        try:
+            self._runBatch([request])
+        finally:
+            self._next(key)
+        return request.future
+
+    def _next(self, key: Tuple):
+        """Send the requests that waited for the batch of `key` that just completed"""
+        with self._lock:
+            batch = self._waiting.pop(key, [])
+            if batch:
+                self._waiting[key] = []
+        if batch:
+            threading.Thread(
+                target=self._drain, args=(key, batch), name="reopen-batch", daemon=True
+            ).start()
+
+    def _drain(self, key: Tuple, batch: List[ReopenRequest]):
+        try:
+            self._runBatch(batch)
+        finally:
+            self._next(key)
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self.pending(),
+            "batches": list(self.results),
+        }
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(waiting) for waiting in self._waiting.values())
+
+    def _getExecutor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            # Threads do not survive a fork, a child builds its own pool
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix="reopen"
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _runBatch(self, batch: List[ReopenRequest]):
+        start = time.monotonic()
+        first = batch[0]
+        if len(batch) == 1:
+            self._reOpen(first.client, first)
+        else:
+            executor = self._getExecutor()
+            # The batch shares one installation, so every re-open can use the first client
+            wait(
+                [
+                    executor.submit(self._reOpen, first.client, request)
+                    for request in batch
+                ]
+            )
+
+        failed = [
+            request.alert_id
+            for request in batch
+            if request.future.exception() or request.future.result().status_code != 200
+        ]
+        result = {
+            "installation": first.client.getInstallationId(),
+            "repository": f"{first.owner}/{first.repo}",
+            "alerts": len(batch),
+            "failed": failed,
+            "duration": round(time.monotonic() - start, 3),
+        }
+        self.results.append(result)
+        logger.info(
+            f"Re-opened {len(batch) - len(failed)}/{len(batch)} alerts in {result['repository']} ({result['duration']}s)"
+        )
+
+    def _reOpen(self, client: Any, request: ReopenRequest):
+        if not request.future.set_running_or_notify_cancel():
+            return
+        try:
+            request.future.set_result(
+                client.sendReOpenAlert(
+                    request.owner, request.repo, request.type, request.alert_id
+                )
+            )
+        except Exception as e:
+            request.future.set_exception(e)
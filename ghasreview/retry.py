@@ -0,0 +1,114 @@
+from typing import Any, Dict
+import random
+import threading
+import time
+import logging
+
+from ghasreview.flask_githubapp import GitHubAppDeferred
+
+logger = logging.getLogger("Retry")
+
+# Methods which can be sent again without repeating a side effect
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "PATCH", "DELETE"}
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+RATE_LIMIT_STATUS_CODES = {403, 429}
+
+
+class CircuitOpenError(GitHubAppDeferred):
+    """Raised instead of calling a host that is currently failing"""
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, retries: int = 3, base: float = 0.5, cap: float = 8):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.cap, self.base * 2**attempt))
+
+    def shouldRetry(
+        self,
+        method: str,
+        response: Any = None,
+        error: Exception = None,
+        idempotent: bool = False,
+    ) -> bool:
+        """`idempotent` marks calls that are safe to repeat regardless of their method (e.g. GraphQL queries)"""
+        idempotent = idempotent or method.upper() in IDEMPOTENT_METHODS
+        if error is not None:
+            return idempotent
+        if response.status_code in RATE_LIMIT_STATUS_CODES:
+            # Rejected by the rate limiter, the request was not processed
+            return (
+                "rate limit" in response.text.lower()
+                or "Retry-After" in response.headers
+            )
+        if response.status_code in RETRY_STATUS_CODES:
+            return idempotent
+        return False
+
+
+class CircuitBreaker:
+    """Stops calling a host after `threshold` consecutive failures.
+
+    While open, calls fail fast with `CircuitOpenError`. After `reset_timeout` seconds
+    a single trial call is let through (half-open), its result closes or re-opens the circuit.
+    """
+
+    def __init__(self, host: str, threshold: int = 5, reset_timeout: float = 30):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before(self) -> bool:
+        """Raises `CircuitOpenError` unless a call may be made, returns True for the trial call"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            retry_after = max(
+                self.reset_timeout - (time.monotonic() - self.opened_at), 1
+            )
+        raise CircuitOpenError(f"Circuit open for {self.host}", retry_after=retry_after)
+
+    def release(self):
+        """Ends a trial call that neither succeeded nor failed (e.g. it was never sent), the next call is the trial"""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            if self.failures >= self.threshold:
+                logger.info(f"Circuit closed :: {self.host}")
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                if self.failures == self.threshold:
+                    logger.warning(f"Circuit opened :: {self.host}")
+                self.opened_at = time.monotonic()
+
+    def toDict(self) -> Dict:
+        return {"state": self.state, "failures": self.failures}
@@ -0,0 +1,135 @@
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+import json
+import threading
+import time
+import logging
+
+logger = logging.getLogger("TeamRoster")
+
+
+class TeamRoster:
+    """Logins of all members of a team at the time it was fetched"""
+
+    def __init__(self, members: Set[str], fetched_at: Optional[float] = None):
+        self.members = {member.lower() for member in members}
+        # Wall clock time, rosters can be shared between processes
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def isStale(self, refresh_interval: float) -> bool:
+        return time.time() - self.fetched_at > refresh_interval
+
+    def toDict(self) -> Dict:
+        return {"members": sorted(self.members), "fetched_at": self.fetched_at}
+
+    def __contains__(self, user: str) -> bool:
+        return (user or "").lower() in self.members
+
+
+class RosterStore:
+    """Process-wide store of team rosters keyed by (org, team).
+
+    A roster is fetched once and then answered locally. Once it is older than
+    `refresh_interval` it is still served while a background thread re-fetches it.
+    With a shared cache `backend` the rosters are kept there instead, so a roster fetched
+    by one worker process is used by all of them.
+    """
+
+    def __init__(self, refresh_interval: float = 900, backend: Any = None):
+        self.refresh_interval = refresh_interval
+        self.backend = backend
+        self._rosters: Dict[Hashable, TeamRoster] = {}
+        self._refreshing: Set[Hashable] = set()
+        self._lock = threading.Lock()
+
+    def get(
+        self, key: Hashable, fetch: Callable[[], Optional[Set[str]]]
+    ) -> Optional[TeamRoster]:
+        """Return the roster for `key`, fetching it when missing.
+
+        `fetch` returns the set of member logins or None if the team could not be listed.
+        """
+        roster = self._load(key)
+        if roster is not None:
+            if roster.isStale(self.refresh_interval):
+                self._refreshInBackground(key, fetch)
+            return roster
+
+        members = fetch()
+        if members is None:
+            return None
+        roster = TeamRoster(members)
+        self._save(key, roster)
+        logger.debug(f"Loaded team roster :: {key} ({len(roster.members)} members)")
+        return roster
+
+    def add(self, key: Hashable, user: str):
+        roster = self._load(key)
+        if roster is not None and user:
+            roster.members.add(user.lower())
+            if self.backend is not None:
+                self._save(key, roster)
+
+    def remove(self, key: Hashable, user: str):
+        roster = self._load(key)
+        if roster is not None and user:
+            roster.members.discard(user.lower())
+            if self.backend is not None:
+                self._save(key, roster)
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None):
+        if self.backend is not None:
+            for stored in self.backend.keys("roster:"):
+                if match is None or match(tuple(json.loads(stored[len("roster:") :]))):
+                    self.backend.delete(stored)
+            return
+        with self._lock:
+            if match is None:
+                self._rosters.clear()
+                return
+            for key in [key for key in self._rosters if match(key)]:
+                del self._rosters[key]
+
+    def _load(self, key: Hashable) -> Optional[TeamRoster]:
+        if self.backend is None:
+            return self._rosters.get(key)
+        data = self.backend.get("roster:" + json.dumps(list(key)))
+        if data is None:
+            return None
+        return TeamRoster(data["members"], data["fetched_at"])
+
+    def _save(self, key: Hashable, roster: TeamRoster):
+        if self.backend is None:
+            with self._lock:
+                self._rosters[key] = roster
+            return
+        # Stale rosters are served while refreshing, but not forever
+        self.backend.set(
+            "roster:" + json.dumps(list(key)),
+            roster.toDict(),
+            ttl=self.refresh_interval * 4,
+        )
+
+    def _refreshInBackground(self, key: Hashable, fetch: Callable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        threading.Thread(
+            target=self._refresh,
+            args=(key, fetch),
+            name="team-roster-refresh",
+            daemon=True,
+        ).start()
+
+    def _refresh(self, key: Hashable, fetch: Callable):
+        try:
+            members = fetch()
+            if members is not None:
+                self._save(key, TeamRoster(members))
+                logger.debug(f"Refreshed team roster :: {key}")
+        except Exception as e:
+            logger.warning(f"Failed to refresh team roster :: {key} - {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
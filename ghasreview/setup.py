@@ -26,12 +26,110 @@ def parse_arguments():
         "--ghas-tool-name", default=os.environ.get("GITHUB_TOOL_NAME") or "CodeQL"
     )
     parser_github.add_argument(
-        "--ghas-comment-required", default=bool(os.environ.get("GITHUB_GHAS_COMMENT_REQUIRED", 0))
+        "--ghas-comment-required",
+        default=bool(os.environ.get("GITHUB_GHAS_COMMENT_REQUIRED", 0)),
     )
     parser_github.add_argument(
         "--ghas-severities",
         nargs="*",
-        default=os.environ.get("GITHUB_GHAS_SEVERITIES", "").split(",") or ["critical", "high", "error", "errors"],
+        default=os.environ.get("GITHUB_GHAS_SEVERITIES", "").split(",")
+        or ["critical", "high", "error", "errors"],
+    )
+
+    parser_github.add_argument(
+        "--ghas-pr-coalesce-window",
+        type=float,
+        default=float(os.environ.get("GITHUB_GHAS_PR_COALESCE_WINDOW", 0)),
+    )
+
+    parser_github.add_argument(
+        "--ghas-pr-backend",
+        choices=["rest", "graphql"],
+        default=os.environ.get("GITHUB_GHAS_PR_BACKEND") or "rest",
+    )
+    parser_github.add_argument(
+        "--ghas-reopen-batching",
+        action="store_true",
+        default=bool(os.environ.get("GITHUB_GHAS_REOPEN_BATCHING")),
+    )
+    parser_github.add_argument(
+        "--ghas-reopen-concurrency",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_REOPEN_CONCURRENCY", 8)),
+    )
+
+    parser_retry = parser.add_argument_group("Retries")
+    parser_retry.add_argument(
+        "--ghas-api-retries",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_API_RETRIES", 3)),
+    )
+    parser_retry.add_argument(
+        "--ghas-circuit-threshold",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_CIRCUIT_THRESHOLD", 5)),
+    )
+    parser_retry.add_argument(
+        "--ghas-circuit-reset-timeout",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_CIRCUIT_RESET_TIMEOUT", 30)),
+    )
+
+    parser_concurrency = parser.add_argument_group("Concurrency")
+    parser_concurrency.add_argument(
+        "--ghas-fanout-workers",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_FANOUT_WORKERS", 8)),
+    )
+    parser_concurrency.add_argument(
+        "--ghas-asgi-threads",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_ASGI_THREADS", 32)),
+    )
+
+    parser_cache = parser.add_argument_group("Cache")
+    parser_cache.add_argument(
+        "--ghas-cache-size",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_CACHE_SIZE", 1024)),
+    )
+    parser_cache.add_argument(
+        "--ghas-team-cache-ttl",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_TEAM_CACHE_TTL", 600)),
+    )
+    parser_cache.add_argument(
+        "--ghas-membership-cache-ttl",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_MEMBERSHIP_CACHE_TTL", 300)),
+    )
+    parser_cache.add_argument(
+        "--ghas-response-cache-mb",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_RESPONSE_CACHE_MB", 16)),
+    )
+    parser_cache.add_argument(
+        "--ghas-team-roster",
+        action="store_true",
+        default=bool(os.environ.get("GITHUB_GHAS_TEAM_ROSTER")),
+    )
+    parser_cache.add_argument(
+        "--ghas-team-roster-refresh",
+        type=int,
+        default=int(os.environ.get("GITHUB_GHAS_TEAM_ROSTER_REFRESH", 900)),
+    )
+
+    parser_cache.add_argument(
+        "--github-app-cache-path", default=os.environ.get("GITHUB_APP_CACHE_PATH")
+    )
+    parser_cache.add_argument(
+        "--ghas-notified-path", default=os.environ.get("GITHUB_GHAS_NOTIFIED_PATH")
+    )
+    parser_cache.add_argument(
+        "--ghas-metrics-dir", default=os.environ.get("GITHUB_GHAS_METRICS_DIR")
+    )
+    parser_cache.add_argument(
+        "--ghas-ops-token", default=os.environ.get("GITHUB_GHAS_OPS_TOKEN")
     )
 
     parser_github = parser.add_argument_group("GitHub")
@@ -50,6 +148,79 @@ def parse_arguments():
     parser_github.add_argument(
         "--github-app-secret", default=os.environ.get("GITHUB_APP_SECRET")
     )
+    parser_github.add_argument(
+        "--github-app-bot-name", default=os.environ.get("GITHUB_APP_BOT_NAME")
+    )
+    parser_github.add_argument(
+        "--github-app-url", default=os.environ.get("GITHUB_APP_URL")
+    )
+
+    parser_github.add_argument(
+        "--github-app-pool-size",
+        type=int,
+        default=int(os.environ.get("GITHUB_APP_POOL_SIZE", 16)),
+    )
+
+    parser_profile = parser.add_argument_group("Profiling")
+    parser_profile.add_argument(
+        "--github-app-profile-path", default=os.environ.get("GITHUB_APP_PROFILE_PATH")
+    )
+    parser_profile.add_argument(
+        "--github-app-profile-percent",
+        type=float,
+        default=float(os.environ.get("GITHUB_APP_PROFILE_PERCENT", 0)),
+    )
+    parser_profile.add_argument(
+        "--github-app-profile-slow",
+        type=float,
+        default=float(os.environ.get("GITHUB_APP_PROFILE_SLOW", 0)),
+    )
+    parser_profile.add_argument(
+        "--github-app-profile-keep",
+        type=int,
+        default=int(os.environ.get("GITHUB_APP_PROFILE_KEEP", 50)),
+    )
+
+    parser_trace = parser.add_argument_group("Tracing")
+    parser_trace.add_argument(
+        "--github-app-trace-path", default=os.environ.get("GITHUB_APP_TRACE_PATH")
+    )
+    parser_trace.add_argument(
+        "--github-app-trace-service",
+        default=os.environ.get("GITHUB_APP_TRACE_SERVICE", "ghas-reviewer"),
+    )
+
+    parser_queue = parser.add_argument_group("Queue")
+    parser_queue.add_argument(
+        "--github-app-async",
+        action="store_true",
+        default=bool(os.environ.get("GITHUB_APP_ASYNC")),
+    )
+    parser_queue.add_argument(
+        "--github-app-workers",
+        type=int,
+        default=int(os.environ.get("GITHUB_APP_WORKERS", 4)),
+    )
+    parser_queue.add_argument(
+        "--github-app-queue-size",
+        type=int,
+        default=int(os.environ.get("GITHUB_APP_QUEUE_SIZE", 1000)),
+    )
+    parser_queue.add_argument(
+        "--github-app-priority-weights",
+        default=os.environ.get("GITHUB_APP_PRIORITY_WEIGHTS", "8,3,1"),
+    )
+    parser_queue.add_argument(
+        "--github-app-queue-path", default=os.environ.get("GITHUB_APP_QUEUE_PATH")
+    )
+    parser_queue.add_argument(
+        "--github-app-dedup-window",
+        type=int,
+        default=int(os.environ.get("GITHUB_APP_DEDUP_WINDOW", 3600)),
+    )
+    parser_queue.add_argument(
+        "--github-app-dedup-path", default=os.environ.get("GITHUB_APP_DEDUP_PATH")
+    )
     args, _ = parser.parse_known_args()
     return args
 
@@ -66,9 +237,39 @@ def setup_logging(arguments):
     logging.debug(f"GitHub Key :: {arguments.github_app_key}")
     logging.info(f"GitHub Key Path :: {arguments.github_app_key_path}")
     logging.debug(f"GitHub App Secret :: {arguments.github_app_secret}")
+    logging.debug(f"GitHub App Bot Name :: {arguments.github_app_bot_name}")
     logging.debug(f"GHAS Tool Name :: {arguments.ghas_tool_name}")
     logging.debug(f"GHAS Comment Required :: {arguments.ghas_comment_required}")
     logging.debug(f"GHAS Severities :: {arguments.ghas_severities}")
+    logging.debug(
+        f"GitHub App Async :: {arguments.github_app_async} ({arguments.github_app_workers} workers)"
+    )
+    logging.debug(f"GitHub App Queue Path :: {arguments.github_app_queue_path}")
+    logging.debug(
+        f"GitHub App Priority Weights :: {arguments.github_app_priority_weights}"
+    )
+    logging.debug(f"GitHub App Dedup Window :: {arguments.github_app_dedup_window}")
+    logging.debug(f"GHAS PR Coalesce Window :: {arguments.ghas_pr_coalesce_window}")
+    logging.debug(
+        f"GHAS Re-open Batching :: {arguments.ghas_reopen_batching} ({arguments.ghas_reopen_concurrency} concurrent)"
+    )
+    logging.debug(f"GHAS API Retries :: {arguments.ghas_api_retries}")
+    logging.debug(f"GHAS Fan-out Workers :: {arguments.ghas_fanout_workers}")
+    logging.debug(f"GHAS Cache Size :: {arguments.ghas_cache_size}")
+    logging.debug(f"GHAS Team Cache TTL :: {arguments.ghas_team_cache_ttl}")
+    logging.debug(f"GHAS Membership Cache TTL :: {arguments.ghas_membership_cache_ttl}")
+    logging.debug(f"GHAS Team Roster :: {arguments.ghas_team_roster}")
+    logging.debug(f"GHAS Notified PR Index :: {arguments.ghas_notified_path}")
+    logging.debug(f"GHAS Metrics Directory :: {arguments.ghas_metrics_dir}")
+    logging.debug(
+        f"GHAS Ops Token :: {'set' if arguments.ghas_ops_token else 'not set'}"
+    )
+    logging.debug(f"GitHub App Shared Cache :: {arguments.github_app_cache_path}")
+    logging.debug(f"GitHub App Traces :: {arguments.github_app_trace_path}")
+    logging.debug(
+        f"GitHub App Profiles :: {arguments.github_app_profile_path} "
+        f"({arguments.github_app_profile_percent}% / {arguments.github_app_profile_slow}s)"
+    )
 
 
 def validate_arguments(arguments):
@@ -102,16 +303,76 @@ def setup_app():
         "GHAS_DEBUG": arguments.debug,
         # Set the route
         "GITHUBAPP_ROUTE": arguments.github_app_endpoint,
+        # GitHub Enterprise Server (or a stand-in API), github.com when not set
+        "GITHUBAPP_URL": arguments.github_app_url,
         # Team name
         "GHAS_TEAM": arguments.ghas_team_name,
         "GHAS_BOARD_NAME": "GHAS Reviewers Audit Board",
         "GHAS_COMMENT_REQUIRED": arguments.ghas_comment_required,
         # Tool and severities to check
         "GHAS_TOOL": arguments.ghas_tool_name,
-        "GHAS_SEVERITIES": arguments.ghas_severities if arguments.ghas_severities else None,
+        "GHAS_SEVERITIES": (
+            arguments.ghas_severities if arguments.ghas_severities else None
+        ),
+        # Seconds to collect new alerts of a PR before notifying it, 0 notifies per alert
+        "GHAS_PR_COALESCE_WINDOW": arguments.ghas_pr_coalesce_window,
+        # Read PR comments and reviewers with REST or one GraphQL query
+        "GHAS_PR_BACKEND": arguments.ghas_pr_backend,
+        # Batch the re-opens piling up for a repository while one of them is in flight
+        "GHAS_REOPEN_BATCHING": arguments.ghas_reopen_batching,
+        "GHAS_REOPEN_CONCURRENCY": arguments.ghas_reopen_concurrency,
+        # Retries and circuit breaker of GitHub API calls
+        "GHAS_API_RETRIES": arguments.ghas_api_retries,
+        "GHAS_CIRCUIT_THRESHOLD": arguments.ghas_circuit_threshold,
+        "GHAS_CIRCUIT_RESET_TIMEOUT": arguments.ghas_circuit_reset_timeout,
+        # Threads running the independent API calls of a handler concurrently, 1 disables
+        "GHAS_FANOUT_WORKERS": arguments.ghas_fanout_workers,
+        # Threads of the ASGI entry point running synchronous handlers and routes
+        "GHAS_ASGI_THREADS": arguments.ghas_asgi_threads,
+        # Team and membership caches
+        "GHAS_CACHE_SIZE": arguments.ghas_cache_size,
+        "GHAS_TEAM_CACHE_TTL": arguments.ghas_team_cache_ttl,
+        "GHAS_MEMBERSHIP_CACHE_TTL": arguments.ghas_membership_cache_ttl,
+        "GHAS_RESPONSE_CACHE_BYTES": arguments.ghas_response_cache_mb * 1024 * 1024,
+        "GHAS_TEAM_ROSTER": arguments.ghas_team_roster,
+        "GHAS_TEAM_ROSTER_REFRESH": arguments.ghas_team_roster_refresh,
+        # Pull Requests already notified, kept across restarts and shared by all workers
+        "GHAS_NOTIFIED_PATH": arguments.ghas_notified_path,
+        # Metrics of all worker processes, summed by every `/metrics` scrape
+        "GHAS_METRICS_DIR": arguments.ghas_metrics_dir,
+        "GHAS_OPS_TOKEN": arguments.ghas_ops_token,
         # GitHub App
         "GITHUBAPP_ID": arguments.github_app_id,
         "GITHUBAPP_KEY": app_key,
         "GITHUBAPP_SECRET": arguments.github_app_secret,
+        # Bot login (`{app-slug}[bot]`), resolved from `/app` when not set
+        "GHAS_BOT_NAME": arguments.github_app_bot_name,
+        # Tokens, delivery IDs, teams, memberships, rosters and the bot login shared by all workers
+        "GITHUBAPP_CACHE_PATH": arguments.github_app_cache_path,
+        # Profiles of a share of all deliveries and of deliveries slower than a threshold
+        "GITHUBAPP_PROFILE_PATH": arguments.github_app_profile_path,
+        "GITHUBAPP_PROFILE_PERCENT": arguments.github_app_profile_percent,
+        "GITHUBAPP_PROFILE_SLOW": arguments.github_app_profile_slow,
+        "GITHUBAPP_PROFILE_KEEP": arguments.github_app_profile_keep,
+        # Spans of every delivery as OTLP JSON lines
+        "GITHUBAPP_TRACE_PATH": arguments.github_app_trace_path,
+        "GITHUBAPP_TRACE_SERVICE": arguments.github_app_trace_service,
+        # Keep-alive connections to the GitHub API per process
+        "GITHUBAPP_POOL_SIZE": arguments.github_app_pool_size,
+        # Asynchronous processing
+        "GITHUBAPP_ASYNC": arguments.github_app_async,
+        "GITHUBAPP_WORKERS": arguments.github_app_workers,
+        "GITHUBAPP_QUEUE_SIZE": arguments.github_app_queue_size,
+        "GITHUBAPP_QUEUE_PATH": arguments.github_app_queue_path,
+        # Re-opens (high) are served before notifications (low) by these weights
+        "GITHUBAPP_PRIORITY_WEIGHTS": dict(
+            enumerate(
+                int(weight)
+                for weight in arguments.github_app_priority_weights.split(",")
+            )
+        ),
+        # Skip redelivered webhooks
+        "GITHUBAPP_DEDUP_WINDOW": arguments.github_app_dedup_window,
+        "GITHUBAPP_DEDUP_PATH": arguments.github_app_dedup_path,
     }
     return config
@@ -1,5 +1,7 @@
 # gunicorn_config.py
 
+import os
+
 loglevel = "debug"
 bind = "0.0.0.0:9000"
 workers = 4
@@ -61,3 +63,26 @@ logconfig_dict = {
         },
     },
 }
+
+
+def post_worker_init(worker):
+    # Start the webhook workers and replay webhooks stored by workers of a previous run,
+    # without waiting for the first request of this worker
+    from ghasreview.app import githubapp
+
+    githubapp.start()
+
+
+def on_starting(server):
+    # Counts of workers of a previous run are not carried over
+    from ghasreview.metrics import registry
+
+    registry.configure(directory=os.environ.get("GITHUB_GHAS_METRICS_DIR"))
+    registry.clear()
+
+
+def child_exit(server, worker):
+    # Keep the counts of the exited worker, but not one file per worker ever started
+    from ghasreview.metrics import registry
+
+    registry.retire(worker.pid)
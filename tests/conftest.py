@@ -0,0 +1,31 @@
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+
+from ghasreview.flask_githubapp import GitHubApp
+
+
+@pytest.fixture(scope="session")
+def private_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+
+
+@pytest.fixture
+def make_github_app(private_key):
+    """Flask app with a `GitHubApp` configured by keyword arguments, signatures are not checked"""
+
+    def make(**config):
+        app = Flask("test")
+        app.config.update(
+            GITHUBAPP_ID=1, GITHUBAPP_KEY=private_key, GITHUBAPP_SECRET=False, **config
+        )
+        github_app = GitHubApp(app)
+        return app, github_app
+
+    return make
@@ -0,0 +1,71 @@
+import json
+import time
+import uuid
+
+import requests
+
+from ghasreview.flask_githubapp.queue import Delivery
+
+
+def make_delivery(delivery_id="00000000-0000-0000-0000-000000000001"):
+    return Delivery(
+        "code_scanning_alert",
+        "created",
+        {"X-GitHub-Delivery": delivery_id},
+        b'{"action": "created"}',
+    )
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def post_hook(client, event="code_scanning_alert", payload=None, delivery_id=None):
+    return client.post(
+        "/",
+        data=json.dumps(payload or {"action": "created", "installation": {"id": 1}}),
+        headers={
+            "Content-Type": "application/json",
+            "X-GitHub-Event": event,
+            "X-GitHub-Delivery": delivery_id or str(uuid.uuid4()),
+        },
+    )
+
+
+def make_response(
+    status_code=200, data=None, headers=None, url="https://api.example.com/"
+):
+    """`requests.Response` answering `data` as JSON, e.g. with `Link` or `ETag` headers"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = url
+    response.headers.update(headers or {})
+    response._content = b"" if data is None else json.dumps(data).encode()
+    response.encoding = "utf-8"
+    return response
+
+
+class FakeSession(object):
+    """Session of a GitHub client recording each request and answering it with `answer`"""
+
+    base_url = "https://api.example.com"
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.requests = []
+        self.bodies = []
+
+    def request(self, method, url, json=None, headers=None):
+        self.requests.append((method, url, headers or {}))
+        self.bodies.append(json)
+        return self.answer(method, url, json=json, headers=headers or {})
+
+
+class FakeInstallation(object):
+    def __init__(self, session):
+        self.session = session
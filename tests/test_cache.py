@@ -0,0 +1,112 @@
+import sqlite3
+import sys
+import threading
+import time
+
+import pytest
+
+from ghasreview.flask_githubapp.cache import MemoryCacheBackend, SQLiteCacheBackend
+
+
+@pytest.fixture
+def frequent_switches():
+    """Switch threads as often as possible, e.g. between the check and the insert of a racy add"""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def test_memory_add_stores_a_missing_key_for_one_of_concurrent_callers(
+    frequent_switches,
+):
+    cache = MemoryCacheBackend()
+    threads = 8
+    barrier = threading.Barrier(threads)
+    added = []
+
+    def add():
+        barrier.wait()
+        for key in range(2000):
+            if cache.add(f"delivery:{key}", threading.get_ident()):
+                added.append(key)
+
+    workers = [threading.Thread(target=add) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(added) == list(range(2000))
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+
+
+def stored_keys(cache):
+    """Keys in the database, expired or not"""
+    with sqlite3.connect(cache.path) as connection:
+        return sorted(row[0] for row in connection.execute("SELECT key FROM cache"))
+
+
+def test_sqlite_add_only_replaces_an_expired_entry(sqlite_cache):
+    assert sqlite_cache.add("live", 1, ttl=60)
+    assert not sqlite_cache.add("live", 2, ttl=60)
+    assert sqlite_cache.get("live") == 1
+
+    assert sqlite_cache.add("forever", 1)
+    assert not sqlite_cache.add("forever", 2, ttl=60)
+    assert sqlite_cache.get("forever") == 1
+
+    sqlite_cache.set("expired", 1, ttl=-1)
+    assert sqlite_cache.add("expired", 2, ttl=60)
+    assert sqlite_cache.get("expired") == 2
+
+
+def test_sqlite_add_stores_a_missing_key_for_one_of_concurrent_connections(
+    sqlite_cache,
+):
+    # Every thread has its own connection, like the worker processes sharing the file
+    threads = 4
+    barrier = threading.Barrier(threads)
+    added = []
+
+    def add():
+        barrier.wait()
+        for key in range(100):
+            if sqlite_cache.add(f"delivery:{key}", threading.get_ident(), ttl=60):
+                added.append(key)
+
+    workers = [threading.Thread(target=add) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(added) == list(range(100))
+
+
+def test_sqlite_writes_prune_expired_then_soonest_expiring_entries(
+    sqlite_cache, monkeypatch
+):
+    monkeypatch.setattr(SQLiteCacheBackend, "PRUNE_EVERY", 6)
+    sqlite_cache.maxsize = 3
+    sqlite_cache.set("expired", 0, ttl=-1)
+    sqlite_cache.set("forever", 0)
+    for number, ttl in enumerate((30, 10, 20)):
+        sqlite_cache.set(f"ttl-{ttl}", number, ttl=ttl)
+    assert len(stored_keys(sqlite_cache)) == 5
+
+    # The sixth write prunes
+    assert sqlite_cache.add("ttl-40", 0, ttl=40)
+    assert stored_keys(sqlite_cache) == ["forever", "ttl-30", "ttl-40"]
+
+
+def test_sqlite_expired_entries_are_not_read(sqlite_cache):
+    sqlite_cache.set("token:1", {"token": "a"}, ttl=0.01)
+    sqlite_cache.set("token:2", {"token": "b"}, ttl=60)
+    time.sleep(0.02)
+    assert sqlite_cache.get("token:1") is None
+    assert sqlite_cache.keys("token:") == ["token:2"]
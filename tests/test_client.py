@@ -0,0 +1,352 @@
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from ghasreview.cache import ResponseCache, TTLCache
+from ghasreview.client import Client
+from tests.helpers import FakeInstallation, FakeSession, make_response
+
+URL = "https://api.example.com/orgs/octo/teams/security"
+
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(Client, "response_cache", cache)
+    return cache
+
+
+def make_client(answer):
+    session = FakeSession(answer)
+    return Client(FakeInstallation(session), installation_id=1), session
+
+
+def test_only_successful_responses_with_a_validator_are_cached():
+    cache = ResponseCache()
+    cache.store("plain", make_response(data={}))
+    cache.store("missing", make_response(404, headers={"ETag": '"a"'}))
+    cache.store("etag", make_response(data={}, headers={"ETag": '"a"'}))
+    cache.store(
+        "modified",
+        make_response(
+            data={}, headers={"Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        ),
+    )
+
+    assert cache.get("plain") is None
+    assert cache.get("missing") is None
+    assert cache.get("etag").conditionalHeaders() == {"If-None-Match": '"a"'}
+    assert cache.get("modified").conditionalHeaders() == {
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"
+    }
+
+
+def test_least_recently_used_responses_are_evicted_by_count_and_size():
+    cache = ResponseCache(maxsize=2)
+    for key in ("a", "b"):
+        cache.store(key, make_response(data=key, headers={"ETag": key}))
+    cache.get("a")
+    cache.store("c", make_response(data="c", headers={"ETag": "c"}))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+    # Each body is 5 bytes ("xyz" with its quotes)
+    cache = ResponseCache(maxbytes=12)
+    for key in ("a", "b", "c"):
+        cache.store(key, make_response(data="xyz", headers={"ETag": key}))
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 10
+
+
+def test_not_modified_get_is_answered_from_the_cache(response_cache):
+    def answer(method, url, json=None, headers=None):
+        if headers.get("If-None-Match") == '"v1"':
+            return make_response(304, headers={"ETag": '"v1"'}, url=url)
+        return make_response(
+            data={"slug": "security"}, headers={"ETag": '"v1"'}, url=url
+        )
+
+    client, session = make_client(answer)
+    first = client.callApi("GET", URL)
+    second = client.callApi("GET", URL)
+
+    assert [headers for _, _, headers in session.requests] == [
+        {},
+        {"If-None-Match": '"v1"'},
+    ]
+    assert first.json() == second.json() == {"slug": "security"}
+    assert second.status_code == 200
+    stats = response_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+def test_changed_get_replaces_the_cached_response(response_cache):
+    versions = iter(["v1", "v2"])
+
+    def answer(method, url, json=None, headers=None):
+        version = next(versions)
+        return make_response(
+            data={"version": version}, headers={"ETag": version}, url=url
+        )
+
+    client, session = make_client(answer)
+    client.callApi("GET", URL)
+    assert client.callApi("GET", URL).json() == {"version": "v2"}
+    assert response_cache.get((1, URL)).etag == "v2"
+    assert response_cache.stats()["hits"] == 0
+
+
+def test_other_methods_are_neither_conditional_nor_cached(response_cache):
+    client, session = make_client(
+        lambda method, url, **kwargs: make_response(data={}, headers={"ETag": '"v1"'})
+    )
+    client.callApi("PATCH", URL, {"state": "open"})
+    client.callApi("PATCH", URL, {"state": "open"})
+
+    assert [headers for _, _, headers in session.requests] == [{}, {}]
+    assert response_cache.stats()["entries"] == 0
+
+
+COMMENTS_URL = "https://api.example.com/repos/octo/app/issues/7/comments"
+
+
+def paged_comments(pages):
+    """Answer of a comment listing split in `pages`, linked like GitHub does"""
+
+    def link(page):
+        return f"<{COMMENTS_URL}?per_page=100&page={page}>"
+
+    def answer(method, url, json=None, headers=None):
+        page = int(parse_qs(urlparse(url).query).get("page", ["1"])[0])
+        links = []
+        if page > 1:
+            links += [f'{link(page - 1)}; rel="prev"', f'{link(1)}; rel="first"']
+        if page < len(pages):
+            links += [
+                f'{link(page + 1)}; rel="next"',
+                f'{link(len(pages))}; rel="last"',
+            ]
+        return make_response(
+            data=pages[page - 1], headers={"Link": ", ".join(links)}, url=url
+        )
+
+    return answer
+
+
+def comment(number, login="octocat"):
+    return {"id": number, "user": {"login": login}}
+
+
+def requested_pages(session):
+    return [
+        parse_qs(urlparse(url).query).get("page", ["1"])[0]
+        for _, url, _ in session.requests
+    ]
+
+
+@pytest.fixture
+def comment_scans(monkeypatch):
+    scans = TTLCache(ttl=3600)
+    monkeypatch.setattr(Client, "comment_scans", scans)
+    return scans
+
+
+def test_paginate_follows_next_links_lazily(response_cache):
+    client, session = make_client(
+        paged_comments([[comment(1), comment(2)], [comment(3)], [comment(4)]])
+    )
+    items = client.paginate(COMMENTS_URL)
+
+    assert [next(items)["id"] for _ in range(3)] == [1, 2, 3]
+    assert requested_pages(session) == ["1", "2"]
+    assert [item["id"] for item in items] == [4]
+
+
+def test_paginate_newest_first_walks_back_from_the_last_page(response_cache):
+    client, session = make_client(
+        paged_comments(
+            [[comment(1), comment(2)], [comment(3), comment(4)], [comment(5)]]
+        )
+    )
+
+    assert [
+        item["id"] for item in client.paginate(COMMENTS_URL, newest_first=True)
+    ] == [5, 4, 3, 2, 1]
+    # The first page is read once, to find the last one
+    assert requested_pages(session) == ["1", "3", "2"]
+
+
+def test_comment_scan_stops_at_the_newest_comment_of_the_bot(
+    response_cache, comment_scans
+):
+    pages = [
+        [comment(1)],
+        [comment(2), comment(3, "ghas-bot[bot]")],
+        [comment(4), comment(5)],
+    ]
+    client, session = make_client(paged_comments(pages))
+
+    assert client.hasUserCommented("octo", "app", 7, "ghas-bot[bot]")
+    assert requested_pages(session) == ["1", "3", "2"]
+    assert comment_scans.get(("octo", "app", 7)) is None
+
+
+def test_comment_scan_without_a_match_reads_only_newer_comments_next_time(
+    response_cache, comment_scans
+):
+    client, session = make_client(paged_comments([[comment(1)], [comment(2)]]))
+    assert not client.hasUserCommented("octo", "app", 7, "ghas-bot[bot]")
+    scanned_at = comment_scans.get(("octo", "app", 7))
+    assert scanned_at is not None
+    assert all(
+        "since" not in parse_qs(urlparse(url).query) for _, url, _ in session.requests
+    )
+
+    session.requests.clear()
+    assert not client.hasUserCommented("octo", "app", 7, "ghas-bot[bot]")
+    since = parse_qs(urlparse(session.requests[0][1]).query)["since"][0]
+    # A minute earlier than the previous scan, for clock skew
+    expected = scanned_at - timedelta(minutes=1)
+    assert since == expected.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def pr_comment_pages(pages, reviewers=("security",)):
+    """GraphQL answer of a PR whose comments are split in `pages`, the newest page last"""
+
+    def answer(method, url, json=None, headers=None):
+        before = json["variables"]["before"]
+        index = len(pages) - 1 if before is None else int(before) - 1
+        pull_request = {
+            "comments": {
+                "nodes": [{"author": {"login": login}} for login in pages[index]],
+                "pageInfo": {"hasPreviousPage": index > 0, "startCursor": str(index)},
+            },
+            "reviewRequests": {
+                "nodes": [
+                    {"requestedReviewer": {"name": name, "slug": name}}
+                    for name in reviewers
+                ]
+            },
+        }
+        return make_response(
+            data={"data": {"repository": {"pullRequest": pull_request}}}, url=url
+        )
+
+    return answer
+
+
+@pytest.fixture
+def bot_username(monkeypatch):
+    monkeypatch.setattr(Client, "bot_username", "ghas-bot[bot]")
+
+
+def graphql_cursors(session):
+    return [json_body["variables"]["before"] for json_body in session.bodies]
+
+
+def test_pr_notification_state_pages_back_until_the_bot_comment(bot_username):
+    client, session = make_client(
+        pr_comment_pages([["octocat"], ["ghas-bot", "mona"], ["mona"]])
+    )
+
+    state = client.getPRNotificationState("octo", "app", 7)
+    assert state == {"commented": True, "team_reviewers": {"security"}}
+    assert graphql_cursors(session) == [None, "2"]
+    assert [url for _, url, _ in session.requests] == [
+        "https://api.example.com/graphql"
+    ] * 2
+
+
+def test_pr_notification_state_reads_every_page_without_a_bot_comment(bot_username):
+    client, session = make_client(
+        pr_comment_pages([["octocat"], ["mona"], ["hubot"]], reviewers=())
+    )
+
+    assert client.getPRNotificationState("octo", "app", 7) == {
+        "commented": False,
+        "team_reviewers": set(),
+    }
+    assert graphql_cursors(session) == [None, "2", "1"]
+
+
+def test_pr_notification_state_is_unknown_on_graphql_errors(bot_username):
+    client, session = make_client(
+        lambda method, url, **kwargs: make_response(data={"errors": [{}]})
+    )
+    assert client.getPRNotificationState("octo", "app", 7) is None
+
+
+def test_graphql_url_of_github_enterprise_server():
+    session = FakeSession(None)
+    session.base_url = "https://github.example.com/api/v3"
+    client = Client(FakeInstallation(session))
+    assert client.getGraphQLUrl() == "https://github.example.com/api/graphql"
+
+
+@pytest.fixture
+def fan_out():
+    workers = Client.fanout_workers
+    Client.configureFanOut(3)
+    yield Client(FakeInstallation(FakeSession(None)))
+    Client.configureFanOut(workers)
+
+
+def test_fan_out_runs_calls_concurrently_and_keeps_their_order(fan_out):
+    # Only passes when all three calls run at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def call(result, delay):
+        def run():
+            barrier.wait()
+            time.sleep(delay)
+            return result
+
+        return run
+
+    assert fan_out.fanOut(call("a", 0.05), call("b", 0.02), call("c", 0)) == [
+        "a",
+        "b",
+        "c",
+    ]
+
+
+def test_fan_out_waits_for_every_call_then_raises_the_first_error(fan_out):
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.05)
+        finished.set()
+
+    def fail(error):
+        def run():
+            raise error
+
+        return run
+
+    with pytest.raises(ValueError):
+        fan_out.fanOut(slow, fail(ValueError("first")), fail(KeyError("second")))
+    assert finished.is_set()
+
+
+def test_fan_out_of_a_fanned_out_call_runs_inline(fan_out):
+    def nested():
+        outer = threading.current_thread().name
+        return (
+            outer,
+            fan_out.fanOut(lambda: threading.current_thread().name, lambda: None)[0],
+        )
+
+    # Three nested fan outs would wait for each other forever on a pool of three threads
+    for outer, inner in fan_out.fanOut(nested, nested, nested):
+        assert outer.startswith("fanout") and inner == outer
+
+
+def test_fan_out_with_a_single_worker_runs_on_the_calling_thread(fan_out):
+    Client.configureFanOut(1)
+    names = fan_out.fanOut(
+        lambda: threading.current_thread().name, lambda: threading.current_thread().name
+    )
+    assert names == [threading.current_thread().name] * 2
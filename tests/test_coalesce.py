@@ -0,0 +1,38 @@
+import time
+
+from ghasreview.coalesce import Coalescer
+from ghasreview.flask_githubapp.cache import SQLiteCacheBackend
+from ghasreview.notified import pullRequestKey
+
+KEY = pullRequestKey("octo", "app", 1)
+
+
+def test_one_caller_of_a_burst_claims_the_key():
+    coalescer = Coalescer(window=60)
+    assert coalescer.claim(KEY) is True
+    assert coalescer.claim(KEY) is False
+    assert coalescer.claim(pullRequestKey("octo", "app", 2)) is True
+
+
+def test_claim_is_shared_by_workers_using_the_same_cache(tmp_path):
+    path = str(tmp_path / "cache.db")
+    # One backend per worker process, on the same database
+    first = Coalescer(window=60, backend=SQLiteCacheBackend(path))
+    second = Coalescer(window=60, backend=SQLiteCacheBackend(path))
+
+    assert first.claim(KEY) is True
+    assert second.claim(KEY) is False
+
+
+def test_released_claim_lets_the_next_event_act():
+    coalescer = Coalescer(window=60)
+    coalescer.claim(KEY)
+    coalescer.release(KEY)
+    assert coalescer.claim(KEY) is True
+
+
+def test_claim_expires_with_the_window():
+    coalescer = Coalescer(window=0.05)
+    coalescer.claim(KEY)
+    time.sleep(0.1)
+    assert coalescer.claim(KEY) is True
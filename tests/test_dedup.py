@@ -0,0 +1,74 @@
+import os
+import sqlite3
+
+import pytest
+
+from ghasreview.flask_githubapp.dedup import SQLiteDeliveryLog
+from tests.helpers import post_hook
+
+DELIVERY_ID = "00000000-0000-0000-0000-0000000000aa"
+
+
+def test_redelivery_is_skipped(make_github_app):
+    app, github_app = make_github_app()
+    calls = []
+    github_app.on("code_scanning_alert.created")(lambda: calls.append(1))
+
+    with app.test_client() as client:
+        assert post_hook(client, delivery_id=DELIVERY_ID).json["status"] == "HIT"
+        assert post_hook(client, delivery_id=DELIVERY_ID).json["status"] == "DUPLICATE"
+    assert calls == [1]
+
+
+def test_failed_hook_is_not_skipped_on_redelivery(make_github_app):
+    app, github_app = make_github_app()
+    calls = []
+
+    def hook():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+
+    github_app.on("code_scanning_alert.created")(hook)
+
+    with app.test_client() as client:
+        assert post_hook(client, delivery_id=DELIVERY_ID).status_code == 500
+        assert post_hook(client, delivery_id=DELIVERY_ID).json["status"] == "HIT"
+    assert calls == [1, 1]
+
+
+def test_delivery_that_failed_to_queue_is_not_skipped_on_redelivery(
+    make_github_app, tmp_path, monkeypatch
+):
+    app, github_app = make_github_app(
+        GITHUBAPP_ASYNC=True, GITHUBAPP_QUEUE_PATH=str(tmp_path / "deliveries.db")
+    )
+    github_app.on("code_scanning_alert.created")(lambda: None)
+
+    def disk_full(delivery):
+        raise sqlite3.OperationalError("database or disk is full")
+
+    monkeypatch.setattr(github_app.queue.store, "append", disk_full)
+    with app.test_client() as client:
+        assert post_hook(client, delivery_id=DELIVERY_ID).status_code == 500
+        monkeypatch.undo()
+        response = post_hook(client, delivery_id=DELIVERY_ID)
+    assert response.status_code == 202
+    assert response.json["status"] == "QUEUED"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_worker_opens_its_own_delivery_log_connection(tmp_path):
+    log = SQLiteDeliveryLog(str(tmp_path / "seen.db"))
+    assert log.check_and_add(DELIVERY_ID) is False
+    parent_connection = log._connection
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            duplicate = log.check_and_add(DELIVERY_ID)
+            os._exit(0 if duplicate and log._connection is not parent_connection else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
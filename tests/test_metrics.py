@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from ghasreview.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    registry.counter("hooks_total", "Webhooks", ("event",))
+    return registry
+
+
+def write_worker(registry, pid, count):
+    worker = MetricsRegistry(directory=registry.directory)
+    worker.counter("hooks_total", "Webhooks", ("event",)).inc("push", amount=count)
+    snapshot = {name: metric.snapshot() for name, metric in worker.metrics.items()}
+    registry._write(os.path.join(registry.directory, f"metrics-{pid}.json"), snapshot)
+
+
+def test_exited_workers_are_folded_into_one_file(registry):
+    write_worker(registry, 101, 2)
+    write_worker(registry, 102, 3)
+    before = registry.render()
+
+    registry.retire(101)
+    registry.retire(102)
+    registry.retire(103)
+
+    assert registry.render() == before
+    assert 'hooks_total{event="push"} 5' in before
+    assert sorted(os.listdir(registry.directory)) == sorted(
+        [MetricsRegistry.EXITED, f"metrics-{os.getpid()}.json"]
+    )
+
+
+def test_clear_drops_the_counts_of_a_previous_run(registry):
+    write_worker(registry, 101, 2)
+    registry.retire(101)
+    write_worker(registry, 102, 3)
+
+    registry.clear()
+    assert os.listdir(registry.directory) == []
+    assert 'event="push"' not in registry.render()
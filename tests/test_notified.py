@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from ghasreview.notified import SQLiteNotifiedIndex, pullRequestKey
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SQLiteNotifiedIndex(str(tmp_path / "notified.db"))
+
+
+def test_notified_pull_requests_are_shared(index):
+    key = pullRequestKey("Octo", "app", 1)
+    index.add(key)
+    assert key in SQLiteNotifiedIndex(index.path)
+
+    index.remove(key)
+    assert key not in index
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_worker_opens_its_own_connection(index):
+    key = pullRequestKey("octo", "app", 2)
+    parent_connection = index._connection
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            index.add(key)
+            os._exit(0 if index._connection is not parent_connection else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert key in index
@@ -0,0 +1,204 @@
+import asyncio
+import threading
+
+import pytest
+
+from ghasreview.async_client import AsyncClient
+from ghasreview.cache import TTLCache
+from ghasreview.client import Client
+from ghasreview.models import CodeScanningAlert, SecretScanningAlert
+from ghasreview.policy import (
+    reviewCodeScanningDismissal,
+    reviewSecretScanningResolution,
+    runPolicy,
+    runPolicyAsync,
+)
+from ghasreview.roster import RosterStore
+
+CONFIG = {"GHAS_TEAM": "security"}
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200, data=None, links=None):
+        self.status_code = status_code
+        self.data = data
+        self.links = links or {}
+
+    def json(self):
+        return self.data
+
+
+class FakeClient(object):
+    """Client of a `Client` policy run, recording the calls made"""
+
+    def __init__(self, team_exists=True, is_member=False):
+        self.team_exists = team_exists
+        self.is_member = is_member
+        self.calls = []
+
+    def checkTeamMembership(self, owner, team, user):
+        self.calls.append("checkTeamMembership")
+        return self.team_exists, self.is_member
+
+    def isUserPartOfTeam(self, owner, team, user):
+        self.calls.append("isUserPartOfTeam")
+        return self.team_exists and self.is_member
+
+    def createTeam(self, owner, team):
+        self.calls.append("createTeam")
+        return True
+
+    def reOpenSecretScanningAlert(self, owner, repo, alert_id):
+        self.calls.append("reOpen")
+        return FakeResponse()
+
+    def reOpenCodeScanningAlert(self, owner, repo, alert_id):
+        self.calls.append("reOpen")
+        return FakeResponse()
+
+
+class FakeAsyncClient(FakeClient):
+    """Same client for an `AsyncClient` policy run, every call is a coroutine"""
+
+    def __getattribute__(self, name):
+        attribute = object.__getattribute__(self, name)
+        if name in ("calls", "team_exists", "is_member") or not callable(attribute):
+            return attribute
+
+        async def call(*args):
+            return attribute(*args)
+
+        return call
+
+
+def runBoth(policy, alert, config=CONFIG, **client):
+    """Outcome and calls of a policy with a synchronous and with a coroutine client"""
+    sync_client, async_client = FakeClient(**client), FakeAsyncClient(**client)
+    sync_result = runPolicy(policy(sync_client, alert, config))
+    async_result = asyncio.run(runPolicyAsync(policy(async_client, alert, config)))
+    assert sync_result == async_result
+    assert sync_client.calls == async_client.calls
+    return sync_result, sync_client.calls
+
+
+def codeScanningAlert(**alert):
+    instance = CodeScanningAlert()
+    instance.payload = {
+        "alert": {
+            "number": 1,
+            "dismissed_by": {"login": "octocat"},
+            "tool": {"name": "CodeQL"},
+            **alert,
+        },
+        "repository": {"name": "app", "owner": {"login": "octo"}},
+    }
+    return instance
+
+
+def test_dismissal_by_outsider_is_reopened():
+    result, calls = runBoth(reviewCodeScanningDismissal, codeScanningAlert())
+    assert result == {"message": "Code Scanning Alert Reopened"}
+    assert calls == ["checkTeamMembership", "reOpen"]
+
+
+def test_dismissal_by_security_team_member_is_kept():
+    result, calls = runBoth(
+        reviewCodeScanningDismissal, codeScanningAlert(), is_member=True
+    )
+    assert result == {"message": "User is part of the security team"}
+    assert calls == ["checkTeamMembership"]
+
+
+def test_missing_team_is_created():
+    _, calls = runBoth(
+        reviewCodeScanningDismissal, codeScanningAlert(), team_exists=False
+    )
+    assert calls == ["checkTeamMembership", "createTeam", "reOpen"]
+
+
+def test_dismissal_without_comment_is_reopened_when_required():
+    result, calls = runBoth(
+        reviewCodeScanningDismissal,
+        codeScanningAlert(),
+        {**CONFIG, "GHAS_COMMENT_REQUIRED": True},
+        is_member=True,
+    )
+    assert result == {"message": "Comment required, re-opening alert"}
+    assert calls == ["reOpen"]
+
+
+def test_secret_scanning_resolution_by_outsider_is_reopened():
+    alert = SecretScanningAlert()
+    alert.payload = {
+        "alert": {"number": 1},
+        "repository": {"name": "app", "owner": {"login": "octo"}},
+    }
+    result, calls = runBoth(reviewSecretScanningResolution, alert)
+    assert result == {"message": "Secret Scanning Alert Reopened"}
+    assert calls == ["isUserPartOfTeam", "reOpen"]
+
+
+class RecordingCache(TTLCache):
+    """Cache recording the threads it is called from"""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get(self, key, default=None):
+        self.threads.add(threading.get_ident())
+        return super().get(key, default)
+
+    def set(self, key, value, ttl=None):
+        self.threads.add(threading.get_ident())
+        super().set(key, value, ttl)
+
+
+@pytest.fixture
+def async_client(monkeypatch):
+    calls = []
+
+    async def callApi(self, method, url, json=None, priority=None, idempotent=False):
+        calls.append(url)
+        if url.endswith("/members?per_page=100"):
+            return FakeResponse(data=[{"login": "OctoCat"}, {"login": "hubot"}])
+        return FakeResponse(404)
+
+    monkeypatch.setattr(AsyncClient, "callApi", callApi)
+    monkeypatch.setattr(Client, "rosters", RosterStore())
+    monkeypatch.setattr(Client, "membership_cache", RecordingCache())
+    client = AsyncClient("https://api.example.com", "token", installation_id=1)
+    client.calls = calls
+    return client
+
+
+def test_async_membership_uses_the_roster_in_roster_mode(async_client, monkeypatch):
+    monkeypatch.setattr(Client, "roster_mode", True)
+
+    async def check():
+        return [
+            await async_client.isTeamMember("octo", "security", user)
+            for user in ("octocat", "mona")
+        ]
+
+    assert asyncio.run(check()) == [True, False]
+    # One listing of the team, no membership lookups
+    assert async_client.calls == [
+        "https://api.example.com/orgs/octo/teams/security/members?per_page=100"
+    ]
+
+
+def test_async_shared_cache_is_used_off_the_event_loop(async_client, monkeypatch):
+    monkeypatch.setattr(Client, "shared_cache", object())
+
+    async def check():
+        return threading.get_ident(), await async_client.isTeamMember(
+            "octo", "security", "octocat"
+        )
+
+    loop_thread, is_member = asyncio.run(check())
+    assert is_member is False
+    assert (
+        Client.membership_cache.threads
+        and loop_thread not in Client.membership_cache.threads
+    )
@@ -0,0 +1,41 @@
+import requests
+
+from ghasreview.flask_githubapp.pool import ConnectionPools
+
+URL = "https://api.example.com"
+
+
+def session():
+    session = requests.Session()
+    session.base_url = URL
+    return session
+
+
+def test_pool_keeps_a_connection_per_reserved_thread():
+    pools = ConnectionPools(pool_size=4)
+    pools.reserve("queue", 8)
+    pools.reserve("fanout", 8)
+
+    _, adapter = pools.adapter(URL)
+    assert adapter._pool_maxsize == 20
+
+
+def test_reserving_again_replaces_the_reservation_and_the_adapter():
+    pools = ConnectionPools(pool_size=4)
+    pools.reserve("queue", 8)
+    first = pools.mount(session()).get_adapter(URL + "/")
+
+    pools.reserve("queue", 2)
+    second = pools.mount(session()).get_adapter(URL + "/")
+    assert second is not first
+    assert second._pool_maxsize == 6
+
+    pools.reserve("queue", 2)
+    assert pools.mount(session()).get_adapter(URL + "/") is second
+
+
+def test_queue_workers_are_reserved(make_github_app):
+    _, github_app = make_github_app(
+        GITHUBAPP_ASYNC=True, GITHUBAPP_WORKERS=12, GITHUBAPP_POOL_SIZE=4
+    )
+    assert github_app._pools.maxsize == 16
@@ -0,0 +1,114 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from ghasreview.flask_githubapp.exceptions import GitHubAppDeferred
+from ghasreview.flask_githubapp.profiling import DeliveryProfiler, annotate
+
+
+def read_reports(profiler):
+    reports = []
+    for report in profiler.reports():
+        with open(profiler.report_path(report["name"])) as handle:
+            reports.append(json.load(handle))
+    return reports
+
+
+def test_sampled_delivery_is_profiled_with_its_timeline(tmp_path):
+    profiler = DeliveryProfiler(str(tmp_path), percent=100)
+
+    with profiler.profile("code_scanning_alert", "created", "delivery-1"):
+        annotate("api", "GET /app", time.monotonic(), 0.01, status="200")
+        # Work handed to another thread with the context of the delivery
+        thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(
+                annotate,
+                "api",
+                "GET /orgs/octo/teams/security",
+                time.monotonic(),
+                0.02,
+            ),
+        )
+        thread.start()
+        thread.join()
+    annotate("api", "GET /after", time.monotonic(), 0.01)
+
+    [report] = read_reports(profiler)
+    assert (report["event"], report["action"], report["delivery"]) == (
+        "code_scanning_alert",
+        "created",
+        "delivery-1",
+    )
+    assert (report["reason"], report["outcome"]) == ("sampled", "ok")
+    assert [entry["name"] for entry in report["timeline"]] == [
+        "GET /app",
+        "GET /orgs/octo/teams/security",
+    ]
+    assert report["timeline"][0]["status"] == "200"
+    assert "cumulative" in report["profile"]
+
+
+def test_fast_delivery_is_not_reported(tmp_path):
+    profiler = DeliveryProfiler(str(tmp_path), slow=1)
+    with profiler.profile("code_scanning_alert", "created"):
+        pass
+    assert profiler.reports() == []
+
+
+def test_slow_delivery_is_reported_with_its_stack_samples(tmp_path):
+    profiler = DeliveryProfiler(str(tmp_path), slow=0.05, interval=0.005)
+
+    def wait_for_github():
+        time.sleep(0.1)
+
+    with profiler.profile("secret_scanning_alert", "resolved"):
+        wait_for_github()
+
+    [report] = read_reports(profiler)
+    assert report["reason"] == "slow"
+    assert report["duration"] >= 0.05
+    assert "profile" not in report
+    assert any("wait_for_github" in sample["stack"] for sample in report["samples"])
+
+
+@pytest.mark.parametrize(
+    "error, outcome",
+    [
+        (RuntimeError("boom"), "error"),
+        (GitHubAppDeferred("rate limited", retry_after=1), "deferred"),
+    ],
+)
+def test_outcome_of_a_failed_delivery_is_reported(tmp_path, error, outcome):
+    profiler = DeliveryProfiler(str(tmp_path), percent=100)
+    with pytest.raises(type(error)):
+        with profiler.profile("code_scanning_alert", "created"):
+            raise error
+
+    [report] = read_reports(profiler)
+    assert report["outcome"] == outcome
+
+
+def test_only_the_newest_reports_are_kept(tmp_path):
+    profiler = DeliveryProfiler(str(tmp_path), percent=100, keep=2)
+    for action in ("created", "fixed", "reopened"):
+        with profiler.profile("code_scanning_alert", action):
+            pass
+
+    assert [report["action"] for report in read_reports(profiler)] == [
+        "reopened",
+        "fixed",
+    ]
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_report_path_only_serves_reports_of_the_directory(tmp_path):
+    profiler = DeliveryProfiler(str(tmp_path / "profiles"))
+    (tmp_path / "secret.json").write_text("{}")
+
+    assert profiler.report_path("../secret.json") is None
+    assert profiler.report_path("missing.json") is None
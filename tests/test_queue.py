@@ -0,0 +1,203 @@
+import queue
+import sqlite3
+import threading
+from collections import Counter
+
+import pytest
+
+from ghasreview.flask_githubapp.exceptions import GitHubAppDeferred
+from ghasreview.flask_githubapp.queue import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    DurableWorkQueue,
+    PriorityDeliveryQueue,
+    WorkQueue,
+)
+from ghasreview.flask_githubapp.store import DeliveryStore
+from tests.helpers import make_delivery, wait_for
+
+
+class DeferOnce(object):
+    """Handler deferring the first call, then waiting for `release` before succeeding"""
+
+    def __init__(self, retry_after=0.2):
+        self.retry_after = retry_after
+        self.calls = 0
+        self.deferred = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, delivery):
+        self.calls += 1
+        if self.calls == 1:
+            self.deferred.set()
+            raise GitHubAppDeferred("rate limited", retry_after=self.retry_after)
+        self.release.wait(5)
+
+
+def test_deferred_delivery_is_not_processed():
+    handler = DeferOnce()
+    work = WorkQueue(handler, workers=1)
+    work.put(make_delivery())
+
+    assert handler.deferred.wait(5)
+    assert wait_for(lambda: work.stats()["deferred"] == 1)
+    stats = work.stats()
+    assert stats["busy"] == 0
+    assert stats["utilisation"] == 0.0
+    assert stats["processed"] == 0
+    assert stats["failed"] == 0
+
+    handler.release.set()
+    assert wait_for(lambda: work.stats()["processed"] == 1)
+    stats = work.stats()
+    assert stats["busy"] == 0
+    assert stats["deferred"] == 0
+    assert stats["failed"] == 0
+    assert handler.calls == 2
+
+
+def test_deferred_delivery_stays_in_the_store(tmp_path):
+    store = DeliveryStore(str(tmp_path / "deliveries.db"))
+    handler = DeferOnce()
+    work = DurableWorkQueue(handler, store, workers=1)
+    work.put(make_delivery())
+
+    assert handler.deferred.wait(5)
+    assert wait_for(lambda: work.stats()["deferred"] == 1)
+    store.flush()
+    # Parked, not acknowledged: a crash now replays it
+    assert store.counts() == {"claimed": 1}
+
+    handler.release.set()
+    assert wait_for(lambda: work.stats()["processed"] == 1)
+    store.flush()
+    assert store.counts() == {}
+
+
+def test_failed_delivery_is_retried_then_dead_lettered(tmp_path):
+    store = DeliveryStore(str(tmp_path / "deliveries.db"))
+    calls = []
+
+    def handler(delivery):
+        calls.append(delivery.attempts)
+        raise RuntimeError("boom")
+
+    work = DurableWorkQueue(handler, store, workers=1, max_attempts=2)
+    work.put(make_delivery())
+
+    assert wait_for(lambda: work.stats()["processed"] == 2)
+    store.flush()
+    assert calls == [1, 2]
+    assert work.stats()["failed"] == 2
+    assert work.stats()["busy"] == 0
+    assert store.counts() == {"failed": 1}
+
+
+def test_recovery_beyond_the_queue_size_does_not_block_start(tmp_path):
+    store = DeliveryStore(str(tmp_path / "deliveries.db"))
+    for number in range(6):
+        store.append(make_delivery("00000000-0000-0000-0000-00000000000%d" % number))
+    store.flush()
+    # Left behind by a stopped process
+    with sqlite3.connect(store.path) as connection:
+        connection.execute("UPDATE deliveries SET claimed_by = NULL")
+
+    release = threading.Event()
+    work = DurableWorkQueue(
+        lambda delivery: release.wait(5), store, workers=1, maxsize=2
+    )
+    starting = threading.Thread(target=work.start)
+    starting.start()
+    starting.join(5)
+    assert not starting.is_alive()
+    assert work.stats()["overflow"] > 0
+
+    release.set()
+    assert wait_for(lambda: work.stats()["processed"] == 6)
+    store.flush()
+    assert store.counts() == {}
+    assert work.stats()["overflow"] == 0
+
+
+def test_dropped_deferral_is_fed_in_once_there_is_room(tmp_path):
+    store = DeliveryStore(str(tmp_path / "deliveries.db"))
+    handler = DeferOnce(retry_after=0.05)
+    work = DurableWorkQueue(handler, store, workers=1)
+    work.start()
+    delivery = store.append(make_delivery())
+
+    # The deferral timer found the queue full
+    work._on_defer_dropped(delivery)
+    assert wait_for(lambda: handler.calls == 1)
+    handler.release.set()
+    assert wait_for(lambda: work.stats()["processed"] == 1)
+    store.flush()
+    assert store.counts() == {}
+
+
+def prioritised(priority, number):
+    delivery = make_delivery("00000000-0000-0000-0000-%012d" % number)
+    delivery.priority = priority
+    return delivery
+
+
+def test_waiting_priorities_are_served_by_weight():
+    deliveries = PriorityDeliveryQueue()
+    for number in range(12):
+        for priority in (PRIORITY_LOW, PRIORITY_NORMAL, PRIORITY_HIGH):
+            deliveries.put(prioritised(priority, number))
+
+    served = [deliveries.get() for _ in range(12)]
+    assert Counter(delivery.priority for delivery in served) == {
+        PRIORITY_HIGH: 8,
+        PRIORITY_NORMAL: 3,
+        PRIORITY_LOW: 1,
+    }
+    # In order within a priority
+    normal = [
+        delivery.id for delivery in served if delivery.priority == PRIORITY_NORMAL
+    ]
+    assert normal == sorted(normal)
+
+
+def test_lone_priority_is_not_held_back_by_its_weight():
+    deliveries = PriorityDeliveryQueue()
+    for number in range(3):
+        deliveries.put(prioritised(PRIORITY_LOW, number))
+    deliveries.put(prioritised(PRIORITY_HIGH, 3))
+
+    assert [deliveries.get().priority for _ in range(4)] == [PRIORITY_HIGH] + [
+        PRIORITY_LOW
+    ] * 3
+
+
+def test_less_urgent_priorities_leave_their_reserve_free():
+    deliveries = PriorityDeliveryQueue(maxsize=20)
+    for number in range(16):
+        deliveries.put_nowait(prioritised(PRIORITY_LOW, number))
+    with pytest.raises(queue.Full):
+        deliveries.put_nowait(prioritised(PRIORITY_LOW, 16))
+    assert deliveries.full(PRIORITY_LOW) and not deliveries.full(PRIORITY_NORMAL)
+
+    for number in range(3):
+        deliveries.put_nowait(prioritised(PRIORITY_NORMAL, number))
+    with pytest.raises(queue.Full):
+        deliveries.put_nowait(prioritised(PRIORITY_NORMAL, 3))
+
+    deliveries.put_nowait(prioritised(PRIORITY_HIGH, 0))
+    assert deliveries.full(PRIORITY_HIGH)
+    assert deliveries.depths() == {
+        PRIORITY_HIGH: 1,
+        PRIORITY_NORMAL: 3,
+        PRIORITY_LOW: 16,
+    }
+
+
+def test_unclassified_deliveries_are_queued_as_normal():
+    deliveries = PriorityDeliveryQueue(maxsize=20)
+    for number in range(19):
+        deliveries.put_nowait(make_delivery("00000000-0000-0000-0000-%012d" % number))
+    with pytest.raises(queue.Full):
+        deliveries.put_nowait(make_delivery())
+    assert deliveries.depths() == {PRIORITY_NORMAL: 19}
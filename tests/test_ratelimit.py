@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from ghasreview.ratelimit import (
+    PRIORITY_CRITICAL,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    RateLimitDeferred,
+    RateLimitScheduler,
+    resourceFor,
+)
+
+
+class FakeResponse(object):
+    def __init__(
+        self, remaining, limit=5000, resource=None, status_code=200, reset_in=3600
+    ):
+        self.status_code = status_code
+        self.text = ""
+        self.headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(time.time() + reset_in)),
+        }
+        if resource:
+            self.headers["X-RateLimit-Resource"] = resource
+
+
+def test_resource_of_url():
+    assert resourceFor("https://api.github.com/graphql") == "graphql"
+    assert resourceFor("https://github.example.com/api/graphql") == "graphql"
+    assert (
+        resourceFor("https://api.github.com/repos/octo/app/issues/1/comments") == "core"
+    )
+
+
+def test_budgets_are_kept_per_resource():
+    scheduler = RateLimitScheduler()
+    scheduler.update(1, FakeResponse(4000, resource="core"))
+    scheduler.update(1, FakeResponse(0, resource="graphql"), resource="graphql")
+
+    budgets = scheduler.budgets()["1"]
+    assert budgets["core"]["remaining"] == 4000
+    assert budgets["graphql"]["remaining"] == 0
+
+
+def test_resource_header_wins_over_the_requested_resource():
+    scheduler = RateLimitScheduler()
+    scheduler.update(1, FakeResponse(10, resource="search"))
+    assert set(scheduler.budgets()["1"]) == {"search"}
+
+
+def test_exhausted_graphql_budget_does_not_hold_back_rest_calls():
+    scheduler = RateLimitScheduler()
+    scheduler.update(1, FakeResponse(4000, resource="core"))
+    scheduler.update(1, FakeResponse(0, resource="graphql"), resource="graphql")
+
+    assert scheduler.tryAcquire(1, PRIORITY_CRITICAL, "core") == 0
+    assert scheduler.tryAcquire(1, PRIORITY_CRITICAL, "graphql") > 0
+
+
+def test_low_priority_call_is_deferred_instead_of_waiting():
+    scheduler = RateLimitScheduler(defer_after=5)
+    # Below the reserve of low priority calls (20%), they wait for the reset
+    scheduler.update(1, FakeResponse(900))
+
+    started = time.monotonic()
+    with pytest.raises(RateLimitDeferred) as error:
+        scheduler.acquire(1, PRIORITY_LOW)
+    assert time.monotonic() - started < 1
+    assert error.value.retry_after > 3000
+    assert scheduler.budgets()["1"]["core"]["waiting"] == 0
+
+    # More urgent calls still have their part of the budget
+    assert scheduler.tryAcquire(1, PRIORITY_NORMAL) == 0
+
+
+def test_short_waits_are_not_deferred():
+    scheduler = RateLimitScheduler(defer_after=5)
+    scheduler.update(1, FakeResponse(900, reset_in=1))
+
+    scheduler.acquire(1, PRIORITY_LOW)
@@ -0,0 +1,73 @@
+import threading
+
+from ghasreview.reopen import ReopenEngine
+from tests.helpers import wait_for
+
+
+class FakeResponse(object):
+    status_code = 200
+
+
+class FakeClient(object):
+    """Client recording the threads re-opening, holds the first re-open until released"""
+
+    def __init__(self):
+        self.reopened = []
+        self.threads = set()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def getInstallationId(self):
+        return 1
+
+    def sendReOpenAlert(self, owner, repo, type, alert_id):
+        self.threads.add(threading.current_thread().name)
+        self.started.set()
+        self.release.wait(5)
+        self.reopened.append(alert_id)
+        return FakeResponse()
+
+
+def test_lone_reopen_is_sent_at_once_on_the_calling_thread():
+    engine = ReopenEngine()
+    client = FakeClient()
+
+    future = engine.submit(client, "octo", "app", "dependabot", 1)
+    assert future.done()
+    assert future.result().status_code == 200
+    assert client.threads == {threading.current_thread().name}
+    assert engine.results[-1]["alerts"] == 1
+
+
+def test_reopens_arriving_while_one_is_in_flight_are_batched():
+    engine = ReopenEngine()
+    client = FakeClient()
+    client.release.clear()
+
+    first = threading.Thread(
+        target=engine.submit, args=(client, "octo", "app", "dependabot", 1)
+    )
+    first.start()
+    assert client.started.wait(5)
+
+    futures = [
+        engine.submit(client, "octo", "app", "dependabot", alert_id)
+        for alert_id in (2, 3, 4)
+    ]
+    assert engine.pending() == 3
+    # Another repository is not held back by the batch in flight
+    assert engine.submit(client.__class__(), "octo", "other", "dependabot", 5).done()
+
+    client.release.set()
+    first.join(5)
+    for future in futures:
+        assert future.result(5).status_code == 200
+    assert wait_for(lambda: engine.pending() == 0 and len(engine.results) == 3)
+
+    assert sorted(client.reopened) == [1, 2, 3, 4]
+    assert [
+        result["alerts"]
+        for result in engine.results
+        if result["repository"] == "octo/app"
+    ] == [1, 3]
@@ -0,0 +1,160 @@
+import time
+
+import pytest
+import requests
+
+from ghasreview.client import Client
+from ghasreview.retry import CircuitBreaker, CircuitOpenError
+
+RESET_TIMEOUT = 0.05
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = ""
+
+
+class FakeSession(object):
+    """Session answering with the queued results, an exception is raised instead of returned"""
+
+    base_url = "https://api.example.com"
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def request(self, method, url, json=None, headers=None):
+        self.calls += 1
+        result = self.results.pop(0) if self.results else FakeResponse()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeInstallation(object):
+    def __init__(self, session):
+        self.session = session
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker("api.example.com", threshold=2, reset_timeout=RESET_TIMEOUT)
+
+
+@pytest.fixture
+def client_retries():
+    Client.configureRetries(
+        retries=0, circuit_threshold=2, circuit_reset_timeout=RESET_TIMEOUT
+    )
+    yield
+    Client.configureRetries()
+
+
+def test_breaker_opens_after_threshold(breaker):
+    assert breaker.before() is False
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+
+def test_breaker_half_open_lets_one_trial_through(breaker):
+    breaker.failure()
+    breaker.failure()
+    time.sleep(RESET_TIMEOUT)
+
+    assert breaker.state == "half-open"
+    assert breaker.before() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+
+def test_breaker_trial_success_closes(breaker):
+    breaker.failure()
+    breaker.failure()
+    time.sleep(RESET_TIMEOUT)
+
+    assert breaker.before() is True
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.before() is False
+
+
+def test_breaker_trial_failure_reopens(breaker):
+    breaker.failure()
+    breaker.failure()
+    time.sleep(RESET_TIMEOUT)
+
+    assert breaker.before() is True
+    breaker.failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+
+
+def test_breaker_released_trial_lets_next_call_try(breaker):
+    breaker.failure()
+    breaker.failure()
+    time.sleep(RESET_TIMEOUT)
+
+    assert breaker.before() is True
+    breaker.release()
+    assert breaker.state == "half-open"
+    assert breaker.before() is True
+
+
+def test_call_api_trial_with_unexpected_error_does_not_block_the_host(client_retries):
+    session = FakeSession(
+        requests.ConnectionError("down"),
+        requests.ConnectionError("down"),
+        requests.exceptions.ChunkedEncodingError("truncated"),
+    )
+    client = Client(FakeInstallation(session), installation_id=1)
+    url = f"{session.base_url}/orgs/octo/teams/sec"
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.callApi("GET", url)
+    with pytest.raises(CircuitOpenError):
+        client.callApi("GET", url)
+
+    time.sleep(RESET_TIMEOUT)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.callApi("GET", url)
+    assert Client.getCircuitBreaker(url).state == "open"
+
+    # The host recovered, the next trial closes the circuit again
+    time.sleep(RESET_TIMEOUT)
+    assert client.callApi("GET", url).status_code == 200
+    assert Client.getCircuitBreaker(url).state == "closed"
+    assert session.calls == 4
+
+
+def test_call_api_trial_interrupted_before_sending_is_released(
+    client_retries, monkeypatch
+):
+    session = FakeSession(
+        requests.ConnectionError("down"), requests.ConnectionError("down")
+    )
+    client = Client(FakeInstallation(session), installation_id=1)
+    url = f"{session.base_url}/orgs/octo/teams/sec"
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.callApi("GET", url)
+    time.sleep(RESET_TIMEOUT)
+
+    def interrupted(*args):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(Client.scheduler, "acquire", interrupted)
+    with pytest.raises(RuntimeError):
+        client.callApi("GET", url)
+    monkeypatch.undo()
+
+    assert Client.getCircuitBreaker(url).state == "half-open"
+    assert client.callApi("GET", url).status_code == 200
+    assert Client.getCircuitBreaker(url).state == "closed"
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from ghasreview.flask_githubapp import store as store_module
+from ghasreview.flask_githubapp.store import DeliveryStore, process_token
+from tests.helpers import make_delivery
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DeliveryStore(str(tmp_path / "deliveries.db"))
+
+
+def claim(store, delivery, claimed_by):
+    with sqlite3.connect(store.path) as connection:
+        connection.execute(
+            "UPDATE deliveries SET claimed_by = ? WHERE id = ?",
+            (claimed_by, delivery.store_id),
+        )
+
+
+def test_own_deliveries_are_not_recovered(store):
+    store.append(make_delivery())
+    assert store.recover() == []
+
+
+def test_deliveries_of_a_restarted_process_with_the_same_pid_are_recovered(
+    store, monkeypatch
+):
+    # A worker of the previous container had the PID of this process
+    monkeypatch.setattr(
+        store_module, "_token", (os.getpid(), "%d:previous-boot:1" % os.getpid())
+    )
+    stored = store.append(make_delivery())
+    monkeypatch.setattr(store_module, "_token", (None, None))
+
+    recovered = store.recover()
+    assert [d.store_id for d in recovered] == [stored.store_id]
+    assert recovered[0].id == stored.id
+    # Claimed by this process now
+    assert store.recover() == []
+
+
+def test_deliveries_of_a_running_process_are_not_recovered(store):
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys; from ghasreview.flask_githubapp.store import process_token; "
+            "print(process_token(), flush=True); sys.stdin.read()",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        token = process.stdout.readline().strip()
+        assert token and token != process_token()
+        stored = store.append(make_delivery())
+        claim(store, stored, token)
+        assert store.recover() == []
+    finally:
+        process.stdin.close()
+        process.wait(5)
+
+    assert [d.store_id for d in store.recover()] == [stored.store_id]
+
+
+def test_deliveries_claimed_by_a_previous_version_are_recovered(store):
+    stored = store.append(make_delivery())
+    # Plain PIDs, here one that is alive
+    claim(store, stored, os.getpid())
+    assert [d.store_id for d in store.recover()] == [stored.store_id]
+
+
+def test_failed_deliveries_are_not_recovered(store):
+    stored = store.append(make_delivery())
+    stored.attempts = 3
+    store.dead_letter(stored)
+    store.flush()
+    assert store.recover() == []
+    assert store.counts() == {"failed": 1}
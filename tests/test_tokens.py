@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from ghasreview.client import Client
+from ghasreview.flask_githubapp.tokens import InstallationToken, InstallationTokenCache
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = ""
+
+
+class FakeAuth(object):
+    def __init__(self, token):
+        self.token = token
+
+
+class FakeSession(object):
+    """Session answering 401 while authenticated with a rejected token"""
+
+    base_url = "https://api.example.com"
+
+    def __init__(self, token, rejected):
+        self.auth = FakeAuth(token)
+        self.rejected = set(rejected)
+        self.sent_with = []
+
+    def app_installation_token_auth(self, data):
+        self.auth = FakeAuth(data["token"])
+
+    def request(self, method, url, json=None, headers=None):
+        self.sent_with.append(self.auth.token)
+        return FakeResponse(401 if self.auth.token in self.rejected else 200)
+
+
+class FakeInstallation(object):
+    def __init__(self, session):
+        self.session = session
+
+
+def make_token(name):
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+    return InstallationToken(name, expires_at.isoformat())
+
+
+class Minter(object):
+    def __init__(self):
+        self.minted = 0
+
+    def __call__(self):
+        self.minted += 1
+        return make_token("token-%d" % self.minted)
+
+
+@pytest.fixture
+def renewal():
+    cache = InstallationTokenCache()
+    minter = Minter()
+    Client.configureTokenRenewal(
+        lambda installation_id, rejected: cache.renew(installation_id, rejected, minter)
+    )
+    yield cache, minter
+    Client.configureTokenRenewal(None)
+
+
+def test_renew_replaces_the_rejected_token():
+    cache = InstallationTokenCache()
+    minter = Minter()
+    assert cache.get(1, minter).token == "token-1"
+
+    assert cache.renew(1, "token-1", minter).token == "token-2"
+    assert cache.get(1, minter).token == "token-2"
+
+
+def test_renew_of_an_already_replaced_token_does_not_mint_again():
+    cache = InstallationTokenCache()
+    minter = Minter()
+    cache.get(1, minter)
+    cache.renew(1, "token-1", minter)
+
+    # Another request failed with the same token meanwhile
+    assert cache.renew(1, "token-1", minter).token == "token-2"
+    assert minter.minted == 2
+
+
+def test_call_is_sent_again_with_a_new_token_after_401(renewal):
+    cache, minter = renewal
+    revoked = cache.get(1, minter).token
+    session = FakeSession(revoked, rejected=[revoked])
+    client = Client(FakeInstallation(session), installation_id=1)
+
+    response = client.callApi("GET", f"{session.base_url}/orgs/octo/teams/sec")
+    assert response.status_code == 200
+    assert session.sent_with == ["token-1", "token-2"]
+    assert cache.get(1, minter).token == "token-2"
+
+
+def test_call_is_only_sent_again_once(renewal):
+    cache, minter = renewal
+    session = FakeSession("token-0", rejected=["token-0", "token-1"])
+    client = Client(FakeInstallation(session), installation_id=1)
+
+    response = client.callApi(
+        "PATCH", f"{session.base_url}/repos/octo/app/dependabot/alerts/1"
+    )
+    assert response.status_code == 401
+    assert session.sent_with == ["token-0", "token-1"]
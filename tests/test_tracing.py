@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from ghasreview.flask_githubapp import tracing
+from ghasreview.flask_githubapp.tracing import (
+    NON_RECORDING_SPAN,
+    SPAN_KIND_SERVER,
+    STATUS_ERROR,
+    FileSpanExporter,
+    InMemorySpanExporter,
+    Tracer,
+    traced,
+)
+from tests.helpers import post_hook
+
+DELIVERY_ID = "00000000-0000-0000-0000-0000000000aa"
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(tracing.tracer, "exporter", exporter)
+    return exporter
+
+
+@traced()
+def lookup_team():
+    return tracing.current_span()
+
+
+def test_spans_of_a_delivery_share_its_trace(exporter):
+    with tracing.tracer.start_span(
+        "webhook", trace_id=tracing.trace_id_for(DELIVERY_ID)
+    ) as root:
+        child = lookup_team()
+
+    assert [span.name for span in exporter.get_finished_spans()] == [
+        "lookup_team",
+        "webhook",
+    ]
+    assert root.trace_id == child.trace_id == "000000000000000000000000000000aa"
+    assert child.parent_id == root.span_id
+    assert root.parent_id is None
+
+
+def test_traced_functions_outside_of_a_trace_record_nothing(exporter):
+    assert lookup_team() is NON_RECORDING_SPAN
+    assert exporter.get_finished_spans() == []
+
+
+def test_disabled_tracer_hands_out_a_non_recording_span():
+    with Tracer().start_span("webhook") as span:
+        span.set_attribute("github.event", "push")
+    assert span is NON_RECORDING_SPAN
+
+
+def test_exception_is_recorded_and_sets_the_error_status(exporter):
+    with pytest.raises(RuntimeError):
+        with tracing.tracer.start_span("webhook"):
+            raise RuntimeError("boom")
+
+    [span] = exporter.get_finished_spans()
+    assert (span.status, span.status_message) == (STATUS_ERROR, "boom")
+    assert span.events[0]["attributes"] == {
+        "exception.type": "RuntimeError",
+        "exception.message": "boom",
+    }
+
+
+def test_failing_exporter_does_not_fail_the_traced_code():
+    class Broken(InMemorySpanExporter):
+        def export(self, spans, resource):
+            raise OSError("disk full")
+
+    with Tracer(Broken()).start_span("webhook") as span:
+        pass
+    assert span.end_time is not None
+
+
+def test_file_exporter_appends_otlp_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(FileSpanExporter(str(path)), service_name="ghasreview")
+    attributes = {
+        "flag": True,
+        "count": 2,
+        "ratio": 0.5,
+        "name": "octo",
+        "missing": None,
+    }
+    with tracer.start_span(
+        "webhook", kind=SPAN_KIND_SERVER, attributes=attributes
+    ) as root:
+        with tracer.start_span("callApi"):
+            pass
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    resource = {
+        item["key"]: item["value"] for item in lines[0]["resource"]["attributes"]
+    }
+    assert resource["service.name"] == {"stringValue": "ghasreview"}
+
+    child, parent = (line["scopeSpans"][0]["spans"][0] for line in lines)
+    assert child["parentSpanId"] == parent["spanId"] == root.span_id
+    assert parent["kind"] == SPAN_KIND_SERVER
+    assert "parentSpanId" not in parent
+    assert int(parent["endTimeUnixNano"]) >= int(parent["startTimeUnixNano"])
+    assert {item["key"]: item["value"] for item in parent["attributes"]} == {
+        "flag": {"boolValue": True},
+        "count": {"intValue": "2"},
+        "ratio": {"doubleValue": 0.5},
+        "name": {"stringValue": "octo"},
+    }
+
+
+def test_webhook_is_traced_from_receipt_to_its_hook(make_github_app, monkeypatch):
+    exporter = InMemorySpanExporter()
+    monkeypatch.setattr(tracing.tracer, "exporter", None)
+    app, github_app = make_github_app(GITHUBAPP_TRACE_EXPORTER=exporter)
+
+    @github_app.on("code_scanning_alert.created")
+    def hook():
+        lookup_team()
+
+    with app.test_client() as client:
+        assert post_hook(client, delivery_id=DELIVERY_ID).status_code == 200
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    root = spans["webhook code_scanning_alert.created"]
+    assert root.trace_id == tracing.trace_id_for(DELIVERY_ID)
+    assert root.attributes["github.delivery"] == DELIVERY_ID
+    assert root.attributes["github.installation.id"] == 1
+    # Not part of the payload
+    assert "github.repository" not in root.attributes
+    assert spans["lookup_team"].trace_id == root.trace_id